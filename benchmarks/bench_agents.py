@@ -0,0 +1,219 @@
+"""
+离线智能体基准测试: 在本地桩服务器与桩工具上运行 ReActAgent / ReflectionAgent / PlanAndSolveAgent，
+记录每次运行的步数(LLM 调用次数)、总耗时、LLM 耗时、工具耗时、本地开销以及发送的提示词字节数，
+结果写入 JSON 文件，并可与之前的结果对比以发现性能回退。
+
+并行模式下 LLM 与工具耗时是各次调用耗时之和，可能超过总耗时，此时本地开销会显示为负数。
+桩模型默认总是给出格式正确的工具调用；--malformed-rate 让它按给定概率写错格式(文本模式缺少方括号、
+函数调用模式参数 JSON 不完整)，两种模式的出错概率相同，报告中会注明该设置。
+
+运行方式(在仓库根目录):
+    python -m benchmarks.bench_agents --output bench_agents.json
+    python -m benchmarks.bench_agents --react-mode messages --parallel --baseline bench_agents.json
+    python -m benchmarks.bench_agents --agents react --react-mode function_calling --malformed-rate 0.2
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import threading
+import time
+from typing import Any, Dict, List
+
+from benchmarks.stub_llm_server import StubLLMServer
+from chapter4.LLM_client import HelloAgentsLLM
+from chapter4.plan_and_solve import PlanAndSolveAgent
+from chapter4.React import ReActAgent
+from chapter4.Reflection import ReflectionAgent
+from chapter4.ToolExecutor import ToolExecutor
+
+QUESTIONS = {
+    "react": [
+        "(2^1024 + 2^1000 - 2^995) × (2^2048 - 1) ÷ 2^500 的精确整数结果是多少？",
+        "华为最新的手机是哪一款？它的主要卖点是什么？",
+        "1 到 100 之间所有素数的和是多少？",
+    ],
+    "plan_and_solve": [
+        "一个水果店周一卖出了15个苹果。周二卖出的苹果数量是周一的两倍。周三卖出的数量比周二少了5个。请问这三天总共卖出了多少个苹果？",
+        "小明有 20 元，买了 3 支 4 元的笔和 2 本 3 元的本子，还剩多少钱？",
+    ],
+    "reflection": [
+        "编写一个Python函数，找出1到n之间所有的素数 (prime numbers)。",
+    ],
+}
+
+
+class Timer:
+    """线程安全的耗时与次数累加器。"""
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.prompt_bytes = 0
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float, prompt_bytes: int = 0):
+        with self._lock:
+            self.calls += 1
+            self.seconds += seconds
+            self.prompt_bytes += prompt_bytes
+
+
+class InstrumentedLLM:
+    """包装 HelloAgentsLLM，记录每次 think 的耗时与提示词字节数，其余属性透传。"""
+
+    def __init__(self, llm: HelloAgentsLLM, timer: Timer):
+        self._llm = llm
+        self._timer = timer
+
+    def _timed(self, method, messages, *args, extra_bytes: int = 0, **kwargs):
+        # 函数调用模式下 tools 的 JSON Schema 与历史中的结构化调用同样会发送给服务端，一并计入
+        prompt_bytes = extra_bytes + sum(
+            len(((message.get("content") or "") + json.dumps(message.get("tool_calls") or "", ensure_ascii=False))
+                .encode("utf-8"))
+            for message in messages
+        )
+        start = time.perf_counter()
+        try:
+            return method(messages, *args, **kwargs)
+        finally:
+            self._timer.add(time.perf_counter() - start, prompt_bytes)
+
+    def think(self, messages, *args, **kwargs):
+        return self._timed(self._llm.think, messages, *args, **kwargs)
+
+    def think_with_tools(self, messages, tools, *args, **kwargs):
+        return self._timed(self._llm.think_with_tools, messages, tools, *args,
+                           extra_bytes=len(json.dumps(tools, ensure_ascii=False).encode("utf-8")), **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._llm, name)
+
+
+def make_stub_tool(name: str, latency: float, timer: Timer):
+    def tool(tool_input: str) -> str:
+        start = time.perf_counter()
+        time.sleep(latency)
+        timer.add(time.perf_counter() - start)
+        return f"{name} 的桩结果: {tool_input} -> 42"
+    return tool
+
+
+def build_agent(kind: str, llm, tool_timer: Timer, args):
+    if kind == "react":
+        tool_executor = ToolExecutor()
+        tool_executor.register_tool("Search", "一个网页搜索引擎。", make_stub_tool("Search", args.tool_latency, tool_timer))
+        tool_executor.register_tool("Calculator", "精确计算数学表达式。", make_stub_tool("Calculator", args.tool_latency, tool_timer))
+        return ReActAgent(llm, tool_executor, parallel_actions=args.parallel, prompt_mode=args.react_mode,
+                          early_stop=not args.no_early_stop)
+    if kind == "plan_and_solve":
+        return PlanAndSolveAgent(llm, parallel=args.parallel)
+    if kind == "reflection":
+        return ReflectionAgent(llm)
+    raise ValueError(f"未知的智能体类型: {kind}")
+
+
+def run_once(kind: str, question: str, base_llm: HelloAgentsLLM, args) -> Dict[str, Any]:
+    llm_timer, tool_timer = Timer(), Timer()
+    with contextlib.redirect_stdout(io.StringIO()):
+        agent = build_agent(kind, InstrumentedLLM(base_llm, llm_timer), tool_timer, args)
+        agent.run_stats = {}
+        start = time.perf_counter()
+        error = None
+        try:
+            answer = agent.run(question)
+        except Exception as e:
+            answer, error = None, repr(e)
+        wall = time.perf_counter() - start
+    return {
+        "agent": kind,
+        "question": question,
+        "answered": answer is not None,
+        "error": error,
+        "steps": llm_timer.calls,
+        "tool_calls": tool_timer.calls,
+        "wall_s": wall,
+        "llm_s": llm_timer.seconds,
+        "tool_s": tool_timer.seconds,
+        "overhead_s": wall - llm_timer.seconds - tool_timer.seconds,
+        "prompt_bytes": llm_timer.prompt_bytes,
+        "parse_failures": agent.run_stats.get("parse_failures", 0),
+    }
+
+
+def summarize(runs: List[Dict[str, Any]]) -> Dict[str, Dict[str, float]]:
+    summary = {}
+    for kind in sorted({run["agent"] for run in runs}):
+        selected = [run for run in runs if run["agent"] == kind]
+        summary[kind] = {
+            "runs": len(selected),
+            "answered": sum(run["answered"] for run in selected),
+            **{f"mean_{key}": statistics.mean(run[key] for run in selected)
+               for key in ("steps", "wall_s", "llm_s", "tool_s", "overhead_s", "prompt_bytes", "parse_failures")},
+        }
+    return summary
+
+
+def print_summary(summary, baseline=None):
+    print(f"{'智能体':<16} {'步数':>6} {'总耗时s':>9} {'LLM s':>8} {'工具 s':>8} {'开销 s':>8} {'提示词字节':>12} {'解析失败':>8}")
+    for kind, stats in summary.items():
+        print(f"{kind:<16} {stats['mean_steps']:>6.1f} {stats['mean_wall_s']:>9.3f} {stats['mean_llm_s']:>8.3f} "
+              f"{stats['mean_tool_s']:>8.3f} {stats['mean_overhead_s']:>8.3f} {stats['mean_prompt_bytes']:>12.0f} "
+              f"{stats['mean_parse_failures']:>8.2f}")
+        if baseline and kind in baseline:
+            old = baseline[kind]
+            deltas = [f"{key[5:]} {(stats[key] - old[key]) / old[key] * 100:+.1f}%"
+                      for key in ("mean_steps", "mean_wall_s", "mean_prompt_bytes") if old.get(key)]
+            deltas.append(f"平均节省 {old['mean_steps'] - stats['mean_steps']:.2f} 步")
+            print(f"{'':<16} 相对基线: {', '.join(deltas)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="离线智能体基准测试")
+    parser.add_argument("--agents", default="react,plan_and_solve,reflection", help="逗号分隔的智能体类型")
+    parser.add_argument("--repeat", type=int, default=1, help="每个问题重复运行的次数")
+    parser.add_argument("--ttft", type=float, default=0.05, help="桩模型的首 token 延迟(秒)")
+    parser.add_argument("--token-rate", type=float, default=200, help="桩模型每秒推送的 token 数")
+    parser.add_argument("--tool-latency", type=float, default=0.05, help="桩工具每次调用的延迟(秒)")
+    parser.add_argument("--react-mode", choices=["text", "messages", "function_calling"], default="text")
+    parser.add_argument("--parallel", action="store_true", help="ReAct 并行 Action / Plan-and-Solve 依赖图执行")
+    parser.add_argument("--no-early-stop", action="store_true", help="ReAct 不在 Action 完整后提前结束生成")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="桩模型写错工具调用格式的概率(两种模式相同)")
+    parser.add_argument("--output", default="bench_agents.json", help="结果 JSON 文件")
+    parser.add_argument("--baseline", help="用于对比的历史结果 JSON 文件")
+    args = parser.parse_args()
+
+    baseline = None
+    if args.baseline and os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["summary"]
+
+    server = StubLLMServer(ttft=args.ttft, token_rate=args.token_rate, malformed_rate=args.malformed_rate).start()
+    try:
+        llm = HelloAgentsLLM(model="stub", apiKey="stub", baseUrl=server.base_url)
+        runs = []
+        for kind in args.agents.split(","):
+            for question in QUESTIONS[kind]:
+                for _ in range(args.repeat):
+                    runs.append(run_once(kind, question, llm, args))
+    finally:
+        server.stop()
+
+    summary = summarize(runs)
+    if "react" in args.agents.split(","):
+        print(f"ReAct 模式: {args.react_mode}，桩模型工具调用格式错误率: {args.malformed_rate:.0%}")
+    print_summary(summary, baseline)
+    result = {
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+        "summary": summary,
+        "runs": runs,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"\n结果已写入 {args.output}")
+
+
+if __name__ == '__main__':
+    main()
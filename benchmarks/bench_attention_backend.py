@@ -0,0 +1,91 @@
+"""
+MultiHeadAttention 两种后端的 CPU 对比: "math"(显式得分矩阵 + masked_fill(-1e9)) vs. "fused"(F.scaled_dot_product_attention)。
+
+先做正确性检查(填充掩码、因果掩码、两者组合)，再对不同序列长度测量前向耗时与峰值内存增量。
+峰值内存用子进程的 ru_maxrss 测量: 每个 (后端, 长度) 组合在独立进程中运行，互不干扰。
+
+运行方式(在仓库根目录):
+    python -m benchmarks.bench_attention_backend
+"""
+import json
+import resource
+import subprocess
+import sys
+import time
+
+import torch
+
+from chapter3 import MultiHeadAttention
+
+D_MODEL, NUM_HEADS, BATCH = 256, 8, 4
+SEQ_LENGTHS = [128, 512, 1024, 2048]
+REPEATS = 5
+
+
+def build_pair():
+    torch.manual_seed(0)
+    math_attn = MultiHeadAttention(D_MODEL, NUM_HEADS, backend="math").eval()
+    fused_attn = MultiHeadAttention(D_MODEL, NUM_HEADS, backend="fused").eval()
+    fused_attn.load_state_dict(math_attn.state_dict())
+    return math_attn, fused_attn
+
+
+@torch.no_grad()
+def check_correctness():
+    math_attn, fused_attn = build_pair()
+    x = torch.randn(BATCH, 64, D_MODEL)
+    padding = torch.ones(BATCH, 1, 1, 64, dtype=torch.bool)
+    padding[1, ..., 40:] = False
+    cases = {
+        "无掩码": {},
+        "填充掩码": {"mask": padding},
+        "因果": {"is_causal": True},
+        "填充 + 因果": {"mask": padding, "is_causal": True},
+    }
+    for name, kwargs in cases.items():
+        err = (math_attn(x, x, x, **kwargs) - fused_attn(x, x, x, **kwargs)).abs().max().item()
+        print(f"正确性 [{name}] 最大误差: {err:.2e}")
+        assert err < 1e-4, name
+
+
+@torch.no_grad()
+def run_child(backend: str, seq_len: int):
+    """在子进程中运行: 输出一次前向的峰值内存增量(MB)与平均耗时(ms)。"""
+    torch.manual_seed(0)
+    attn = MultiHeadAttention(D_MODEL, NUM_HEADS, backend=backend).eval()
+    x = torch.randn(BATCH, seq_len, D_MODEL)
+    baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    attn(x, x, x, is_causal=True)
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        attn(x, x, x, is_causal=True)
+    elapsed_ms = (time.perf_counter() - start) * 1000 / REPEATS
+    print(json.dumps({"ms": elapsed_ms, "peak_mb": (peak_kb - baseline_kb) / 1024}))
+
+
+def measure(backend: str, seq_len: int) -> dict:
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.bench_attention_backend", "--child", backend, str(seq_len)],
+        check=True, capture_output=True, text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    check_correctness()
+    print(f"\nbatch={BATCH}, d_model={D_MODEL}, heads={NUM_HEADS}, 因果自注意力, 线程数={torch.get_num_threads()}")
+    print(f"{'长度':>6} {'math ms':>10} {'fused ms':>10} {'加速比':>8} {'math 峰值MB':>12} {'fused 峰值MB':>13}")
+    for seq_len in SEQ_LENGTHS:
+        math_result = measure("math", seq_len)
+        fused_result = measure("fused", seq_len)
+        print(f"{seq_len:>6} {math_result['ms']:>10.2f} {fused_result['ms']:>10.2f} "
+              f"{math_result['ms'] / fused_result['ms']:>7.2f}x "
+              f"{math_result['peak_mb']:>12.1f} {fused_result['peak_mb']:>13.1f}")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 4 and sys.argv[1] == "--child":
+        run_child(sys.argv[2], int(sys.argv[3]))
+    else:
+        main()
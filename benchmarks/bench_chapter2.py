@@ -0,0 +1,59 @@
+"""
+chapter2 规则引擎吞吐量基准: 逐条 re.search 的原始循环 vs. 预编译的单次匹配 RuleMatcher。
+
+运行方式(在仓库根目录):
+    python -m benchmarks.bench_chapter2 [语句条数]
+"""
+import random
+import re
+import sys
+import time
+
+import chapter2
+
+SAMPLE_UTTERANCES = [
+    "I need a vacation",
+    "Why don't you ever listen to me?",
+    "Why can't I sleep at night?",
+    "I am tired of everything",
+    "I talked to my mother yesterday about it",
+    "My father never calls me back",
+    "The weather has been terrible lately",
+    "Nothing special happened today, just work",
+]
+
+
+def legacy_respond(user_input, rng):
+    """原始实现: 按顺序对每条规则调用 re.search。"""
+    for pattern, responses in chapter2.rules.items():
+        match = re.search(pattern, user_input, re.IGNORECASE)
+        if match:
+            captured_group = match.group(1) if match.groups() else ''
+            swapped_group = chapter2.swap_pronouns.__wrapped__(captured_group)
+            return rng.choice(responses).format(swapped_group)
+    return rng.choice(chapter2.rules[r'.*'])
+
+
+def timed(label, func, utterances):
+    start = time.perf_counter()
+    responses = func(utterances)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {elapsed * 1000:9.1f} ms  {len(utterances) / elapsed:12.0f} 条/秒")
+    return responses, elapsed
+
+
+def main(n: int = 200000):
+    rng = random.Random(0)
+    utterances = [rng.choice(SAMPLE_UTTERANCES) for _ in range(n)]
+    print(f"共 {n} 条语句，{len(chapter2.rules)} 条规则")
+
+    legacy_rng = random.Random(1)
+    legacy, legacy_time = timed("逐条 re.search (原始循环)", lambda us: [legacy_respond(u, legacy_rng) for u in us], utterances)
+    batch, batch_time = timed("RuleMatcher + respond_batch", lambda us: chapter2.respond_batch(us, random.Random(1)), utterances)
+
+    # 两种实现使用相同的随机数序列，输出必须完全一致
+    print(f"结果一致: {legacy == batch}，加速比: {legacy_time / batch_time:.2f}x")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
@@ -0,0 +1,137 @@
+"""
+激活检查点的训练步基准: Transformer 在 checkpointing = none / layer / stack 三种模式下，
+一次训练步(前向 + 交叉熵 + 反向 + SGD 更新)的峰值内存与耗时。
+
+- 峰值内存: 每个 (模式, 长度) 组合在独立子进程中运行，用 ru_maxrss 相对模型构建完成后的增量衡量；
+- 保存的激活: 用 saved_tensors_hooks 统计前向过程中为反向传播保存的张量字节数(不含参数)；
+- 同时检查三种模式的损失和梯度完全一致(dropout 的随机状态在重新计算时会被恢复)。
+
+运行方式(在仓库根目录):
+    python -m benchmarks.bench_checkpointing
+    python -m benchmarks.bench_checkpointing --seq-lengths 128,512 --batch-size 8 --attn-backend fused
+"""
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import time
+
+import torch
+import torch.nn.functional as F
+
+from chapter3 import Transformer
+
+VOCAB, D_MODEL, NUM_HEADS, D_FF, NUM_LAYERS = 1000, 256, 8, 1024, 4
+MODES = ("none", "layer", "stack")
+
+
+def build(mode: str, attn_backend: str):
+    torch.manual_seed(0)
+    return Transformer(VOCAB, VOCAB, D_MODEL, NUM_HEADS, NUM_LAYERS, D_FF, dropout=0.1,
+                       attn_backend=attn_backend, checkpointing=mode).train()
+
+
+def make_batch(batch_size: int, seq_len: int):
+    generator = torch.Generator().manual_seed(1)
+    src = torch.randint(3, VOCAB, (batch_size, seq_len), generator=generator)
+    tgt = torch.randint(3, VOCAB, (batch_size, seq_len + 1), generator=generator)
+    return src, tgt[:, :-1], tgt[:, 1:]
+
+
+def train_step(model, optimizer, src, tgt_in, tgt_out):
+    optimizer.zero_grad(set_to_none=True)
+    logits = model(src, tgt_in)
+    loss = F.cross_entropy(logits.reshape(-1, logits.size(-1)), tgt_out.reshape(-1))
+    loss.backward()
+    optimizer.step()
+    return loss.item()
+
+
+def saved_activation_bytes(model, src, tgt_in) -> int:
+    """前向时为反向传播保存的张量总字节数，参数本身以及同一块存储的重复引用不计入。"""
+    params = {p.data_ptr() for p in model.parameters()}
+    seen = set()
+    total = 0
+
+    def pack(tensor):
+        nonlocal total
+        ptr = tensor.untyped_storage().data_ptr()
+        if ptr not in params and ptr not in seen:
+            seen.add(ptr)
+            total += tensor.untyped_storage().nbytes()
+        return tensor
+
+    with torch.autograd.graph.saved_tensors_hooks(pack, lambda tensor: tensor):
+        model(src, tgt_in)
+    return total
+
+
+def check_gradients(attn_backend: str):
+    src, tgt_in, tgt_out = make_batch(4, 32)
+    reference = None
+    for mode in MODES:
+        model = build(mode, attn_backend)
+        torch.manual_seed(2)
+        logits = model(src, tgt_in)
+        F.cross_entropy(logits.reshape(-1, VOCAB), tgt_out.reshape(-1)).backward()
+        grads = torch.cat([p.grad.flatten() for p in model.parameters() if p.grad is not None])
+        if reference is None:
+            reference = grads
+        err = (grads - reference).abs().max().item()
+        print(f"梯度一致性 [{mode}] 与 none 的最大误差: {err:.2e}")
+        assert err < 1e-5, mode
+
+
+def run_child(mode: str, seq_len: int, batch_size: int, attn_backend: str, steps: int):
+    """在子进程中运行: 输出峰值内存增量(MB)、保存的激活(MB)与平均每步耗时(ms)。"""
+    model = build(mode, attn_backend)
+    optimizer = torch.optim.SGD(model.parameters(), lr=0.01)
+    src, tgt_in, tgt_out = make_batch(batch_size, seq_len)
+    baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    train_step(model, optimizer, src, tgt_in, tgt_out)
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    saved = saved_activation_bytes(model, src, tgt_in)
+    start = time.perf_counter()
+    for _ in range(steps):
+        train_step(model, optimizer, src, tgt_in, tgt_out)
+    elapsed_ms = (time.perf_counter() - start) * 1000 / steps
+    print(json.dumps({"ms": elapsed_ms, "peak_mb": (peak_kb - baseline_kb) / 1024, "saved_mb": saved / 2**20}))
+
+
+def measure(mode: str, seq_len: int, args) -> dict:
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.bench_checkpointing", "--child", mode, "--seq-lengths", str(seq_len),
+         "--batch-size", str(args.batch_size), "--attn-backend", args.attn_backend, "--steps", str(args.steps)],
+        check=True, capture_output=True, text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="激活检查点的训练步基准")
+    parser.add_argument("--seq-lengths", default="128,256")
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--attn-backend", choices=["math", "fused"], default="math")
+    parser.add_argument("--steps", type=int, default=3, help="计时的训练步数")
+    parser.add_argument("--child", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        run_child(args.child, int(args.seq_lengths), args.batch_size, args.attn_backend, args.steps)
+        return
+
+    check_gradients(args.attn_backend)
+    print(f"\n{NUM_LAYERS}+{NUM_LAYERS} 层 Transformer, d_model={D_MODEL}, d_ff={D_FF}, 批大小={args.batch_size}, "
+          f"注意力后端={args.attn_backend}, 线程数={torch.get_num_threads()}")
+    print(f"{'长度':>6} {'模式':>6} {'峰值内存MB':>10} {'保存激活MB':>10} {'每步 ms':>10} {'相对 none 耗时':>14}")
+    for seq_len in [int(length) for length in args.seq_lengths.split(",")]:
+        baseline_ms = None
+        for mode in MODES:
+            result = measure(mode, seq_len, args)
+            baseline_ms = baseline_ms or result["ms"]
+            print(f"{seq_len:>6} {mode:>6} {result['peak_mb']:>10.1f} {result['saved_mb']:>10.1f} "
+                  f"{result['ms']:>10.1f} {result['ms'] / baseline_ms:>13.2f}x")
+
+
+if __name__ == '__main__':
+    main()
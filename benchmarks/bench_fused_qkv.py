@@ -0,0 +1,83 @@
+"""
+融合 QKV 投影基准: EncoderLayer 前向耗时随序列长度的变化，对比 Q/K/V 分别投影与一次融合投影。
+同时单独给出 Q/K/V 投影这一步的耗时。
+
+基线使用同一份权重，但像融合之前那样做三次 d_model -> d_model 的矩阵乘法；
+同时检查把融合权重拆成旧格式(Wq/Wk/Wv)的 state_dict 后，仍然可以加载并得到相同的输出。
+
+运行方式(在仓库根目录):
+    python -m benchmarks.bench_fused_qkv
+    python -m benchmarks.bench_fused_qkv --attn-backend fused --batch-size 16
+"""
+import argparse
+import time
+
+import torch
+
+from chapter3 import EncoderLayer, MultiHeadAttention
+
+D_MODEL, NUM_HEADS, D_FF = 512, 8, 2048
+SEQ_LENGTHS = [16, 64, 256, 512]
+
+
+class SeparateProjectionAttention(MultiHeadAttention):
+    """融合之前的做法: Q、K、V 各做一次 d_model -> d_model 的投影。"""
+
+    def project(self, query, key, value, need_kv=True):
+        d, heads = self.d_model, (self.num_heads, self.d_k)
+        return tuple(self._linear_rows(self.Wqkv, x, i * d, (i + 1) * d).unflatten(-1, heads)
+                     for i, x in enumerate((query, key, value)))
+
+
+def legacy_state_dict(layer: EncoderLayer):
+    """把融合权重拆回旧版本的 Wq/Wk/Wv 格式。"""
+    state = layer.state_dict()
+    for name, weight in zip(("Wq", "Wk", "Wv"), state.pop("self_attn.Wqkv.weight").chunk(3, dim=0)):
+        state[f"self_attn.{name}.weight"] = weight.clone()
+    return state
+
+
+def timeit(fn, repeat):
+    fn()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+@torch.no_grad()
+def main():
+    parser = argparse.ArgumentParser(description="融合 QKV 投影的 EncoderLayer 前向基准")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--attn-backend", choices=["math", "fused"], default="math")
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+    fused = EncoderLayer(D_MODEL, NUM_HEADS, D_FF, 0.0, args.attn_backend).eval()
+    separate = EncoderLayer(D_MODEL, NUM_HEADS, D_FF, 0.0, args.attn_backend).eval()
+    separate.self_attn = SeparateProjectionAttention(D_MODEL, NUM_HEADS, args.attn_backend)
+    separate.load_state_dict(fused.state_dict())
+    legacy = EncoderLayer(D_MODEL, NUM_HEADS, D_FF, 0.0, args.attn_backend).eval()
+    legacy.load_state_dict(legacy_state_dict(fused))
+
+    print(f"EncoderLayer, d_model={D_MODEL}, 批大小={args.batch_size}, 注意力后端={args.attn_backend}, "
+          f"线程数={torch.get_num_threads()}")
+    print(f"{'长度':>6} {'QKV投影 分别 ms':>15} {'QKV投影 融合 ms':>15} {'层前向 分别 ms':>14} {'层前向 融合 ms':>14} "
+          f"{'层加速比':>8} {'最大误差':>10} {'旧权重误差':>10}")
+    for length in SEQ_LENGTHS:
+        x = torch.randn(args.batch_size, length, D_MODEL)
+        separate_proj_ms = timeit(lambda: separate.self_attn.project(x, x, x), args.repeat)
+        fused_proj_ms = timeit(lambda: fused.self_attn.project(x, x, x), args.repeat)
+        separate_ms = timeit(lambda: separate(x, None), args.repeat)
+        fused_ms = timeit(lambda: fused(x, None), args.repeat)
+        expected = fused(x, None)
+        err = (separate(x, None) - expected).abs().max().item()
+        legacy_err = (legacy(x, None) - expected).abs().max().item()
+        print(f"{length:>6} {separate_proj_ms:>15.2f} {fused_proj_ms:>15.2f} {separate_ms:>14.2f} {fused_ms:>14.2f} "
+              f"{separate_ms / fused_ms:>7.2f}x "
+              f"{err:>10.2e} {legacy_err:>10.2e}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+各入口模块的导入耗时基准: 在全新的子进程中运行 `python -X importtime -c "import <模块>"`，
+解析标准错误中的逐模块耗时，报告入口模块的累计导入耗时以及其中最重的几个依赖。
+
+每个入口重复测量若干次取中位数；结果可写入 JSON，并与之前的结果对比得到每个入口的耗时变化。
+
+运行方式(在仓库根目录):
+    python -m benchmarks.bench_import_time --output bench_import_time.json
+    python -m benchmarks.bench_import_time --baseline bench_import_time.json
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+ENTRY_POINTS = ["tools", "chapter4.ToolExecutor", "chapter1", "chapter4.LLM_client", "chapter4.React",
+                "chapter4.batch_runner", "chapter2"]
+LINE_RE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int, int, int]]:
+    """解析 -X importtime 的输出，返回 (模块名, 自身耗时us, 累计耗时us, 缩进层级) 列表。"""
+    rows = []
+    for line in stderr.splitlines():
+        match = LINE_RE.match(line)
+        if match:
+            rows.append((match.group(4), int(match.group(1)), int(match.group(2)), len(match.group(3)) // 2))
+    return rows
+
+
+def measure(module: str) -> Dict[str, object]:
+    """在子进程中导入一次 module，返回累计耗时(ms)、导入的模块数与按累计耗时排序的直接依赖。"""
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                               capture_output=True, text=True, cwd=os.getcwd())
+    if completed.returncode != 0:
+        error = completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else "导入失败"
+        return {"error": error}
+    rows = parse_importtime(completed.stderr)
+    # 解释器启动阶段(到 site 为止)导入的模块不计入；输出是后序的，子模块出现在父模块之前且缩进更深
+    start = max((i + 1 for i, row in enumerate(rows) if row[0] == "site" and row[3] == 0), default=0)
+    rows = rows[start:]
+    total_us = sum(cumulative for _, _, cumulative, depth in rows if depth == 0)
+    top = sorted(((name, cumulative) for name, _, cumulative, depth in rows if depth == 1),
+                 key=lambda item: -item[1])[:5]
+    return {"total_ms": total_us / 1000, "modules": len(rows),
+            "top": [(name, cumulative / 1000) for name, cumulative in top]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="入口模块导入耗时基准")
+    parser.add_argument("--modules", default=",".join(ENTRY_POINTS), help="逗号分隔的入口模块")
+    parser.add_argument("--repeat", type=int, default=5, help="每个入口测量的次数(取中位数)")
+    parser.add_argument("--output", help="结果 JSON 文件")
+    parser.add_argument("--baseline", help="用于对比的历史结果 JSON 文件")
+    args = parser.parse_args()
+
+    baseline = {}
+    if args.baseline and os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    results = {}
+    print(f"{'入口模块':<24} {'导入耗时ms':>10} {'模块数':>6} {'相对基线':>10}  最重的依赖")
+    for module in args.modules.split(","):
+        runs = [measure(module) for _ in range(args.repeat)]
+        if "error" in runs[0]:
+            print(f"{module:<24} 导入失败: {runs[0]['error']}")
+            continue
+        median = statistics.median(run["total_ms"] for run in runs)
+        result = {"total_ms": median, "modules": runs[0]["modules"], "top": runs[0]["top"]}
+        results[module] = result
+        old = baseline.get(module, {}).get("total_ms")
+        delta = f"{(median - old) / old * 100:+.1f}%" if old else "-"
+        heaviest = ", ".join(f"{name} {ms:.0f}ms" for name, ms in result["top"][:3])
+        print(f"{module:<24} {median:>10.1f} {result['modules']:>6} {delta:>10}  {heaviest}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已写入 {args.output}")
+
+
+if __name__ == '__main__':
+    main()
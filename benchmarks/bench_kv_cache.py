@@ -0,0 +1,67 @@
+"""
+DecoderLayer 增量解码基准: 每生成一个 token 的平均耗时随序列长度的变化，对比有无 KV 缓存。
+
+- 无缓存: 每一步都把完整前缀送入所有解码层，重新计算全部 Q/K/V 投影和交叉注意力的 K/V；
+- 有缓存: 每一步只送入最新的 token，自注意力 K/V 逐步追加，编码器 K/V 只计算一次。
+
+运行方式(在仓库根目录):
+    python -m benchmarks.bench_kv_cache
+"""
+import time
+
+import torch
+
+from chapter3 import DecoderLayer, make_causal_mask
+
+D_MODEL, NUM_HEADS, D_FF, NUM_LAYERS = 256, 8, 1024, 4
+SRC_LEN, BATCH = 64, 1
+SEQ_LENGTHS = [32, 64, 128, 256]
+
+
+def decode_without_cache(layers, tokens, memory):
+    outputs = []
+    for t in range(1, tokens.size(1) + 1):
+        x = tokens[:, :t]
+        mask = make_causal_mask(t)
+        for layer in layers:
+            x = layer(x, memory, None, mask)
+        outputs.append(x[:, -1:])
+    return torch.cat(outputs, dim=1)
+
+
+def decode_with_cache(layers, tokens, memory):
+    caches = [{} for _ in layers]
+    outputs = []
+    for t in range(tokens.size(1)):
+        x = tokens[:, t:t + 1]
+        for layer, cache in zip(layers, caches):
+            x = layer(x, memory, None, None, cache=cache)
+        outputs.append(x)
+    return torch.cat(outputs, dim=1)
+
+
+@torch.no_grad()
+def main():
+    torch.manual_seed(0)
+    layers = [DecoderLayer(D_MODEL, NUM_HEADS, D_FF, dropout=0.0).eval() for _ in range(NUM_LAYERS)]
+    memory = torch.randn(BATCH, SRC_LEN, D_MODEL)
+
+    print(f"{NUM_LAYERS} 层 DecoderLayer, d_model={D_MODEL}, 源序列长度={SRC_LEN}, 线程数={torch.get_num_threads()}")
+    print(f"{'长度':>6} {'无缓存 ms/token':>16} {'KV缓存 ms/token':>16} {'加速比':>8} {'最大误差':>10}")
+    for length in SEQ_LENGTHS:
+        tokens = torch.randn(BATCH, length, D_MODEL)
+
+        start = time.perf_counter()
+        full = decode_without_cache(layers, tokens, memory)
+        no_cache_ms = (time.perf_counter() - start) * 1000 / length
+
+        start = time.perf_counter()
+        cached = decode_with_cache(layers, tokens, memory)
+        cache_ms = (time.perf_counter() - start) * 1000 / length
+
+        max_err = (full - cached).abs().max().item()
+        print(f"{length:>6} {no_cache_ms:>16.3f} {cache_ms:>16.3f} {no_cache_ms / cache_ms:>7.1f}x {max_err:>10.2e}")
+
+
+if __name__ == '__main__':
+    main()
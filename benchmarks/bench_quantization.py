@@ -0,0 +1,78 @@
+"""
+int8 动态量化的 CPU 推理基准: fp32 与 int8 模型在不同批大小、线程数下的延迟，以及权重内存与输出偏差。
+
+延迟指一批请求完整的推理时间(编码 + 用 InferenceEngine 贪心解码固定步数)，
+同时给出只跑一次编码器与解码器(teacher forcing)的前向延迟。
+
+运行方式(在仓库根目录):
+    python -m benchmarks.bench_quantization
+    python -m benchmarks.bench_quantization --batch-sizes 1,8,32 --threads 1,4 --d-model 512 --layers 6
+"""
+import argparse
+import os
+import time
+
+import torch
+
+from chapter3 import Transformer
+from chapter3_inference import InferenceEngine
+from chapter3_quantization import measure_drift, model_size_bytes, quantize_dynamic_int8
+
+VOCAB, PAD, BOS, EOS = 1000, 0, 1, 2
+
+
+def timeit(fn, repeat):
+    fn()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+@torch.no_grad()
+def main():
+    parser = argparse.ArgumentParser(description="int8 动态量化推理基准")
+    parser.add_argument("--batch-sizes", default="1,8,32")
+    parser.add_argument("--threads", default=",".join(sorted({"1", str(os.cpu_count() or 1)}, key=int)),
+                        help="逗号分隔的线程数")
+    parser.add_argument("--d-model", type=int, default=512)
+    parser.add_argument("--heads", type=int, default=8)
+    parser.add_argument("--layers", type=int, default=3)
+    parser.add_argument("--d-ff", type=int, default=2048)
+    parser.add_argument("--src-len", type=int, default=32)
+    parser.add_argument("--new-tokens", type=int, default=16, help="每个请求生成的 token 数")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+    model = Transformer(VOCAB, VOCAB, args.d_model, args.heads, args.layers, args.d_ff, dropout=0.0, pad_idx=PAD).eval()
+    qmodel = quantize_dynamic_int8(model)
+    src = torch.randint(3, VOCAB, (8, args.src_len))
+    drift = measure_drift(model, qmodel, src, torch.randint(3, VOCAB, (8, args.new_tokens)))
+    print(f"{args.layers}+{args.layers} 层 Transformer, d_model={args.d_model}, d_ff={args.d_ff}, "
+          f"源长度={args.src_len}, 生成 {args.new_tokens} 个 token")
+    print(f"权重内存: fp32 {model_size_bytes(model) / 2**20:.1f} MB, int8 {model_size_bytes(qmodel) / 2**20:.1f} MB")
+    print(f"logits 偏差: 相对 L2 {drift['rel_l2']:.2%}, top-1 一致率 {drift['top1_agreement']:.2%}\n")
+
+    print(f"{'线程':>4} {'批大小':>6} {'前向 fp32 ms':>12} {'前向 int8 ms':>12} {'生成 fp32 ms':>12} {'生成 int8 ms':>12} "
+          f"{'生成加速比':>10} {'int8 seq/s':>10}")
+    original_threads = torch.get_num_threads()
+    for threads in [int(t) for t in args.threads.split(",")]:
+        torch.set_num_threads(threads)
+        for batch_size in [int(b) for b in args.batch_sizes.split(",")]:
+            src = torch.randint(3, VOCAB, (batch_size, args.src_len))
+            tgt = torch.randint(3, VOCAB, (batch_size, args.new_tokens))
+            sources = src.tolist()
+            row = []
+            for m in (model, qmodel):
+                row.append(timeit(lambda: m(src, tgt), args.repeat))
+            for m in (model, qmodel):
+                engine = InferenceEngine(m, BOS, EOS, max_batch_size=batch_size)
+                row.append(timeit(lambda: engine.generate(sources, max_new_tokens=args.new_tokens), args.repeat))
+            print(f"{threads:>4} {batch_size:>6} {row[0]:>12.1f} {row[1]:>12.1f} {row[2]:>12.1f} {row[3]:>12.1f} "
+                  f"{row[2] / row[3]:>9.2f}x {batch_size / row[3] * 1000:>10.1f}")
+    torch.set_num_threads(original_threads)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""
+搜索查询缓存的命中检查: 同一个问题的改写应当命中，字面相近但意图不同的查询必须未命中。
+
+对每个 threshold 分别统计:
+- 改写命中率: 只是空白、两端的标点、句首客套用语或句末语气词不同的改写，命中越多越好；
+- 误命中数: 与缓存中的查询只差一两个字或符号、却是不同问题的查询(例如"华为最新手表"对"华为最新手机"、
+  "C#教程"对"C++教程")，必须为 0。
+默认配置(只做精确匹配)与推荐的近似匹配阈值出现误命中时以非零状态退出，可作为回归检查。
+
+运行方式(在仓库根目录):
+    python -m benchmarks.bench_query_cache
+    python -m benchmarks.bench_query_cache --thresholds 1.0,0.9,0.85,0.6
+"""
+import argparse
+import sys
+import time
+
+from chapter4.query_cache import NearDuplicateCache
+
+CACHED = ["华为最新的手机", "北京今天的天气", "2024年诺贝尔物理学奖得主", "英伟达的市值是多少", "从北京到上海的高铁",
+          "C++教程", "1+1等于几", "$100等于多少人民币"]
+
+# (查询, 应当复用的缓存查询)
+PARAPHRASES = [
+    ("华为 最新的 手机", "华为最新的手机"),
+    ("请问华为最新的手机？", "华为最新的手机"),
+    ("北京今天的天气呢", "北京今天的天气"),
+    ("帮我查一下北京今天的天气", "北京今天的天气"),
+    ("2024 年诺贝尔物理学奖得主！", "2024年诺贝尔物理学奖得主"),
+    ("英伟达的市值是多少？", "英伟达的市值是多少"),
+    ("c++ 教程", "C++教程"),
+    ("请问1+1等于几呢?", "1+1等于几"),
+]
+
+# 字面相近但属于不同问题的查询，任何命中都是错误的结果
+DISTINCT = [
+    "华为最新手表",
+    "华为最新手机价格",
+    "北京明天的天气",
+    "上海今天的天气",
+    "2023年诺贝尔物理学奖得主",
+    "2024年诺贝尔化学奖得主",
+    "英伟达的股价是多少",
+    "从上海到北京的高铁",
+    "C#教程",
+    "C教程",
+    "11等于几",
+    "100等于多少人民币",
+]
+
+# 默认配置与推荐的近似匹配阈值，不允许出现误命中
+GUARDED_THRESHOLDS = (1.0, 0.85)
+
+
+def check(threshold: float):
+    cache = NearDuplicateCache(":memory:", threshold=threshold)
+    for query in CACHED:
+        cache.put(query, f"结果: {query}")
+    start = time.perf_counter()
+    hits = sum(cache.get(query) == f"结果: {expected}" for query, expected in PARAPHRASES)
+    false_hits = []
+    for query in DISTINCT:
+        match = cache.lookup(query)
+        if match:
+            false_hits.append(f"{query} -> {match[1]} ({match[2]:.2f})")
+    elapsed_ms = (time.perf_counter() - start) / (len(PARAPHRASES) + len(DISTINCT)) * 1000
+    cache.close()
+    return hits, false_hits, elapsed_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description="搜索查询缓存的改写命中与误命中检查")
+    parser.add_argument("--thresholds", default="1.0,0.9,0.85,0.7,0.6", help="逗号分隔的 Jaccard 阈值")
+    args = parser.parse_args()
+
+    print(f"缓存 {len(CACHED)} 条查询，改写 {len(PARAPHRASES)} 条，字面相近的不同问题 {len(DISTINCT)} 条")
+    print(f"{'阈值':>6} {'改写命中率':>10} {'误命中':>6} {'每次查找 ms':>12}")
+    failed = False
+    for threshold in [float(t) for t in args.thresholds.split(",")]:
+        hits, false_hits, elapsed_ms = check(threshold)
+        print(f"{threshold:>6.2f} {hits / len(PARAPHRASES):>10.0%} {len(false_hits):>6} {elapsed_ms:>12.3f}")
+        for item in false_hits:
+            print(f"       ❌ 误命中: {item}")
+        if false_hits and threshold in GUARDED_THRESHOLDS:
+            failed = True
+    if failed:
+        print(f"❌ 阈值 {GUARDED_THRESHOLDS} 出现误命中")
+        sys.exit(1)
+    print(f"✅ 阈值 {GUARDED_THRESHOLDS} 没有误命中")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,208 @@
+"""
+一个本地的、兼容 OpenAI 接口的流式桩服务器，用于离线基准测试。
+
+它实现 POST /v1/chat/completions (stream=True)，按脚本根据请求内容决定回复文本，
+并按配置的首 token 延迟(ttft)与 token 速率分片推送 SSE，让智能体在没有真实模型的情况下也能完整运行。
+可以用 malformed_rate 模拟模型偶尔写错工具调用格式，文本模式与函数调用模式按同样的概率出错。
+
+单独运行(在仓库根目录):
+    python -m benchmarks.stub_llm_server --port 8000 --ttft 0.2 --token-rate 50 --malformed-rate 0.2
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List
+
+CHARS_PER_TOKEN = 4  # 每个流式分片视为一个 token
+# 真实模型常在 Action 之后继续编造观察结果和后续思考，ReAct 脚本回复会附带这段内容
+RAMBLE = "\nObservation: (模型自行编造的观察结果，应当被忽略)\nThought: 根据上面的观察，我接下来还应该继续查询更多的相关信息以确认答案的准确性。"
+
+
+def scripted_reply(messages: List[Dict[str, str]], malformed: bool = False) -> str:
+    """
+    根据提示词中的特征，为本仓库中的各个智能体生成确定性的脚本回复。
+    malformed 为 True 时，ReAct 的工具调用写成缺少方括号的错误格式。
+    """
+    prompt = "\n".join(message.get("content") or "" for message in messages)
+    # Plan-and-Solve: 规划器与执行器
+    if "规划专家" in prompt:
+        if "depends_on" in prompt:
+            return ('```python\n[{"id": 1, "task": "计算周一的销量", "depends_on": []}, '
+                    '{"id": 2, "task": "计算周二的销量", "depends_on": []}, '
+                    '{"id": 3, "task": "计算周三的销量", "depends_on": [2]}, '
+                    '{"id": 4, "task": "求三天的总销量", "depends_on": [1, 2, 3]}]\n```')
+        return '```python\n["计算周一的销量", "计算周二的销量", "计算周三的销量", "求三天的总销量"]\n```'
+    if "执行专家" in prompt:
+        return "70"
+    # Reflection: 优化、评审、初稿(优化提示词里也出现“代码评审专家”，所以先判断)
+    if "根据一位代码评审专家的反馈" in prompt:
+        return ("def find_primes(n):\n    \"\"\"使用筛法 (sieve) 找出 1 到 n 之间的素数。\"\"\"\n"
+                "    sieve = [True] * (n + 1)\n    sieve[:2] = [False, False]\n"
+                "    for i in range(2, int(n ** 0.5) + 1):\n        if sieve[i]:\n"
+                "            sieve[i * i::i] = [False] * len(sieve[i * i::i])\n"
+                "    return [i for i, is_prime in enumerate(sieve) if is_prime]\n")
+    if "代码评审专家" in prompt:
+        return "无需改进" if "sieve" in prompt else "当前使用试除法，时间复杂度为 O(n*sqrt(n))，建议改用埃拉托斯特尼筛法。"
+    if "编写一个Python函数" in prompt or "请直接输出代码" in prompt:
+        return ("def find_primes(n):\n    \"\"\"找出 1 到 n 之间的素数。\"\"\"\n"
+                "    return [i for i in range(2, n + 1) if all(i % j for j in range(2, int(i ** 0.5) + 1))]\n")
+    # ReAct: 依据已有 Observation 的数量决定下一步动作，两次工具调用后给出答案
+    observations = (len(re.findall(r"Observation:", prompt)) - prompt.count("Observation: 本轮没有执行任何工具")
+                    - prompt.count("Observation: 无效的Action格式"))
+    tool = "Calculator" if "Calculator" in prompt else "Search"
+    if observations < 2 and malformed:
+        return f"Thought: 我需要先查询第 {observations + 1} 条信息。\nAction: {tool}: query {observations + 1}" + RAMBLE
+    if observations == 0 and "多行 Action" in prompt:
+        return f"Thought: 两条信息互不依赖，同时查询。\nAction: {tool}[query 1]\nAction: {tool}[query 2]" + RAMBLE
+    if observations < 2:
+        return f"Thought: 我需要先查询第 {observations + 1} 条信息。\nAction: {tool}[query {observations + 1}]" + RAMBLE
+    return "Thought: 已经获得全部信息。\nAction: Finish[42]" + RAMBLE
+
+
+def scripted_tool_reply(messages: List[Dict[str, Any]], tools: List[Dict[str, Any]],
+                        malformed: bool = False) -> Dict[str, Any]:
+    """
+    带 tools 参数的请求(原生函数调用)的脚本回复: 返回 {"content": str, "tool_calls": [(名称, 参数JSON)]}。
+    与真实模型一样，第一轮同时发出两个互不依赖的调用，拿到结果后给出最终答案。
+    malformed 为 True 时，工具调用的参数是不完整的 JSON。
+    """
+    tool_results = sum(message.get("role") == "tool" and not (message.get("content") or "").startswith("错误: 无法解析函数参数")
+                       for message in messages)
+    names = [tool["function"]["name"] for tool in tools]
+    name = "Calculator" if "Calculator" in names else names[0]
+    if tool_results < 2 and malformed:
+        return {"content": "", "tool_calls": [(name, '{"input": "query %d"' % (tool_results + 1))]}
+    if tool_results == 0:
+        return {"content": "", "tool_calls": [(name, json.dumps({"input": f"query {i}"})) for i in (1, 2)]}
+    if tool_results < 2:
+        return {"content": "", "tool_calls": [(name, json.dumps({"input": "query 2"}))]}
+    return {"content": "42", "tool_calls": []}
+
+
+class StubLLMServer:
+    """
+    在后台线程中运行的桩服务器。
+
+    参数:
+    - ttft (float): 每个请求返回第一个分片之前的等待时间(秒)。
+    - token_rate (float): 每秒推送的分片(token)数，0 表示不限速。
+    - reply_fn (Callable): 根据 messages 返回回复文本的函数，默认使用 scripted_reply。
+    - tool_reply_fn (Callable): 请求带 tools 时根据 (messages, tools) 返回文本与工具调用的函数，默认使用 scripted_tool_reply。
+    - malformed_rate (float): 每个请求以该概率让回复函数写出错误格式的工具调用(通过 malformed=True 传入)，
+      文本与函数调用两种模式相同；为 0 时不传 malformed，自定义的回复函数可以不支持该参数。
+    - seed (int): 决定哪些请求出错的随机种子，保证多次运行可以复现。
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, ttft: float = 0.05, token_rate: float = 200,
+                 reply_fn: Callable[[List[Dict[str, str]]], str] = scripted_reply,
+                 tool_reply_fn: Callable[[List[Dict[str, Any]], List[Dict[str, Any]]], Dict[str, Any]] = scripted_tool_reply,
+                 malformed_rate: float = 0.0, seed: int = 0):
+        self.ttft = ttft
+        self.token_rate = token_rate
+        self.reply_fn = reply_fn
+        self.tool_reply_fn = tool_reply_fn
+        self.malformed_rate = malformed_rate
+        self.requests = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def handle(self):
+                # 客户端关闭空闲的长连接属于正常情况，不打印异常栈
+                try:
+                    super().handle()
+                except (ConnectionResetError, BrokenPipeError):
+                    pass
+
+            def _write_chunk(self, data: bytes):
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+
+            def _send_delta(self, body: dict, delta: dict):
+                chunk = {
+                    "id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": int(time.time()),
+                    "model": body.get("model", "stub"),
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": None}],
+                }
+                self._write_chunk(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+                if server.token_rate:
+                    time.sleep(1 / server.token_rate)
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                kwargs = {}
+                with server._lock:
+                    server.requests += 1
+                    if server.malformed_rate:
+                        kwargs["malformed"] = server._rng.random() < server.malformed_rate
+                if body.get("tools"):
+                    reply = server.tool_reply_fn(body.get("messages", []), body["tools"], **kwargs)
+                else:
+                    reply = {"content": server.reply_fn(body.get("messages", []), **kwargs), "tool_calls": []}
+
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                time.sleep(server.ttft)
+                content = reply["content"]
+                for i in range(0, len(content), CHARS_PER_TOKEN):
+                    self._send_delta(body, {"content": content[i:i + CHARS_PER_TOKEN]})
+                # 工具调用: 先发 id 与名称，再把参数 JSON 分片推送
+                for index, (name, arguments) in enumerate(reply["tool_calls"]):
+                    self._send_delta(body, {"tool_calls": [{"index": index, "id": f"call_{server.requests}_{index}",
+                                                            "type": "function",
+                                                            "function": {"name": name, "arguments": ""}}]})
+                    for i in range(0, len(arguments), CHARS_PER_TOKEN):
+                        self._send_delta(body, {"tool_calls": [{"index": index, "function": {
+                            "arguments": arguments[i:i + CHARS_PER_TOKEN]}}]})
+                self._write_chunk(b"data: [DONE]\n\n")
+                self.wfile.write(b"0\r\n\r\n")
+                self.wfile.flush()
+
+        return Handler
+
+    def start(self) -> "StubLLMServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="本地 OpenAI 兼容流式桩服务器")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--ttft", type=float, default=0.05, help="首 token 延迟(秒)")
+    parser.add_argument("--token-rate", type=float, default=200, help="每秒推送的 token 数，0 表示不限速")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="工具调用写错格式的概率")
+    args = parser.parse_args()
+    stub = StubLLMServer(args.host, args.port, args.ttft, args.token_rate, malformed_rate=args.malformed_rate).start()
+    print(f"桩服务器已启动: {stub.base_url}")
+    try:
+        stub._thread.join()
+    except KeyboardInterrupt:
+        stub.stop()
@@ -1,8 +1,10 @@
-import requests
 import os
-from tavily import TavilyClient
-from openai import OpenAI
 import re
+from functools import lru_cache
+
+from chapter4.http_transport import get_transport
+from chapter4.LLM_client import ActionStopParser
+# requests、tavily 与 openai 都较重，只在真正调用工具或创建客户端时才导入
 AGENT_SYSTEM_PROMPT = """
 你是一个智能旅行助手。你的任务是分析用户的请求，并使用可用工具一步步地解决问题。
 
@@ -25,12 +27,13 @@ def get_weather(city: str) -> str:
     """
     通过调用 wttr.in API 查询真实的天气信息。
     """
+    import requests
     # API端点，我们请求JSON格式的数据
     url = f"https://wttr.in/{city}?format=j1"
 
     try:
-        # 发起网络请求
-        response = requests.get(url)
+        # 发起网络请求(共享传输层提供长连接、超时与 429/5xx 重试)
+        response = get_transport().get(url, tool="get_weather")
         # 检查响应状态码是否为200 (成功)
         response.raise_for_status()
         # 解析返回的JSON数据
@@ -51,6 +54,15 @@ def get_weather(city: str) -> str:
         # 处理数据解析错误
         return f"错误:解析天气数据失败，可能是城市名称无效 - {e}"
 
+@lru_cache(maxsize=None)
+def _tavily_client(api_key: str):
+    """每个 API 密钥只创建一个 TavilyClient，并让它使用共享传输层中单独的会话(鉴权头不会带给其他服务)。"""
+    from tavily import TavilyClient
+    try:
+        return TavilyClient(api_key=api_key, session=get_transport().session("tavily"))
+    except TypeError:  # 旧版本的 tavily-python 不支持传入 session
+        return TavilyClient(api_key=api_key)
+
 def get_attraction(city: str, weather: str) -> str:
     """
     根据城市和天气，使用Tavily Search API搜索并返回优化后的景点推荐。
@@ -60,15 +72,17 @@ def get_attraction(city: str, weather: str) -> str:
     if not api_key:
         return "错误:未配置TAVILY_API_KEY环境变量。"
 
-    # 2. 初始化Tavily客户端
-    tavily = TavilyClient(api_key=api_key)
+    # 2. 获取(复用)Tavily客户端
+    tavily = _tavily_client(api_key)
 
     # 3. 构造一个精确的查询
     query = f"'{city}' 在'{weather}'天气下最值得去的旅游景点推荐及理由"
 
     try:
         # 4. 调用API，include_answer=True会返回一个综合性的回答
-        response = tavily.search(query=query, search_depth="basic", include_answer=True)
+        with get_transport().track("get_attraction"):
+            response = tavily.search(query=query, search_depth="basic", include_answer=True,
+                                     timeout=get_transport().timeout[1])
 
         # 5. Tavily返回的结果已经非常干净，可以直接使用
         # response['answer'] 是一个基于所有搜索结果的总结性回答
@@ -99,11 +113,16 @@ class OpenAICompatibleClient:
     一个用于调用任何兼容OpenAI接口的LLM服务的客户端。
     """
     def __init__(self, model: str, api_key: str, base_url: str):
+        from openai import OpenAI
         self.model = model
         self.client = OpenAI(api_key=api_key, base_url=base_url)
 
-    def generate(self, prompt: str, system_prompt: str) -> str:
-        """调用LLM API来生成回应。"""
+    def generate(self, prompt: str, system_prompt: str, stop=None) -> str:
+        """
+        调用LLM API来生成回应。
+        传入 stop 判定函数(例如 ActionStopParser())时改用流式调用，判定为 True 后立即关闭连接，
+        不再等待模型生成多余的 Thought-Action 对。
+        """
         print("正在调用大语言模型...")
         try:
             messages = [
@@ -113,9 +132,18 @@ class OpenAICompatibleClient:
             response = self.client.chat.completions.create(
                 model=self.model,
                 messages=messages,
-                stream=False
+                stream=stop is not None
             )
-            answer = response.choices[0].message.content
+            if stop is None:
+                answer = response.choices[0].message.content
+            else:
+                answer = ""
+                for chunk in response:
+                    answer += (chunk.choices[0].delta.content or "") if chunk.choices else ""
+                    if stop(answer):
+                        response.close()
+                        print("已收到完整的 Action，提前结束生成。")
+                        break
             print("大语言模型响应成功。")
             return answer
         except Exception as e:
@@ -150,8 +178,8 @@ for i in range(5):  # 设置最大循环次数
     full_prompt = "\n".join(prompt_history)
 
     # 3.2. 调用LLM进行思考
-    llm_output = llm.generate(full_prompt, system_prompt=AGENT_SYSTEM_PROMPT)
-    # 模型可能会输出多余的Thought-Action，需要截断
+    llm_output = llm.generate(full_prompt, system_prompt=AGENT_SYSTEM_PROMPT, stop=ActionStopParser())
+    # 流式生成在 Action 完整后就已停止，这里的截断只处理同一分片里多出来的内容
     match = re.search(r'(Thought:.*?Action:.*?)(?=\n\s*(?:Thought:|Action:|Observation:)|\Z)', llm_output, re.DOTALL)
     if match:
         truncated = match.group(1).strip()
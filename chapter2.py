@@ -1,5 +1,8 @@
 import re
 import random
+import sys
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, List
 
 # 定义规则库:模式(正则表达式) -> 响应模板列表
 rules = {
@@ -48,33 +51,84 @@ pronoun_swap = {
     "mine": "yours"
 }
 
+@lru_cache(maxsize=4096)
 def swap_pronouns(phrase):
     """
     对输入短语中的代词进行第一/第二人称转换
+    批量处理时捕获到的短语大量重复，因此缓存最近的转换结果
     """
     words = phrase.lower().split()
     swapped_words = [pronoun_swap.get(word, word) for word in words]
     return " ".join(swapped_words)
 
-def respond(user_input):
+class RuleMatcher:
+    """
+    把整个规则库预编译成一个正则表达式，一次匹配就能找到第一条命中的规则。
+
+    每条规则被包装成 (?P<_rN>(?s:.*?)规则) 并按顺序用 | 连接，再从字符串开头匹配:
+    正则引擎按顺序尝试各个分支，惰性前缀让规则可以出现在任意位置，
+    因此命中的规则和捕获内容与逐条 re.search 完全一致。
+    """
+    def __init__(self, rules: Dict[str, List[str]]):
+        branches = []
+        self.targets = {}  # 分支名 -> (响应模板列表, 规则第一个捕获组的编号或 None)
+        group_index = 0
+        for i, (pattern, responses) in enumerate(rules.items()):
+            name = f"_r{i}"
+            inner_groups = re.compile(pattern).groups
+            group_index += 1  # 外层的命名分组
+            self.targets[name] = (responses, group_index + 1 if inner_groups else None)
+            group_index += inner_groups
+            branches.append(f"(?P<{name}>(?s:.*?)(?:{pattern}))")
+        self.regex = re.compile("|".join(branches), re.IGNORECASE)
+
+    def match(self, user_input: str):
+        """返回 (响应模板列表, 捕获内容)；没有任何规则命中时返回 (None, '')。"""
+        match = self.regex.match(user_input)
+        if not match:
+            return None, ''
+        responses, group = self.targets[match.lastgroup]
+        return responses, (match.group(group) or '') if group else ''
+
+# 预编译的默认规则库；若在运行时修改了 rules，需要重新执行 matcher = RuleMatcher(rules)
+matcher = RuleMatcher(rules)
+
+def respond(user_input, rng: random.Random = None):
     """
     根据规则库生成响应
     """
-    for pattern, responses in rules.items():
-        match = re.search(pattern, user_input, re.IGNORECASE)
-        if match:
-            # 捕获匹配到的部分
-            captured_group = match.group(1) if match.groups() else ''
-            # 进行代词转换
-            swapped_group = swap_pronouns(captured_group)
-            # 从模板中随机选择一个并格式化
-            response = random.choice(responses).format(swapped_group)
-            return response
+    responses, captured_group = matcher.match(user_input)
+    choice = (rng or random).choice
+    if responses is not None:
+        # 进行代词转换
+        swapped_group = swap_pronouns(captured_group)
+        # 从模板中随机选择一个并格式化
+        return choice(responses).format(swapped_group)
     # 如果没有匹配任何特定规则，使用最后的通配符规则
-    return random.choice(rules[r'.*'])
+    return choice(rules[r'.*'])
+
+def respond_stream(utterances: Iterable[str], rng: random.Random = None) -> Iterator[str]:
+    """
+    逐条处理一个可迭代对象中的用户输入(例如打开的文件)，惰性地产出对应的响应。
+    每行末尾的换行符会被去掉。
+    """
+    for user_input in utterances:
+        yield respond(user_input.rstrip("\r\n"), rng)
+
+def respond_batch(utterances: Iterable[str], rng: random.Random = None) -> List[str]:
+    """
+    批量处理用户输入，按顺序返回响应列表。
+    """
+    return list(respond_stream(utterances, rng))
 
 # 主聊天循环
 if __name__ == '__main__':
+    # 批量模式: python chapter2.py utterances.txt，每行一条输入，响应逐行写到标准输出
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], encoding="utf-8") as f:
+            for response in respond_stream(f):
+                print(response)
+        sys.exit(0)
     print("Therapist: Hello! How can I help you today?")
     while True:
         user_input = input("You: ")
@@ -1,53 +1,173 @@
 import torch
 import torch.nn as nn
+import torch.nn.functional as F
+from torch.utils.checkpoint import checkpoint
 import math
 
 
 
 # --- 占位符模块，将在后续小节中实现 ---
 
+# 按 (d_model, dtype, device) 缓存的正弦位置编码表，所有 d_model 相同的 PositionalEncoding 共享
+_PE_TABLES = {}
+_PE_MIN_ROWS = 64
+
+def sinusoidal_table(d_model: int, length: int, dtype=torch.float32, device=None) -> torch.Tensor:
+    """
+    返回至少 length 行的正弦位置编码表，形状 (rows, d_model)。
+    表按需计算，遇到更长的序列时行数按 2 的幂增长，并按 dtype/device 缓存；
+    总是先用 float32 计算再转换到目标 dtype，半精度下也不会因为大位置值损失 sin/cos 的精度。
+    """
+    device = torch.device(device) if device is not None else torch.device("cpu")
+    key = (d_model, dtype, device)
+    table = _PE_TABLES.get(key)
+    if table is None or table.size(0) < length:
+        rows = max(_PE_MIN_ROWS, 1 << (length - 1).bit_length())
+        position = torch.arange(0, rows, dtype=torch.float, device=device).unsqueeze(1)
+        div_term = torch.exp(torch.arange(0, d_model, 2, device=device).float() * -(math.log(10000.0) / d_model))
+        pe = torch.zeros(rows, d_model, device=device)
+        # 偶数维度使用 sin, 奇数维度使用 cos
+        pe[:, 0::2] = torch.sin(position * div_term)
+        pe[:, 1::2] = torch.cos(position * div_term)
+        table = _PE_TABLES[key] = pe.to(dtype)
+    return table
+
 class PositionalEncoding(nn.Module):
     """
     位置编码模块
+    位置编码表不再作为 buffer 保存在每个实例里，而是通过 sinusoidal_table 按需计算、按输入的 dtype/device 共享，
+    因此半精度输入加上位置编码后仍是半精度。max_len 是允许的最大位置。
     """
     def __init__(self, d_model, max_len=5000,dropout:float=0.1):
         super().__init__()
+        self.d_model = d_model
+        self.max_len = max_len
         self.dropout = nn.Dropout(p=dropout)
-        #创造一个足够长的位置矩阵
-        position = torch.arange(0, max_len, dtype=torch.float).unsqueeze(1)
-        div_term = torch.exp(torch.arange(0, d_model, 2).float() * -(math.log(10000.0) / d_model))
+        # 旧版本的 state_dict 中带有 pe buffer，加载时忽略
+        self.register_load_state_dict_pre_hook(self._drop_legacy_pe)
 
-        pe = torch.zeros(max_len, d_model)
+    @staticmethod
+    def _drop_legacy_pe(module, state_dict, prefix, *args):
+        state_dict.pop(prefix + "pe", None)
 
-        # 偶数维度使用 sin, 奇数维度使用 cos
-        pe[:, 0::2] = torch.sin(position * div_term)
-        pe[:, 1::2] = torch.cos(position * div_term)
-
-        # 将 pe 注册为 buffer，这样它就不会被视为模型参数，但会随模型移动（例如 to(device)）
-        self.register_buffer('pe', pe.unsqueeze(0))
-
-    def forward(self, x: torch.Tensor) -> torch.Tensor:
+    def forward(self, x: torch.Tensor, start_pos: int = 0, positions: torch.Tensor = None) -> torch.Tensor:
         # x.size(1) 是当前输入的序列长度
+        # 增量解码时 x 只包含新生成的位置，start_pos 是它在完整序列中的起始下标
+        # 打包输入 x 形状为 (total_tokens, d_model)，positions 给出每个 token 在各自序列中的位置
+        length = int(positions.max()) + 1 if positions is not None and positions.numel() else start_pos + x.size(1)
+        if length > self.max_len:
+            raise ValueError(f"序列位置 {length} 超过了 max_len={self.max_len}")
+        pe = sinusoidal_table(self.d_model, length, x.dtype, x.device)
         # 将位置编码加到输入向量上
-        x = x + self.pe[:, :x.size(1)]
+        if positions is not None:
+            x = x + pe[positions]
+        else:
+            x = x + pe[start_pos:start_pos + x.size(1)]
         return self.dropout(x)
 
+def apply_rotary(x: torch.Tensor, positions: torch.Tensor, base: float = 10000.0) -> torch.Tensor:
+    """
+    旋转位置编码(RoPE): 把 x 最后一维的前后两半看作复数的实部和虚部，按位置旋转对应的角度。
+    positions 的形状要能与 x 去掉最后一维后的形状广播(例如 x 为 (batch, heads, seq, d_k) 时传 (seq,))。
+    角度按需从位置直接算出，不需要保存任何表；计算用 float32，结果转换回 x 的 dtype。
+    """
+    half = x.size(-1) // 2
+    inv_freq = torch.exp(torch.arange(0, half, device=x.device, dtype=torch.float) * -(math.log(base) / half))
+    angles = positions.to(torch.float).unsqueeze(-1) * inv_freq
+    cos, sin = torch.cos(angles), torch.sin(angles)
+    x1, x2 = x[..., :half].float(), x[..., half:].float()
+    return torch.cat([x1 * cos - x2 * sin, x2 * cos + x1 * sin], dim=-1).to(x.dtype)
+
 class MultiHeadAttention(nn.Module):
     """
     多头注意力机制模块
+    backend 选择注意力的计算方式:
+    - "math": 显式构造得分矩阵，再 masked_fill、softmax、与 V 相乘(便于教学和观察中间结果)；
+    - "fused": 调用 PyTorch 融合的 F.scaled_dot_product_attention，布尔掩码直接传入，不生成 -1e9 填充的中间张量。
+    rotary=True 时对 Q/K 施加旋转位置编码(只用于自注意力)，此时输入不需要再加正弦位置编码。
+
+    Q/K/V 的投影是融合的:
+    - 自注意力(cross_attention=False): 一个 d_model -> 3*d_model 的 Wqkv，一次矩阵乘法得到 Q、K、V；
+    - 交叉注意力(cross_attention=True): Q 来自解码器用 Wq，K/V 来自编码器输出，用一个 d_model -> 2*d_model 的 Wkv。
+    旧版本分开保存的 Wq/Wk/Wv 权重在 load_state_dict 时会自动拼接成融合权重。
     """
-    def __init__(self, d_model, num_heads):
+    def __init__(self, d_model, num_heads, backend="math", rotary=False, cross_attention=False):
         super(MultiHeadAttention,self).__init__()
+        if backend not in ("math", "fused"):
+            raise ValueError(f"未知的注意力后端: {backend}")
+        self.backend = backend
+        self.rotary = rotary
+        self.cross_attention = cross_attention
         self.num_heads = num_heads
         self.d_model = d_model
         self.d_k = d_model // num_heads
         #定义QKV和输出的线性变换层
-        self.Wq = nn.Linear(d_model, d_model, bias=False)
-        self.Wk = nn.Linear(d_model, d_model, bias=False)
-        self.Wv = nn.Linear(d_model, d_model, bias=False)
+        if cross_attention:
+            self.Wq = nn.Linear(d_model, d_model, bias=False)
+            self.Wkv = nn.Linear(d_model, 2 * d_model, bias=False)
+        else:
+            self.Wqkv = nn.Linear(d_model, 3 * d_model, bias=False)
         self.Wo = nn.Linear(d_model, d_model, bias=False)
+        self.register_load_state_dict_pre_hook(self._merge_separate_projections)
+
+    @staticmethod
+    def _merge_separate_projections(module, state_dict, prefix, *args):
+        names, fused = (("Wk", "Wv"), "Wkv") if module.cross_attention else (("Wq", "Wk", "Wv"), "Wqkv")
+        for suffix in ("weight", "bias"):
+            keys = [f"{prefix}{name}.{suffix}" for name in names]
+            if all(key in state_dict for key in keys) and f"{prefix}{fused}.{suffix}" not in state_dict:
+                state_dict[f"{prefix}{fused}.{suffix}"] = torch.cat([state_dict.pop(key) for key in keys], dim=0)
+
+    @staticmethod
+    def _linear_rows(layer, x, start, end):
+        # 只计算融合投影中 [start, end) 这一段输出，对应权重的若干行(行切片是连续的视图，不复制权重)
+        if start == 0 and end == layer.out_features:
+            return layer(x)
+        if isinstance(layer, nn.Linear):
+            return F.linear(x, layer.weight[start:end], layer.bias[start:end] if layer.bias is not None else None)
+        # 其他实现(例如量化后的线性层)不能按行切分权重，算完整投影后取出需要的一段
+        return layer(x)[..., start:end]
+
+    def project(self, query, key, value, need_kv=True):
+        """
+        计算形状为 (..., num_heads, d_k) 的 Q/K/V。
+        自注意力时 query、key、value 是同一个张量，只做一次 3*d_model 的投影；
+        交叉注意力时 key 与 value 是同一个张量，K/V 只做一次 2*d_model 的投影。
+        其他组合按融合权重的行切片分别投影。need_kv=False 时只计算 Q，K/V 返回 None。
+        """
+        d, heads = self.d_model, (self.num_heads, self.d_k)
+        if self.cross_attention:
+            Q = self.Wq(query).unflatten(-1, heads)
+            layer, offset = self.Wkv, 0
+        elif need_kv and key is query and value is query:
+            return self.Wqkv(query).unflatten(-1, (3,) + heads).unbind(-3)
+        else:
+            Q = self._linear_rows(self.Wqkv, query, 0, d).unflatten(-1, heads)
+            layer, offset = self.Wqkv, d
+        if not need_kv:
+            return Q, None, None
+        if key is value:
+            K, V = self._linear_rows(layer, key, offset, offset + 2 * d).unflatten(-1, (2,) + heads).unbind(-3)
+        else:
+            K = self._linear_rows(layer, key, offset, offset + d).unflatten(-1, heads)
+            V = self._linear_rows(layer, value, offset + d, offset + 2 * d).unflatten(-1, heads)
+        return Q, K, V
+
+    def scaled_dot_product_attention(self, Q, K, V, mask=None, is_causal=False):
+        """
+        mask 中为 0(或 False)的位置会被屏蔽。is_causal=True 时额外屏蔽未来位置，
+        查询比键短(增量解码)时因果掩码与序列末尾对齐。
+        """
+        if is_causal:
+            q_len, k_len = Q.size(-2), K.size(-2)
+            if self.backend == "fused" and mask is None and q_len == k_len:
+                return F.scaled_dot_product_attention(Q, K, V, is_causal=True)
+            causal = torch.ones(q_len, k_len, dtype=torch.bool, device=Q.device).tril(diagonal=k_len - q_len)
+            mask = causal if mask is None else (mask != 0) & causal
+        if self.backend == "fused":
+            attn_mask = None if mask is None else (mask if mask.dtype == torch.bool else mask != 0)
+            return F.scaled_dot_product_attention(Q, K, V, attn_mask=attn_mask)
 
-    def scaled_dot_product_attention(self, Q, K, V, mask=None):
         #1.计算注意力得分
         attn_scores = torch.matmul(Q, K.transpose(-2, -1)) / math.sqrt(self.d_k)
         #2.应用掩码
@@ -66,17 +186,66 @@ class MultiHeadAttention(nn.Module):
         batch_size, num_heads, seq_length, d_k = x.size()
         return x.transpose(1, 2).contiguous().view(batch_size, seq_length, self.d_model)
 
-    def forward(self, query, key, value, mask = None):
-        #1.先对Q，K，V进行线性变换
-        Q = self.split_heads(self.Wq(query))
-        K = self.split_heads(self.Wk(key))
-        V = self.split_heads(self.Wv(value))
+    def forward(self, query, key, value, mask = None, cache = None, static_kv = False, is_causal = False,
+                cu_seqlens = None, cu_seqlens_k = None):
+        """
+        cache 是一个可选的字典，用于增量解码时缓存已经投影、拆分好的 K/V:
+        - 自注意力(static_kv=False): 只对本次新输入的 key/value 做投影，并拼接到缓存中已有的 K/V 之后；
+        - 交叉注意力(static_kv=True): 编码器输出的 K/V 只在第一次调用时计算，之后直接复用。
+        每个新的源序列都应该使用一个新的空字典。
+        is_causal=True 时无需传入因果掩码，fused 后端会直接使用内置的因果注意力。
+        传入 cu_seqlens 时输入是打包格式，见 forward_packed。
+        """
+        if cu_seqlens is not None:
+            return self.forward_packed(query, key, value, cu_seqlens, cu_seqlens_k, is_causal)
+        #1.先对Q，K，V进行线性变换，并拆分成多头: (batch, seq, heads, d_k) -> (batch, heads, seq, d_k)
+        cached_kv = cache is not None and static_kv and "k" in cache
+        Q, K, V = self.project(query, key, value, need_kv=not cached_kv)
+        Q = Q.transpose(1, 2)
+        if cached_kv:
+            K, V = cache["k"], cache["v"]
+        else:
+            K, V = K.transpose(1, 2), V.transpose(1, 2)
+            if self.rotary and not static_kv:
+                # 增量解码时新 token 的位置接在缓存中已有的 K 之后；缓存里保存的是已经旋转过的 K
+                past = cache["k"].size(2) if cache is not None and "k" in cache else 0
+                positions = torch.arange(past, past + K.size(2), device=K.device)
+                Q, K = apply_rotary(Q, positions), apply_rotary(K, positions)
+            if cache is not None:
+                if "k" in cache:
+                    K = torch.cat([cache["k"], K], dim=2)
+                    V = torch.cat([cache["v"], V], dim=2)
+                cache["k"], cache["v"] = K, V
         #2.计算注意力
-        attn_scores = self.scaled_dot_product_attention(Q, K, V, mask)
+        attn_scores = self.scaled_dot_product_attention(Q, K, V, mask, is_causal)
         #3.合并多头输出
         output = self.Wo(self.combine_heads(attn_scores))
         return output
 
+    def forward_packed(self, query, key, value, cu_seqlens, cu_seqlens_k=None, is_causal=False):
+        """
+        打包(无填充)输入的注意力: query/key/value 形状为 (total_tokens, d_model)，多个序列首尾相接，
+        cu_seqlens 是长度为 序列数+1 的累计偏移，第 i 个序列占 [cu_seqlens[i], cu_seqlens[i+1])。
+        key/value 的偏移不同时(例如交叉注意力)用 cu_seqlens_k 给出。
+        注意力按序列分块计算(块对角)，每个序列只关注自己的 token，不需要填充和掩码。
+        """
+        cu_seqlens_k = cu_seqlens if cu_seqlens_k is None else cu_seqlens_k
+        bounds_q = cu_seqlens.tolist() if torch.is_tensor(cu_seqlens) else list(cu_seqlens)
+        bounds_k = cu_seqlens_k.tolist() if torch.is_tensor(cu_seqlens_k) else list(cu_seqlens_k)
+        Q, K, V = self.project(query, key, value)
+        if self.rotary:
+            # 位置要和 Q/K 在同一设备上；传入的是张量时直接使用，避免一次 list -> tensor 的往返
+            Q = apply_rotary(Q, packed_positions(torch.as_tensor(cu_seqlens, device=Q.device)).unsqueeze(-1))
+            K = apply_rotary(K, packed_positions(torch.as_tensor(cu_seqlens_k, device=K.device)).unsqueeze(-1))
+        output = Q.new_empty(Q.shape)
+        for i in range(len(bounds_q) - 1):
+            q_start, q_end, k_start, k_end = bounds_q[i], bounds_q[i + 1], bounds_k[i], bounds_k[i + 1]
+            # (seq_len, num_heads, d_k) -> (num_heads, seq_len, d_k)，都是视图，不复制数据
+            attn = self.scaled_dot_product_attention(Q[q_start:q_end].transpose(0, 1), K[k_start:k_end].transpose(0, 1),
+                                                     V[k_start:k_end].transpose(0, 1), is_causal=is_causal)
+            output[q_start:q_end] = attn.transpose(0, 1)
+        return self.Wo(output.view(-1, self.d_model))
+
 class PositionWiseFeedForward(nn.Module):
     """
     位置前馈网络模块
@@ -95,21 +264,64 @@ class PositionWiseFeedForward(nn.Module):
         # 最终输出形状: (batch_size, seq_len, d_model)
         return x
 
+def pack_sequences(sequences):
+    """
+    把长度不同的序列(每个形状为 (seq_len, ...))首尾拼接成打包格式，
+    返回 (packed, cu_seqlens)，cu_seqlens 是 int32 的累计偏移，长度为 序列数+1。
+    """
+    lengths = torch.tensor([len(seq) for seq in sequences], dtype=torch.int32)
+    cu_seqlens = F.pad(lengths.cumsum(0, dtype=torch.int32), (1, 0))
+    return torch.cat(list(sequences), dim=0), cu_seqlens
+
+def unpack_sequences(packed: torch.Tensor, cu_seqlens) -> list:
+    """pack_sequences 的逆操作，返回各序列的视图列表。"""
+    bounds = cu_seqlens.tolist() if torch.is_tensor(cu_seqlens) else list(cu_seqlens)
+    return [packed[start:end] for start, end in zip(bounds[:-1], bounds[1:])]
+
+def packed_positions(cu_seqlens: torch.Tensor) -> torch.Tensor:
+    """打包格式中每个 token 在各自序列中的位置(每个序列都从 0 开始)。"""
+    cu_seqlens = cu_seqlens.long()
+    lengths = cu_seqlens[1:] - cu_seqlens[:-1]
+    total = int(cu_seqlens[-1])
+    return torch.arange(total, device=cu_seqlens.device) - cu_seqlens[:-1].repeat_interleave(lengths, output_size=total)
+
+def make_causal_mask(size: int, device=None) -> torch.Tensor:
+    """
+    生成形状为 (1, 1, size, size) 的下三角掩码，1 表示可以关注，0 表示被屏蔽的未来位置。
+    """
+    return torch.tril(torch.ones(size, size, dtype=torch.bool, device=device)).view(1, 1, size, size)
+
 # --- 编码器核心层 ---
 
 class EncoderLayer(nn.Module):
-    def __init__(self, d_model, num_heads, d_ff, dropout):
+    """
+    checkpointing=True 时开启激活检查点: 训练时前向只保存本层的输入，注意力得分、softmax、dropout 掩码、
+    d_ff 维的隐藏激活等中间结果不保存，反向传播时重新计算本层，用约一次额外的前向换取显存/内存。
+    """
+    def __init__(self, d_model, num_heads, d_ff, dropout, attn_backend="math", rotary=False, checkpointing=False):
         super(EncoderLayer, self).__init__()
-        self.self_attn = MultiHeadAttention() # 待实现
-        self.feed_forward = PositionWiseFeedForward() # 待实现
+        self.checkpointing = checkpointing
+        self.self_attn = MultiHeadAttention(d_model, num_heads, attn_backend, rotary)
+        self.feed_forward = PositionWiseFeedForward(d_model, d_ff, dropout)
         self.norm1 = nn.LayerNorm(d_model)
         self.norm2 = nn.LayerNorm(d_model)
         self.dropout = nn.Dropout(dropout)
 
-    def forward(self, x, mask):
+    def forward(self, x, mask, cu_seqlens=None):
+        """
+        x 形状为 (batch, seq_len, d_model)，mask 屏蔽填充位置。
+        也可以传入打包格式: x 形状为 (total_tokens, d_model)，cu_seqlens 为各序列的累计偏移，此时 mask 不使用；
+        层归一化和前馈网络逐 token 计算，与格式无关，填充 token 完全不参与计算。
+        """
+        if self.checkpointing and torch.is_grad_enabled():
+            # 重新计算时会恢复 dropout 的随机数状态，两次前向结果一致
+            return checkpoint(self._forward, x, mask, cu_seqlens, use_reentrant=False)
+        return self._forward(x, mask, cu_seqlens)
+
+    def _forward(self, x, mask, cu_seqlens):
         # 残差连接与层归一化将在 3.1.2.4 节中详细解释
         # 1. 多头自注意力
-        attn_output = self.self_attn(x, x, x, mask)
+        attn_output = self.self_attn(x, x, x, mask, cu_seqlens=cu_seqlens)
         x = self.norm1(x + self.dropout(attn_output))
 
         # 2. 前馈网络
@@ -121,27 +333,147 @@ class EncoderLayer(nn.Module):
 # --- 解码器核心层 ---
 
 class DecoderLayer(nn.Module):
-    def __init__(self, d_model, num_heads, d_ff, dropout):
+    """
+    checkpointing=True 时开启激活检查点(见 EncoderLayer)；增量解码(传入 cache)时不需要反向传播，始终直接计算。
+    """
+    def __init__(self, d_model, num_heads, d_ff, dropout, attn_backend="math", rotary=False, checkpointing=False):
         super(DecoderLayer, self).__init__()
-        self.self_attn = MultiHeadAttention() # 待实现
-        self.cross_attn = MultiHeadAttention() # 待实现
-        self.feed_forward = PositionWiseFeedForward() # 待实现
+        self.checkpointing = checkpointing
+        self.self_attn = MultiHeadAttention(d_model, num_heads, attn_backend, rotary)
+        self.cross_attn = MultiHeadAttention(d_model, num_heads, attn_backend, cross_attention=True)
+        self.feed_forward = PositionWiseFeedForward(d_model, d_ff, dropout)
         self.norm1 = nn.LayerNorm(d_model)
         self.norm2 = nn.LayerNorm(d_model)
         self.norm3 = nn.LayerNorm(d_model)
         self.dropout = nn.Dropout(dropout)
 
-    def forward(self, x, encoder_output, src_mask, tgt_mask):
+    def forward(self, x, encoder_output, src_mask, tgt_mask, cache=None):
+        """
+        cache 为 None 时对完整的目标序列做一次前向。
+        增量解码时传入一个字典(每个源序列一个，初始为空)，x 只包含新生成的 token:
+        自注意力的 K/V 会逐步追加到 cache["self"]，编码器输出的 K/V 只在第一步计算并保存在 cache["cross"]。
+        此时 tgt_mask 只需屏蔽新 token 之间的未来位置，一次只输入一个 token 时传 None 即可。
+        """
+        if self.checkpointing and cache is None and torch.is_grad_enabled():
+            return checkpoint(self._forward, x, encoder_output, src_mask, tgt_mask, use_reentrant=False)
+        return self._forward(x, encoder_output, src_mask, tgt_mask, cache)
+
+    def _forward(self, x, encoder_output, src_mask, tgt_mask, cache=None):
+        self_cache = cross_cache = None
+        if cache is not None:
+            self_cache = cache.setdefault("self", {})
+            cross_cache = cache.setdefault("cross", {})
+
         # 1. 掩码多头自注意力 (对自己)
-        attn_output = self.self_attn(x, x, x, tgt_mask)
+        attn_output = self.self_attn(x, x, x, tgt_mask, cache=self_cache)
         x = self.norm1(x + self.dropout(attn_output))
 
         # 2. 交叉注意力 (对编码器输出)
-        cross_attn_output = self.cross_attn(x, encoder_output, encoder_output, src_mask)
+        cross_attn_output = self.cross_attn(x, encoder_output, encoder_output, src_mask,
+                                            cache=cross_cache, static_kv=True)
         x = self.norm2(x + self.dropout(cross_attn_output))
 
         # 3. 前馈网络
         ff_output = self.feed_forward(x)
         x = self.norm3(x + self.dropout(ff_output))
 
-        return x
\ No newline at end of file
+        return x
+
+# --- 完整的编码器-解码器模型 ---
+
+class Transformer(nn.Module):
+    """
+    由上面各模块组装成的编码器-解码器 Transformer。
+
+    encode 只运行一次编码器；decode 既可以对完整目标序列做一次前向(训练)，
+    也可以在传入 caches(每个解码层一个字典)时只输入新生成的 token 做增量解码(推理)。
+    positional 为 "sinusoidal"(输入加正弦位置编码)或 "rotary"(在各层自注意力中对 Q/K 施加旋转位置编码)。
+    checkpointing 控制训练时的激活检查点，见 set_checkpointing。
+    """
+    def __init__(self, src_vocab_size, tgt_vocab_size, d_model=512, num_heads=8, num_layers=6, d_ff=2048,
+                 max_len=5000, dropout=0.1, pad_idx=0, attn_backend="math", positional="sinusoidal",
+                 checkpointing="none"):
+        super(Transformer, self).__init__()
+        if positional not in ("sinusoidal", "rotary"):
+            raise ValueError(f"未知的位置编码方式: {positional}")
+        self.d_model = d_model
+        self.pad_idx = pad_idx
+        self.rotary = positional == "rotary"
+        self.encoder_embedding = nn.Embedding(src_vocab_size, d_model, padding_idx=pad_idx)
+        self.decoder_embedding = nn.Embedding(tgt_vocab_size, d_model, padding_idx=pad_idx)
+        self.positional_encoding = PositionalEncoding(d_model, max_len, dropout)
+        self.encoder_layers = nn.ModuleList(
+            [EncoderLayer(d_model, num_heads, d_ff, dropout, attn_backend, self.rotary) for _ in range(num_layers)])
+        self.decoder_layers = nn.ModuleList(
+            [DecoderLayer(d_model, num_heads, d_ff, dropout, attn_backend, self.rotary) for _ in range(num_layers)])
+        self.fc = nn.Linear(d_model, tgt_vocab_size)
+        self.set_checkpointing(checkpointing)
+
+    def set_checkpointing(self, mode: str = "layer"):
+        """
+        设置激活检查点的粒度:
+        - "none": 不使用，前向保存所有中间结果；
+        - "layer": 每一层各自检查点，只保存每层的输入，反向时逐层重新计算；
+        - "stack": 编码器栈和解码器栈各作为一个整体检查点，只保存栈的输入，内存最省，
+          但反向时要先重算整个栈，重算期间会同时持有整个栈的中间结果。
+        也可以直接设置单个层的 checkpointing 属性，只对部分层开启。
+        """
+        if mode not in ("none", "layer", "stack"):
+            raise ValueError(f"未知的检查点模式: {mode}")
+        self.checkpointing = mode
+        for layer in list(self.encoder_layers) + list(self.decoder_layers):
+            layer.checkpointing = mode == "layer"
+
+    def make_src_mask(self, src: torch.Tensor) -> torch.Tensor:
+        """源序列的填充掩码，形状 (batch, 1, 1, src_len)，True 表示真实 token。"""
+        return (src != self.pad_idx).unsqueeze(1).unsqueeze(2)
+
+    def make_tgt_mask(self, tgt: torch.Tensor) -> torch.Tensor:
+        """目标序列的填充掩码与因果掩码的组合，形状 (batch, 1, tgt_len, tgt_len)。"""
+        return (tgt != self.pad_idx).unsqueeze(1).unsqueeze(2) & make_causal_mask(tgt.size(1), tgt.device)
+
+    def _embed(self, embedding, tokens, start_pos=0, positions=None):
+        x = embedding(tokens) * math.sqrt(self.d_model)
+        if self.rotary:
+            # 位置信息在注意力里注入，这里只做 dropout
+            return self.positional_encoding.dropout(x)
+        return self.positional_encoding(x, start_pos, positions)
+
+    def encode(self, src: torch.Tensor, src_mask: torch.Tensor, cu_seqlens: torch.Tensor = None) -> torch.Tensor:
+        """
+        src 为 (batch, src_len) 的填充 token；传入 cu_seqlens 时 src 是打包后的一维 token 序列，
+        返回 (total_tokens, d_model) 的打包输出，src_mask 传 None 即可。
+        """
+        positions = packed_positions(cu_seqlens) if cu_seqlens is not None and not self.rotary else None
+        x = self._embed(self.encoder_embedding, src, positions=positions)
+        if self.checkpointing == "stack" and torch.is_grad_enabled():
+            return checkpoint(self._run_encoder_layers, x, src_mask, cu_seqlens, use_reentrant=False)
+        return self._run_encoder_layers(x, src_mask, cu_seqlens)
+
+    def _run_encoder_layers(self, x, src_mask, cu_seqlens):
+        for layer in self.encoder_layers:
+            x = layer(x, src_mask, cu_seqlens)
+        return x
+
+    def decode(self, tgt: torch.Tensor, memory: torch.Tensor, src_mask: torch.Tensor, tgt_mask=None,
+               caches=None, start_pos: int = 0) -> torch.Tensor:
+        """
+        返回目标位置上的词表 logits，形状 (batch, tgt_len, tgt_vocab_size)。
+        增量解码时 tgt 只包含新 token，start_pos 是它们在完整目标序列中的起始位置。
+        """
+        x = self._embed(self.decoder_embedding, tgt, start_pos)
+        if self.checkpointing == "stack" and caches is None and torch.is_grad_enabled():
+            x = checkpoint(self._run_decoder_layers, x, memory, src_mask, tgt_mask, use_reentrant=False)
+        else:
+            x = self._run_decoder_layers(x, memory, src_mask, tgt_mask, caches)
+        return self.fc(x)
+
+    def _run_decoder_layers(self, x, memory, src_mask, tgt_mask, caches=None):
+        for i, layer in enumerate(self.decoder_layers):
+            x = layer(x, memory, src_mask, tgt_mask, cache=caches[i] if caches is not None else None)
+        return x
+
+    def forward(self, src: torch.Tensor, tgt: torch.Tensor) -> torch.Tensor:
+        src_mask = self.make_src_mask(src)
+        memory = self.encode(src, src_mask)
+        return self.decode(tgt, memory, src_mask, self.make_tgt_mask(tgt))
@@ -0,0 +1,277 @@
+"""
+基于 chapter3.Transformer 的批量推理引擎: 贪心解码与束搜索(beam search)。
+
+- 动态组批: 请求先进入队列，按源序列长度排序后组批，长度相近的请求放在同一批，减少填充；
+  每批的大小受 max_batch_size 以及可选的 token 预算 max_batch_tokens(批大小 × 最长源序列长度)限制。
+- 提前移出: 某个序列生成了 EOS 或达到自己的 max_new_tokens 后立即从批中移除，
+  编码器输出、源掩码以及每一层的 KV 缓存都按剩余的行 index_select，后续步骤不再为它计算；
+  剩余请求的源序列都变短时，同时裁掉多余的填充列。
+- 增量解码: 每一步只把新 token 送入解码器，自注意力 K/V 逐步追加，编码器 K/V 只计算一次。
+
+用法:
+    engine = InferenceEngine(model, bos_idx=1, eos_idx=2)
+    outputs = engine.generate([[5, 6, 7], [8, 9]], max_new_tokens=32)
+    outputs = engine.generate(sources, max_new_tokens=32, method="beam", beam_size=4)
+"""
+import functools
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Sequence
+
+import torch
+
+from chapter3 import Transformer
+
+
+def select_cache_rows(caches: List[Dict[str, Any]], index: torch.Tensor, src_len: Optional[int] = None):
+    """
+    按 index 选出每一层 KV 缓存中的行(batch 维)，用于移除已完成的序列或束搜索时重排 beam。
+    src_len 不为 None 时同时把交叉注意力的 K/V 裁剪到前 src_len 个源位置。
+    """
+    for cache in caches:
+        for name, entry in cache.items():
+            for key in ("k", "v"):
+                if key in entry:
+                    tensor = entry[key].index_select(0, index)
+                    if name == "cross" and src_len is not None:
+                        tensor = tensor[:, :, :src_len]
+                    entry[key] = tensor
+
+
+def _in_eval_mode(method):
+    """解码期间把模型切换到 eval 模式(关闭 dropout)，结束后恢复调用方原来的 train/eval 状态。"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        was_training = self.model.training
+        self.model.eval()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            self.model.train(was_training)
+    return wrapper
+
+
+class InferenceEngine:
+    """
+    Transformer 的批量推理引擎。
+
+    参数:
+    - model (Transformer): 编码器-解码器模型；解码期间临时切换到 eval 模式，结束后恢复原来的模式。
+    - bos_idx / eos_idx (int): 目标序列的起始与结束 token。
+    - pad_idx (int): 源序列的填充 token，默认取 model.pad_idx。
+    - max_batch_size (int): 每批最多的请求数(束搜索时每个请求占 beam_size 行，按请求数计)。
+    - max_batch_tokens (int): 可选，每批的源 token 预算(批大小 × 最长源序列长度)，长输入自动组成小批。
+    - remove_finished (bool): 是否把已完成的序列提前移出批次；关闭时整批一直解码到最后一个序列完成(用于对比)。
+    """
+
+    def __init__(self, model: Transformer, bos_idx: int, eos_idx: int, pad_idx: int = None,
+                 max_batch_size: int = 32, max_batch_tokens: int = None, remove_finished: bool = True):
+        self.model = model
+        self.bos_idx = bos_idx
+        self.eos_idx = eos_idx
+        self.pad_idx = model.pad_idx if pad_idx is None else pad_idx
+        self.max_batch_size = max_batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.remove_finished = remove_finished
+        self.device = next(model.parameters()).device
+        self._queue: Deque[Dict[str, Any]] = deque()
+        self._next_id = 0
+        self.stats = {"batches": 0, "sequences": 0, "src_tokens": 0, "padded_src_tokens": 0,
+                      "decode_steps": 0, "decoded_rows": 0}
+
+    # --- 请求队列与组批 ---
+
+    def submit(self, src_tokens: Sequence[int], max_new_tokens: int = 64) -> int:
+        """提交一个请求，返回请求 id；调用 run 时统一组批解码。"""
+        if not src_tokens:
+            raise ValueError("源序列不能为空")
+        request_id = self._next_id
+        self._next_id += 1
+        self._queue.append({"id": request_id, "src": list(src_tokens), "max_new_tokens": max_new_tokens})
+        return request_id
+
+    def _next_batch(self) -> List[Dict[str, Any]]:
+        # 队列已按源序列长度降序排好，批内第一个请求最长，决定这一批的填充长度
+        batch = [self._queue.popleft()]
+        max_len = len(batch[0]["src"])
+        while self._queue and len(batch) < self.max_batch_size:
+            if self.max_batch_tokens and max_len * (len(batch) + 1) > self.max_batch_tokens:
+                break
+            batch.append(self._queue.popleft())
+        return batch
+
+    def run(self, method: str = "greedy", beam_size: int = 4, length_penalty: float = 1.0) -> Dict[int, List[int]]:
+        """
+        解码队列中的全部请求，返回 {请求 id: 生成的 token 列表(不含 BOS/EOS)}。
+        method 为 "greedy" 或 "beam"。
+        """
+        if method not in ("greedy", "beam"):
+            raise ValueError(f"未知的解码方式: {method}")
+        self._queue = deque(sorted(self._queue, key=lambda request: -len(request["src"])))
+        results = {}
+        while self._queue:
+            batch = self._next_batch()
+            sources = [request["src"] for request in batch]
+            limits = [request["max_new_tokens"] for request in batch]
+            if method == "greedy":
+                outputs = self.greedy(sources, limits)
+            else:
+                outputs = self.beam_search(sources, limits, beam_size, length_penalty)
+            for request, output in zip(batch, outputs):
+                results[request["id"]] = output
+        return results
+
+    def generate(self, sources: Sequence[Sequence[int]], max_new_tokens: int = 64, method: str = "greedy",
+                 beam_size: int = 4, length_penalty: float = 1.0) -> List[List[int]]:
+        """提交一组源序列并解码，按输入顺序返回生成结果。"""
+        ids = [self.submit(src, max_new_tokens) for src in sources]
+        results = self.run(method, beam_size, length_penalty)
+        return [results[request_id] for request_id in ids]
+
+    # --- 解码 ---
+
+    def _encode(self, sources: List[List[int]]):
+        max_len = max(len(src) for src in sources)
+        src = torch.full((len(sources), max_len), self.pad_idx, dtype=torch.long, device=self.device)
+        for row, tokens in enumerate(sources):
+            src[row, :len(tokens)] = torch.tensor(tokens, dtype=torch.long)
+        src_mask = self.model.make_src_mask(src)
+        self.stats["batches"] += 1
+        self.stats["sequences"] += len(sources)
+        self.stats["src_tokens"] += sum(len(tokens) for tokens in sources)
+        self.stats["padded_src_tokens"] += src.numel()
+        return self.model.encode(src, src_mask), src_mask
+
+    def _step(self, tokens, memory, src_mask, caches, step):
+        self.stats["decode_steps"] += 1
+        self.stats["decoded_rows"] += tokens.size(0)
+        logits = self.model.decode(tokens, memory, src_mask, caches=caches, start_pos=step)
+        return logits[:, -1]
+
+    @staticmethod
+    def _shrink(memory, src_mask, caches, index, src_lens):
+        # 只保留 index 中的行；剩余序列的源长度都变短时，顺便裁掉右侧多余的填充
+        src_len = int(src_lens.max())
+        if src_len == memory.size(1):
+            src_len = None
+        select_cache_rows(caches, index, src_len)
+        memory = memory.index_select(0, index)
+        src_mask = src_mask.index_select(0, index)
+        if src_len is not None:
+            memory, src_mask = memory[:, :src_len], src_mask[..., :src_len]
+        return memory, src_mask
+
+    @torch.no_grad()
+    @_in_eval_mode
+    def greedy(self, sources: List[List[int]], max_new_tokens: Sequence[int]) -> List[List[int]]:
+        """对一批源序列做贪心解码，max_new_tokens 是每个序列各自的生成上限。"""
+        memory, src_mask = self._encode(sources)
+        caches = [{} for _ in self.model.decoder_layers]
+        src_lens = torch.tensor([len(src) for src in sources], device=self.device)
+        alive = list(range(len(sources)))  # 批中每一行对应的原始序号
+        outputs = [[] for _ in sources]
+        finished = [False] * len(sources)
+        tokens = torch.full((len(sources), 1), self.bos_idx, dtype=torch.long, device=self.device)
+        for step in range(max(max_new_tokens)):
+            next_tokens = self._step(tokens, memory, src_mask, caches, step).argmax(dim=-1)
+            for row, token in enumerate(next_tokens.tolist()):
+                i = alive[row]
+                if finished[i]:
+                    continue
+                if token == self.eos_idx:
+                    finished[i] = True
+                    continue
+                outputs[i].append(token)
+                finished[i] = len(outputs[i]) >= max_new_tokens[i]
+            keep = [row for row, i in enumerate(alive) if not finished[i]]
+            if not keep:
+                break
+            if self.remove_finished and len(keep) < len(alive):
+                index = torch.tensor(keep, device=self.device)
+                alive = [alive[row] for row in keep]
+                src_lens = src_lens.index_select(0, index)
+                memory, src_mask = self._shrink(memory, src_mask, caches, index, src_lens)
+                next_tokens = next_tokens.index_select(0, index)
+            tokens = next_tokens.unsqueeze(1)
+        return outputs
+
+    @torch.no_grad()
+    @_in_eval_mode
+    def beam_search(self, sources: List[List[int]], max_new_tokens: Sequence[int], beam_size: int = 4,
+                    length_penalty: float = 1.0) -> List[List[int]]:
+        """
+        对一批源序列做束搜索，每个序列展开为 beam_size 行一起解码。
+        生成 EOS 的候选按 score / 长度^length_penalty 记为完成的假设；某个序列凑满 beam_size 个完成假设，
+        或达到 max_new_tokens 时即结束，它的所有行从批中移除。返回每个序列得分最高的假设。
+        """
+        memory, src_mask = self._encode(sources)
+        memory = memory.repeat_interleave(beam_size, dim=0)
+        src_mask = src_mask.repeat_interleave(beam_size, dim=0)
+        src_lens = torch.tensor([len(src) for src in sources], device=self.device).repeat_interleave(beam_size)
+        caches = [{} for _ in self.model.decoder_layers]
+        alive = list(range(len(sources)))
+        hypotheses: List[List[tuple]] = [[] for _ in sources]  # 每个序列已完成的 (归一化得分, token 列表)
+        done = [False] * len(sources)
+        # 第一步所有 beam 的输入相同，只保留第 0 个 beam，避免选出重复的候选
+        scores = torch.full((len(sources), beam_size), float("-inf"), device=self.device)
+        scores[:, 0] = 0.0
+        sequences = torch.full((len(sources) * beam_size, 0), self.bos_idx, dtype=torch.long, device=self.device)
+        tokens = torch.full((len(sources) * beam_size, 1), self.bos_idx, dtype=torch.long, device=self.device)
+        for step in range(max(max_new_tokens)):
+            log_probs = torch.log_softmax(self._step(tokens, memory, src_mask, caches, step).float(), dim=-1)
+            vocab_size = log_probs.size(-1)
+            candidates = (scores.unsqueeze(-1) + log_probs.view(len(alive), beam_size, vocab_size)).view(len(alive), -1)
+            # 取 2 倍 beam_size 个候选，保证去掉以 EOS 结尾的候选后仍有足够的 beam 继续扩展
+            top_scores, top_index = candidates.topk(2 * beam_size, dim=-1)
+            top_beams, top_tokens = (top_index // vocab_size).tolist(), (top_index % vocab_size).tolist()
+            top_scores = top_scores.tolist()
+
+            kept, rows, next_tokens, next_scores = [], [], [], []
+            for b, i in enumerate(alive):
+                if done[i]:
+                    # 只在不提前移出时出现: 已结束的序列继续占着原来的行陪跑，结果不再使用
+                    kept.append(b)
+                    rows.extend(range(b * beam_size, (b + 1) * beam_size))
+                    next_tokens.extend([self.eos_idx] * beam_size)
+                    next_scores.extend([float("-inf")] * beam_size)
+                    continue
+                chosen = []
+                for rank in range(2 * beam_size):
+                    score, beam, token = top_scores[b][rank], top_beams[b][rank], top_tokens[b][rank]
+                    if score == float("-inf"):
+                        break
+                    if token == self.eos_idx:
+                        if rank < beam_size:
+                            prefix = sequences[b * beam_size + beam].tolist()
+                            hypotheses[i].append((score / (step + 1) ** length_penalty, prefix))
+                        continue
+                    chosen.append((score, beam, token))
+                    if len(chosen) == beam_size:
+                        break
+                if step + 1 >= max_new_tokens[i]:
+                    for score, beam, token in chosen:
+                        prefix = sequences[b * beam_size + beam].tolist() + [token]
+                        hypotheses[i].append((score / (step + 1) ** length_penalty, prefix))
+                    chosen = []
+                if len(hypotheses[i]) >= beam_size or not chosen:
+                    done[i] = True
+                    if self.remove_finished:
+                        continue
+                    chosen = [(float("-inf"), 0, self.eos_idx)]
+                while len(chosen) < beam_size:
+                    chosen.append((float("-inf"), chosen[0][1], chosen[0][2]))
+                kept.append(b)
+                for score, beam, token in chosen:
+                    rows.append(b * beam_size + beam)
+                    next_tokens.append(token)
+                    next_scores.append(score)
+            if all(done[i] for i in alive):
+                break
+            alive = [alive[b] for b in kept]
+            index = torch.tensor(rows, device=self.device)
+            src_lens = src_lens.index_select(0, index)
+            memory, src_mask = self._shrink(memory, src_mask, caches, index, src_lens)
+            next_tokens = torch.tensor(next_tokens, dtype=torch.long, device=self.device)
+            sequences = torch.cat([sequences.index_select(0, index), next_tokens.unsqueeze(1)], dim=1)
+            scores = torch.tensor(next_scores, device=self.device).view(len(alive), beam_size)
+            tokens = next_tokens.unsqueeze(1)
+        return [max(hyps, key=lambda hyp: hyp[0])[1] if hyps else [] for hyps in hypotheses]
@@ -0,0 +1,152 @@
+"""
+chapter3 模型的 int8 动态量化推理模式。
+
+动态量化: 权重离线按输出通道对称量化为 int8；激活在每次前向时按行(每个 token)动态计算缩放因子量化为 int8，
+矩阵乘法在 int8 上完成并累加到 int32，再乘回两个缩放因子得到浮点输出。
+注意力的 softmax、层归一化、残差等仍用浮点计算，只替换线性层，因此一行调用即可转换已经构建好的模型:
+
+    from chapter3_quantization import quantize_dynamic_int8, measure_drift
+    qmodel = quantize_dynamic_int8(model)            # 返回量化后的副本，原模型不变
+    print(measure_drift(model, qmodel, src, tgt))    # 与 fp32 模型的输出偏差
+
+也可以直接运行，查看随机初始化(或加载 state_dict)的模型量化前后的偏差:
+    python -m chapter3_quantization --d-model 512 --layers 6
+    python -m chapter3_quantization --checkpoint model.pt --src-vocab 8000 --tgt-vocab 8000
+"""
+import argparse
+import copy
+from typing import Dict
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+from chapter3 import MultiHeadAttention, PositionWiseFeedForward, Transformer
+
+
+class Int8DynamicLinear(nn.Module):
+    """
+    nn.Linear 的 int8 动态量化版本，只用于推理。
+    权重保存为 int8(按输出通道一个缩放因子)，占用约为 fp32 的 1/4；
+    输出转换回输入的 dtype，可以直接替换模型中的 nn.Linear。
+    """
+
+    def __init__(self, in_features: int, out_features: int, bias: bool = True):
+        super().__init__()
+        self.in_features = in_features
+        self.out_features = out_features
+        # 以 (in, out) 的形状连续存放，正好是 torch._int_mm 需要的右矩阵
+        self.register_buffer("weight_int8", torch.zeros(in_features, out_features, dtype=torch.int8))
+        self.register_buffer("weight_scale", torch.ones(out_features))
+        self.register_buffer("bias", torch.zeros(out_features) if bias else None)
+
+    @classmethod
+    def from_float(cls, linear: nn.Linear) -> "Int8DynamicLinear":
+        module = cls(linear.in_features, linear.out_features, linear.bias is not None)
+        weight = linear.weight.detach().float()
+        scale = weight.abs().amax(dim=1).clamp(min=1e-8) / 127
+        module.weight_int8.copy_(torch.round(weight / scale.unsqueeze(1)).clamp(-127, 127).t())
+        module.weight_scale.copy_(scale)
+        if linear.bias is not None:
+            module.bias.copy_(linear.bias.detach().float())
+        return module.to(linear.weight.device)
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        shape = x.shape
+        x2d = x.reshape(-1, self.in_features).float()
+        if x2d.size(0) == 0:
+            return x.new_zeros(*shape[:-1], self.out_features)
+        # 每行一个缩放因子，把激活映射到 [-127, 127]；中间结果都是新张量，可以原地运算减少小算子的开销
+        x_scale = x2d.abs().amax(dim=1, keepdim=True).clamp_(min=1e-8).div_(127)
+        x_int8 = torch.div(x2d, x_scale).round_().to(torch.int8)
+        output = torch._int_mm(x_int8, self.weight_int8).float().mul_(x_scale).mul_(self.weight_scale)
+        if self.bias is not None:
+            output.add_(self.bias)
+        return output.to(x.dtype).reshape(*shape[:-1], self.out_features)
+
+    def extra_repr(self) -> str:
+        return f"in_features={self.in_features}, out_features={self.out_features}, bias={self.bias is not None}"
+
+
+def quantize_dynamic_int8(model: nn.Module, include_output_projection: bool = False,
+                          inplace: bool = False) -> nn.Module:
+    """
+    把模型中注意力(Wqkv/Wq/Wkv/Wo)与前馈网络(linear1/linear2)的 nn.Linear 换成 Int8DynamicLinear，返回 eval 模式的模型。
+
+    参数:
+    - model (nn.Module): Transformer、EncoderLayer/DecoderLayer 的列表或任何包含这些层的模块。
+    - include_output_projection (bool): 是否同时量化 Transformer 的词表输出层 fc；它直接决定 logits，默认保持 fp32。
+    - inplace (bool): 为 False 时先深拷贝，原模型保持不变，便于对比偏差。
+    """
+    if not inplace:
+        model = copy.deepcopy(model)
+    for parent in [module for module in model.modules() if isinstance(module, (MultiHeadAttention, PositionWiseFeedForward))]:
+        for name, child in list(parent.named_children()):
+            if isinstance(child, nn.Linear):
+                setattr(parent, name, Int8DynamicLinear.from_float(child))
+    if include_output_projection and isinstance(model, Transformer):
+        model.fc = Int8DynamicLinear.from_float(model.fc)
+    return model.eval()
+
+
+def model_size_bytes(model: nn.Module) -> int:
+    """参数与 buffer 占用的总字节数。"""
+    return sum(t.numel() * t.element_size() for t in list(model.parameters()) + list(model.buffers()))
+
+
+@torch.no_grad()
+def measure_drift(reference: nn.Module, quantized: nn.Module, *inputs) -> Dict[str, float]:
+    """
+    用同一组输入分别运行 fp32 模型与量化模型，返回输出偏差:
+    最大/平均绝对误差、相对 L2 误差、逐位置输出向量的最小余弦相似度，以及最后一维 argmax 的一致率(对 logits 即 top-1 一致率)。
+    两个模型都在 eval 模式下运行，结束后恢复调用方原来的 train/eval 状态。
+    """
+    modes = [(model, model.training) for model in (reference, quantized)]
+    try:
+        expected = reference.eval()(*inputs).float()
+        actual = quantized.eval()(*inputs).float()
+    finally:
+        for model, was_training in modes:
+            model.train(was_training)
+    diff = (expected - actual).abs()
+    cosine = F.cosine_similarity(expected.reshape(-1, expected.size(-1)), actual.reshape(-1, actual.size(-1)), dim=-1)
+    return {
+        "max_abs": diff.max().item(),
+        "mean_abs": diff.mean().item(),
+        "rel_l2": (torch.linalg.vector_norm(expected - actual) / torch.linalg.vector_norm(expected)).item(),
+        "min_cosine": cosine.min().item(),
+        "top1_agreement": (expected.argmax(-1) == actual.argmax(-1)).float().mean().item(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="int8 动态量化前后的输出偏差")
+    parser.add_argument("--checkpoint", help="Transformer 的 state_dict 文件，不提供时使用随机初始化的模型")
+    parser.add_argument("--src-vocab", type=int, default=1000)
+    parser.add_argument("--tgt-vocab", type=int, default=1000)
+    parser.add_argument("--d-model", type=int, default=512)
+    parser.add_argument("--heads", type=int, default=8)
+    parser.add_argument("--layers", type=int, default=6)
+    parser.add_argument("--d-ff", type=int, default=2048)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--seq-len", type=int, default=32)
+    parser.add_argument("--include-output-projection", action="store_true", help="同时量化词表输出层")
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+    model = Transformer(args.src_vocab, args.tgt_vocab, args.d_model, args.heads, args.layers, args.d_ff, dropout=0.0)
+    if args.checkpoint:
+        model.load_state_dict(torch.load(args.checkpoint, map_location="cpu"))
+    model.eval()
+    qmodel = quantize_dynamic_int8(model, include_output_projection=args.include_output_projection)
+    src = torch.randint(1, args.src_vocab, (args.batch_size, args.seq_len))
+    tgt = torch.randint(1, args.tgt_vocab, (args.batch_size, args.seq_len))
+    drift = measure_drift(model, qmodel, src, tgt)
+
+    print(f"模型大小: fp32 {model_size_bytes(model) / 2**20:.1f} MB -> int8 {model_size_bytes(qmodel) / 2**20:.1f} MB")
+    print(f"logits 偏差: 最大 {drift['max_abs']:.4f}，平均 {drift['mean_abs']:.4f}，相对 L2 {drift['rel_l2']:.2%}，"
+          f"最小余弦相似度 {drift['min_cosine']:.4f}，top-1 一致率 {drift['top1_agreement']:.2%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,55 +1,369 @@
+import asyncio
+import json
 import os
-from openai import OpenAI
+import re
+import weakref
 from dotenv import load_dotenv
-from typing import List, Dict
+from typing import Any, List, Dict, AsyncIterator, Optional, Callable
+
+from chapter4.llm_cache import ResponseCache
+from chapter4.llm_metrics import LLMMetrics, CallTimer
 
 # 加载 .env 文件中的环境变量
 load_dotenv()
 
 
+class _AsyncPool:
+    """
+    一个事件循环内共享的异步连接池:服务地址与连接设置相同的所有客户端复用一组 HTTP 长连接，
+    并通过信号量限制同时在途的请求数量。
+    """
+
+    def __init__(self, apiKey: str, baseUrl: str, timeout: int, max_concurrency: int):
+        import httpx
+        from openai import AsyncOpenAI
+        self.http_client = httpx.AsyncClient(
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency),
+        )
+        self.client = AsyncOpenAI(api_key=apiKey, base_url=baseUrl, timeout=timeout, http_client=self.http_client)
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def aclose(self):
+        await self.client.close()
+        await self.http_client.aclose()
+
+
+class ActionStopParser:
+    """
+    ReAct 格式输出的增量解析器，可作为 think(stop=...) 的参数:
+    一旦流中出现一行完整的 `Action: ...`(已换行，或 tool[...] / func(...) 的括号已闭合)就返回 True，
+    调用方据此提前关闭流，省下模型继续编造 Observation 或后续 Thought 的生成时间。
+    每次只扫描新到达的完整行和当前未完成的行；每次调用 think 都应该新建一个实例。
+
+    multi_action=True 时(并行 Action 模式)允许连续多行 Action，直到出现 Thought:/Observation: 等新段落
+    或 Finish 动作完成时才停止。
+    """
+    STOP_PREFIXES = ("Thought:", "Observation:", "Question:")
+
+    def __init__(self, multi_action: bool = False):
+        self.multi_action = multi_action
+        self._line_start = 0
+        self._actions = 0
+
+    BRACKETS = {"[": "]", "(": ")"}
+
+    @classmethod
+    def _closed(cls, body: str) -> bool:
+        """
+        判断 tool[input] 或 func(arg=...) 形式的动作是否已经闭合。
+        只看紧跟在动作名之后的那个括号: tool[...] 只能由配对的 ] 闭合，func(...) 只能由配对的 ) 闭合，
+        因此 Calculator[(1 + 2) 或 Finish[f(x) 这种参数内部的括号不会被误判为动作结束。
+        """
+        match = re.match(r"\w+\s*([\[(])", body)
+        if not match:
+            return False
+        left = match.group(1)
+        right = cls.BRACKETS[left]
+        return body.endswith(right) and body.count(left) == body.count(right)
+
+    def _action_ends_here(self, body: str) -> bool:
+        return not self.multi_action or body.lower().startswith("finish")
+
+    def __call__(self, text: str) -> bool:
+        # 1. 处理自上次调用以来新出现的完整行
+        while True:
+            newline = text.find("\n", self._line_start)
+            if newline == -1:
+                break
+            line = text[self._line_start:newline].strip()
+            self._line_start = newline + 1
+            if line.startswith("Action:"):
+                self._actions += 1
+                if self._action_ends_here(line[len("Action:"):].strip()):
+                    return True
+            elif self._actions and line.startswith(self.STOP_PREFIXES):
+                return True
+        # 2. 检查当前尚未换行的最后一行
+        partial = text[self._line_start:].strip()
+        if partial.startswith("Action:"):
+            body = partial[len("Action:"):].strip()
+            return self._closed(body) and self._action_ends_here(body)
+        return bool(self._actions) and partial.startswith(self.STOP_PREFIXES)
+
+
 class HelloAgentsLLM:
     """
     为本书 "Hello Agents" 定制的LLM客户端。
     它用于调用任何兼容OpenAI接口的服务，并默认使用流式响应。
+    除同步的 think 外，还提供 athink / astream 异步接口，
+    同一事件循环中服务地址、API 密钥、timeout 与 max_concurrency 都相同的实例共享连接池与并发上限；
+    任何一项不同都会使用独立的连接池，每个实例的设置总是以它自己的为准，不会被先创建的实例覆盖。
+    传入 cache 后，相同的 (模型, 消息, 采样参数) 调用直接从本地缓存回放。
+    每次调用的首 token 延迟、总耗时、分片数等指标会记录到 self.metrics 中。
     """
 
-    def __init__(self, model: str = None, apiKey: str = None, baseUrl: str = None, timeout: int = None):
+    # 事件循环 -> {(baseUrl, apiKey, timeout, max_concurrency): _AsyncPool}，事件循环结束后自动释放
+    _async_pools: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[tuple, _AsyncPool]]" = weakref.WeakKeyDictionary()
+
+    def __init__(self, model: str = None, apiKey: str = None, baseUrl: str = None, timeout: int = None,
+                 max_concurrency: int = None, cache: ResponseCache = None, metrics: LLMMetrics = None,
+                 include_usage: bool = False):
         """
         初始化客户端。优先使用传入参数，如果未提供，则从环境变量加载。
+
+        参数:
+        - max_concurrency (int): 异步接口允许同时进行的请求数，默认读取 LLM_MAX_CONCURRENCY 或 8。
+          该上限由设置完全相同的实例共同遵守；设置不同的实例各自计数。
+        - cache (ResponseCache): 可选的响应缓存，默认不启用。
+        - metrics (LLMMetrics): 调用指标聚合器，可在多个实例间共享；不传则为本实例新建一个。
+        - include_usage (bool): 是否请求服务端在流末尾返回 usage(需要服务端支持 stream_options)。
         """
         self.model = model or os.getenv("LLM_MODEL_ID")
-        apiKey = apiKey or os.getenv("LLM_API_KEY")
-        baseUrl = baseUrl or os.getenv("LLM_BASE_URL")
-        timeout = timeout or int(os.getenv("LLM_TIMEOUT", 60))
+        self.apiKey = apiKey or os.getenv("LLM_API_KEY")
+        self.baseUrl = baseUrl or os.getenv("LLM_BASE_URL")
+        self.timeout = timeout or int(os.getenv("LLM_TIMEOUT", 60))
+        self.max_concurrency = max_concurrency or int(os.getenv("LLM_MAX_CONCURRENCY", 8))
+        self.cache = cache
+        self.metrics = metrics or LLMMetrics()
+        self.include_usage = include_usage
 
-        if not all([self.model, apiKey, baseUrl]):
+        if not all([self.model, self.apiKey, self.baseUrl]):
             raise ValueError("模型ID、API密钥和服务地址必须被提供或在.env文件中定义。")
 
-        self.client = OpenAI(api_key=apiKey, base_url=baseUrl, timeout=timeout)
+        # openai SDK 导入较慢，到真正创建客户端时才导入，只用到本模块中解析器等工具的进程不必承担这部分开销
+        from openai import OpenAI
+        self.client = OpenAI(api_key=self.apiKey, base_url=self.baseUrl, timeout=self.timeout)
 
-    def think(self, messages: List[Dict[str, str]], temperature: float = 0) -> str:
+    def _request_kwargs(self, messages: List[Dict[str, str]], temperature: float) -> dict:
+        """构造同步与异步调用共用的请求参数。"""
+        kwargs = {
+            "model": self.model,
+            "messages": messages,
+            "temperature": temperature,
+            "stream": True,
+        }
+        if self.include_usage:
+            kwargs["stream_options"] = {"include_usage": True}
+        return kwargs
+
+    def _cache_key(self, messages: List[Dict[str, str]], temperature: float, early_stop: bool = False) -> Optional[str]:
+        """返回本次调用的缓存键；未启用缓存或该调用不可缓存时返回 None。提前截断的响应与完整响应分开缓存。"""
+        if self.cache is None or not self.cache.accepts(temperature):
+            return None
+        if early_stop:
+            return ResponseCache.make_key(self.model, messages, temperature=temperature, early_stop=True)
+        return ResponseCache.make_key(self.model, messages, temperature=temperature)
+
+    @staticmethod
+    def _chunk_content(chunk) -> str:
+        """从一个流式分片中取出增量文本。"""
+        if not chunk.choices:
+            return ""
+        return chunk.choices[0].delta.content or ""
+
+    def _iter_content(self, response, call: CallTimer):
+        """遍历同步流式响应，记录分片与 usage，产出增量文本。"""
+        for chunk in response:
+            if getattr(chunk, "usage", None):
+                call.usage(chunk.usage)
+            content = self._chunk_content(chunk)
+            call.chunk(content)
+            yield content
+
+    def think(self, messages: List[Dict[str, str]], temperature: float = 0,
+              stop: Callable[[str], bool] = None, echo: bool = True) -> str:
         """
         调用大语言模型进行思考，并返回其响应。
+        命中缓存时同样按流式打印的方式输出，调用方看到的内容与真实调用一致。
+        stop 是可选的停止判定函数(例如 ActionStopParser())，每收到一个分片就以目前累计的文本调用一次，
+        返回 True 时立即关闭流，返回已收到的内容。
+        echo=False 时不逐片打印流式内容，只打印整行的状态信息，多个线程同时调用时输出不会相互交错。
         """
         print(f"🧠 正在调用 {self.model} 模型...")
+        call = self.metrics.start(self.model, self.baseUrl, messages)
+        cached = None
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                temperature=temperature,
-                stream=True,
-            )
+            cache_key = self._cache_key(messages, temperature, early_stop=stop is not None)
+            cached = self.cache.get(cache_key) if cache_key else None
+            if cached is not None:
+                print("✅ 命中响应缓存:")
+                stream = [cached]
+                call.chunk(cached)
+            else:
+                response = self.client.chat.completions.create(**self._request_kwargs(messages, temperature))
+                print("✅ 大语言模型响应成功:")
+                stream = self._iter_content(response, call)
 
             # 处理流式响应
-            print("✅ 大语言模型响应成功:")
             collected_content = []
+            text_so_far = ""
+            for content in stream:
+                if echo:
+                    print(content, end="", flush=True)
+                collected_content.append(content)
+                if stop is not None and cached is None and content:
+                    text_so_far += content
+                    if stop(text_so_far):
+                        response.close()
+                        call.stopped_early()
+                        print("\n✂️ 已收到完整的 Action，提前结束生成" if echo else "✂️ 已收到完整的 Action，提前结束生成",
+                              end="" if echo else "\n")
+                        break
+            if echo:
+                print()  # 在流式输出结束后换行
+            response_text = "".join(collected_content)
+            if cache_key and cached is None:
+                self.cache.put(cache_key, response_text)
+            record = call.finish(cached=cached is not None)
+            if record["ttft_s"] is not None:
+                print(f"⏱️ 首 token {record['ttft_s']:.2f}s，总耗时 {record['latency_s']:.2f}s，共 {record['chunks']} 个分片")
+            return response_text
+
+        except Exception as e:
+            call.finish(error=e, cached=cached is not None)
+            print(f"❌ 调用LLM API时发生错误: {e}")
+            return None
+
+    def think_with_tools(self, messages: List[Dict[str, Any]], tools: List[Dict[str, Any]],
+                         temperature: float = 0) -> Optional[Dict[str, Any]]:
+        """
+        使用原生函数调用(function calling)请求模型，tools 为 OpenAI 兼容的工具 JSON Schema 列表。
+        流式地拼接文本与结构化的工具调用，返回 {"content": str, "tool_calls": [{"id", "name", "arguments"}]}，
+        其中 arguments 是模型给出的 JSON 字符串；出错时返回 None。
+        """
+        print(f"🧠 正在调用 {self.model} 模型(函数调用)...")
+        call = self.metrics.start(self.model, self.baseUrl, messages)
+        cached = None
+        try:
+            cache_key = None
+            if self.cache is not None and self.cache.accepts(temperature):
+                cache_key = ResponseCache.make_key(self.model, messages, temperature=temperature, tools=tools)
+            cached = self.cache.get(cache_key) if cache_key else None
+            if cached is not None:
+                print("✅ 命中响应缓存")
+                call.chunk(cached)
+                call.finish(cached=True)
+                return json.loads(cached)
+
+            kwargs = self._request_kwargs(messages, temperature)
+            kwargs["tools"] = tools
+            response = self.client.chat.completions.create(**kwargs)
+            print("✅ 大语言模型响应成功:")
+            content, tool_calls = [], {}
             for chunk in response:
-                content = chunk.choices[0].delta.content or ""
-                print(content, end="", flush=True)
+                if getattr(chunk, "usage", None):
+                    call.usage(chunk.usage)
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                if delta.content:
+                    print(delta.content, end="", flush=True)
+                    content.append(delta.content)
+                    call.chunk(delta.content)
+                # 同一个工具调用的 id、名称与参数分散在多个分片中，按 index 拼接
+                for tool_call in delta.tool_calls or []:
+                    entry = tool_calls.setdefault(tool_call.index, {"id": None, "name": "", "arguments": ""})
+                    if tool_call.id:
+                        entry["id"] = tool_call.id
+                    if tool_call.function is not None:
+                        entry["name"] += tool_call.function.name or ""
+                        entry["arguments"] += tool_call.function.arguments or ""
+                        call.chunk(tool_call.function.arguments or tool_call.function.name or "")
+            result = {"content": "".join(content), "tool_calls": [tool_calls[i] for i in sorted(tool_calls)]}
+            for tool_call in result["tool_calls"]:
+                print(f"\n🔧 {tool_call['name']}({tool_call['arguments']})", end="")
+            print()
+            if cache_key:
+                self.cache.put(cache_key, json.dumps(result, ensure_ascii=False))
+            record = call.finish()
+            if record["ttft_s"] is not None:
+                print(f"⏱️ 首 token {record['ttft_s']:.2f}s，总耗时 {record['latency_s']:.2f}s，共 {record['chunks']} 个分片")
+            return result
+
+        except Exception as e:
+            call.finish(error=e, cached=cached is not None)
+            print(f"❌ 调用LLM API时发生错误: {e}")
+            return None
+
+    def _get_async_pool(self) -> _AsyncPool:
+        """
+        获取当前事件循环中与本实例连接设置对应的共享连接池，不存在时创建。
+        timeout 与 max_concurrency 也是键的一部分，所以先创建的实例不会把自己的设置强加给后来的实例。
+        """
+        loop = asyncio.get_running_loop()
+        pools = self._async_pools.setdefault(loop, {})
+        key = (self.baseUrl, self.apiKey, self.timeout, self.max_concurrency)
+        if key not in pools:
+            pools[key] = _AsyncPool(self.apiKey, self.baseUrl, self.timeout, self.max_concurrency)
+        return pools[key]
+
+    async def astream(self, messages: List[Dict[str, str]], temperature: float = 0,
+                      stop: Callable[[str], bool] = None) -> AsyncIterator[str]:
+        """
+        异步流式调用大语言模型，逐个产出增量文本。
+        在整个流消费完成之前会一直占用一个并发名额；命中缓存时一次性产出缓存内容，不占用名额。
+        stop 的含义与 think 相同，判定为 True 后产出当前分片并关闭流。
+        """
+        call = self.metrics.start(self.model, self.baseUrl, messages)
+        cache_key = self._cache_key(messages, temperature, early_stop=stop is not None)
+        cached = self.cache.get(cache_key) if cache_key else None
+        if cached is not None:
+            call.chunk(cached)
+            call.finish(cached=True)
+            yield cached
+            return
+        pool = self._get_async_pool()
+        collected_content = []
+        text_so_far = ""
+        try:
+            async with pool.semaphore:
+                response = await pool.client.chat.completions.create(**self._request_kwargs(messages, temperature))
+                async for chunk in response:
+                    if getattr(chunk, "usage", None):
+                        call.usage(chunk.usage)
+                    content = self._chunk_content(chunk)
+                    if content:
+                        call.chunk(content)
+                        collected_content.append(content)
+                        yield content
+                        if stop is not None:
+                            text_so_far += content
+                            if stop(text_so_far):
+                                await response.close()
+                                call.stopped_early()
+                                break
+        except Exception as e:
+            call.finish(error=e)
+            raise
+        call.finish()
+        if cache_key:
+            self.cache.put(cache_key, "".join(collected_content))
+
+    async def athink(self, messages: List[Dict[str, str]], temperature: float = 0, echo: bool = False,
+                     stop: Callable[[str], bool] = None) -> Optional[str]:
+        """
+        think 的异步版本，返回完整响应，出错时返回 None。
+        多个调用并发时输出会相互交错，因此默认不打印流式内容，可通过 echo=True 打开。
+        """
+        print(f"🧠 正在异步调用 {self.model} 模型...")
+        try:
+            collected_content = []
+            async for content in self.astream(messages, temperature, stop=stop):
+                if echo:
+                    print(content, end="", flush=True)
                 collected_content.append(content)
-            print()  # 在流式输出结束后换行
+            if echo:
+                print()
             return "".join(collected_content)
 
         except Exception as e:
             print(f"❌ 调用LLM API时发生错误: {e}")
-            return None
\ No newline at end of file
+            return None
+
+    @classmethod
+    async def aclose(cls):
+        """关闭当前事件循环中的所有共享连接池，通常在 asyncio.run 的主协程结束前调用。"""
+        pools = cls._async_pools.pop(asyncio.get_running_loop(), {})
+        for pool in pools.values():
+            await pool.aclose()
@@ -1,5 +1,15 @@
-from typing import Dict, List, Any, Optional
+import difflib
+from typing import Callable, Dict, List, Any, Optional
 
+RECORD_HEADERS = {
+    "execution": "--- 上一轮尝试 (代码) ---",
+    "reflection": "--- 评审员反馈 ---",
+}
+COMPACTED_HEADERS = {
+    "execution": "--- 上一轮尝试 (已压缩，相对下一轮代码的差异) ---",
+    "reflection": "--- 评审员反馈 (已压缩) ---",
+}
+SEPARATOR = "\n\n"
 
 
 class Memory:
@@ -11,9 +21,32 @@ class Memory:
     add_record 方法负责向记忆中添加新的条目。
     get_trajectory 方法是核心，它将记忆轨迹“序列化”成一段文本，可以直接插入到后续的提示词中，为模型的反思和优化提供完整的上下文。
     get_last_execution 方便我们获取最新的“初稿”以供反思。
+
+    为了让提示词不随迭代次数无限增长：
+    - 轨迹文本在添加记录时增量拼接并缓存，get_trajectory 不再每次重新渲染全部记录；
+    - 每种类型最新的一条记录单独索引，get_last_execution 是 O(1) 的；
+    - 设置 max_bytes 后，轨迹超出预算时会从最早的记录开始压缩：
+      代码只保留相对下一轮代码的差异，反馈只保留摘要(默认截断到 summary_chars 个字符，也可以传入 summarizer，例如用 LLM 生成摘要)；
+      全部压缩后仍超出预算，则丢弃最早的记录。最近 keep_recent 条记录始终保持原样。
     """
-    def __init__(self):
+    def __init__(self, max_bytes: int = None, keep_recent: int = 2,
+                 summarizer: Callable[[str, str], str] = None, summary_chars: int = 200):
+        """
+        参数:
+        - max_bytes (int): 轨迹文本的字节预算(UTF-8)，None 表示不限制。
+        - keep_recent (int): 不参与压缩的最近记录数，默认保留最新的一组“代码 + 反馈”。
+        - summarizer (Callable): 可选，summarizer(record_type, content) 返回压缩后的文本，用于替代默认的差异/截断。
+        - summary_chars (int): 默认压缩反馈时保留的最大字符数。
+        """
         self.records: List[Dict[str, Any]] = []
+        self.max_bytes = max_bytes
+        self.keep_recent = keep_recent
+        self.summarizer = summarizer
+        self.summary_chars = summary_chars
+        self.dropped = 0
+        self._latest: Dict[str, Dict[str, Any]] = {}
+        self._trajectory = ""
+        self._trajectory_bytes = 0
 
     def add_record(self,record_type:str, content:str):
         """
@@ -23,28 +56,102 @@ class Memory:
         - record_type (str): 记录的类型 ('execution' 或 'reflection')。
         - content (str): 记录的具体内容 (例如，生成的代码或反思的反馈)。
         """
-        record = {"type":record_type, "content":content}
+        record = {"type":record_type, "content":content, "compacted": False}
         self.records.append(record)
+        self._latest[record_type] = record
+        self._append_rendered(self._render(record))
         print(f"📝 记忆已更新，新增一条 '{record_type}' 记录。")
 
-    def get_trajectory(self)-> str:
+        if self.max_bytes is not None and self._trajectory_bytes > self.max_bytes:
+            self._compact()
+
+    def get_trajectory(self, include_last: bool = True)-> str:
         """
         将所有记忆记录格式化为一个连贯的字符串文本，用于构建提示词。
+        include_last=False 时不包含最新的一条记录(调用方通常会把它单独放进提示词)。
         """
-        trajectory = []
-        for record in self.records:
-            if record["type"] == "execution":
-                trajectory.append(f"--- 上一轮尝试 (代码) ---\n{record['content']}")
-            elif record["type"] == "reflection":
-                trajectory.append(f"--- 评审员反馈 ---\n{record['content']}")
-        return "\n\n".join(trajectory)
+        last = self._render(self.records[-1]) if self.records else ""
+        if include_last or not last:
+            return self._trajectory
+        # 最新的记录从不压缩，渲染结果一定是缓存文本的后缀
+        return self._trajectory[:-len(last)].rstrip()
+
+    def get_last(self, record_type: str) -> Optional[str]:
+        """获取某种类型最新一条记录的原始内容，不存在则返回 None。"""
+        record = self._latest.get(record_type)
+        return record["content"] if record else None
 
     def get_last_execution(self) -> Optional[str]:
         """
         获取最近一次的执行结果 (例如，最新生成的代码)。
         如果不存在，则返回 None。
         """
-        for record in reversed(self.records):
-            if record["type"] == "execution":
-                return record["content"]
-        return None
\ No newline at end of file
+        return self.get_last("execution")
+
+    @staticmethod
+    def _render(record: Dict[str, Any]) -> str:
+        headers = COMPACTED_HEADERS if record["compacted"] else RECORD_HEADERS
+        header = headers.get(record["type"])
+        return f"{header}\n{record['content']}" if header else ""
+
+    def _append_rendered(self, text: str):
+        if not text:
+            return
+        if self._trajectory:
+            text = SEPARATOR + text
+        self._trajectory += text
+        self._trajectory_bytes += len(text.encode("utf-8"))
+
+    def _rebuild(self):
+        self._trajectory, self._trajectory_bytes = "", 0
+        if self.dropped:
+            self._append_rendered(f"--- (已省略更早的 {self.dropped} 条记录) ---")
+        for record in self.records:
+            self._append_rendered(self._render(record))
+
+    def _compact_content(self, index: int) -> str:
+        record = self.records[index]
+        if self.summarizer is not None:
+            # 摘要失败(返回空内容或 None)时保留原文，由 _compact 跳过这条记录
+            summary = self.summarizer(record["type"], record["content"])
+            return summary if summary and summary.strip() else record["content"]
+        if record["type"] == "execution":
+            # 与之后最近的一份代码比较；从最早的记录开始压缩，所以它一定还是原文
+            newer = next((r["content"] for r in self.records[index + 1:] if r["type"] == "execution"), None)
+            if newer is not None:
+                diff = difflib.unified_diff(record["content"].splitlines(), newer.splitlines(),
+                                            "本轮", "下一轮", lineterm="", n=1)
+                return "\n".join(diff) or "(与下一轮代码相同)"
+        content = record["content"]
+        return content if len(content) <= self.summary_chars else content[:self.summary_chars] + " ..."
+
+    def _compact(self):
+        """从最早的记录开始压缩，直到轨迹回到预算之内；压缩完成后整体重新渲染一次。"""
+        compacted = 0
+        for index in range(max(0, len(self.records) - self.keep_recent)):
+            record = self.records[index]
+            # 已压缩的记录和各类型最新的记录(get_last 需要原文)不参与压缩
+            if record["compacted"] or self._latest.get(record["type"]) is record:
+                continue
+            summary = self._compact_content(index)
+            if len(summary) >= len(record["content"]):
+                continue
+            old_bytes = len(self._render(record).encode("utf-8"))
+            record["content"], record["compacted"] = summary, True
+            self._trajectory_bytes += len(self._render(record).encode("utf-8")) - old_bytes
+            compacted += 1
+            if self._trajectory_bytes <= self.max_bytes:
+                break
+        if compacted:
+            self._rebuild()
+
+        dropped = 0
+        while (self._trajectory_bytes > self.max_bytes and len(self.records) > self.keep_recent
+               and self._latest.get(self.records[0]["type"]) is not self.records[0]):
+            self.records.pop(0)
+            self.dropped += 1
+            dropped += 1
+            self._rebuild()
+
+        if compacted or dropped:
+            print(f"🗜️ 记忆超出 {self.max_bytes} 字节预算，已压缩 {compacted} 条、丢弃 {dropped} 条较早的记录。")
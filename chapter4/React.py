@@ -1,6 +1,8 @@
+import json
 import re
-from chapter4.LLM_client import HelloAgentsLLM
+from chapter4.LLM_client import HelloAgentsLLM, ActionStopParser
 from chapter4.ToolExecutor import ToolExecutor, search,calculator
+from chapter4.tool_cache import CachePolicy
 
 
 # (此处省略 REACT_PROMPT_TEMPLATE 的定义)
@@ -26,35 +28,93 @@ Question: {question}
 History: {history}
 """
 
+# messages 模式下首条消息中 History 一栏的固定内容，真实历史以对话消息的形式追加
+MESSAGES_HISTORY_NOTE = "(见后续对话中的 Action 与 Observation)"
+NO_OBSERVATION_NOTE = "Observation: 本轮没有执行任何工具，请按格式输出 Action。"
+
+# 并行模式下追加在工具列表之后的说明
+PARALLEL_ACTIONS_HINT = """
+如果需要多个互不依赖的工具调用(例如同时计算几个独立的表达式)，可以在同一轮中输出多行 Action，每行一个 `{tool_name}[{tool_input}]`，它们会被并行执行：
+Action: tool_a[输入1]
+Action: tool_b[输入2]
+"""
+
+# function_calling 模式的系统提示: 工具通过 tools 参数以 JSON Schema 提供，不再需要文本格式约定
+FUNCTION_CALLING_PROMPT_TEMPLATE = """
+你是一个严谨的数学助手。
+对于任何涉及精确数值、分数、大整数（>100位）、符号化简、方程求解、级数、矩阵等问题，你自己绝对不能直接计算，必须调用工具 Calculator。
+即使你觉得很简单，也必须调用工具验证。
+只有工具返回结果后，你才能给出最终答案。
+需要工具时直接调用提供的函数；多个互不依赖的调用可以在同一轮中同时发出，它们会被并行执行。
+当你收集到足够的信息后，不要再调用函数，直接用文字给出最终答案。
+"""
+NO_TOOL_CALL_NOTE = "你既没有调用函数也没有给出答案，请调用函数或直接给出最终答案。"
+
 
 class ReActAgent:
-    def __init__(self, llm_client: HelloAgentsLLM, tool_executor: ToolExecutor, max_steps: int = 10):
+    # 各模式使用的提示词；react.py 中的通用智能体继承本类，只替换这几个属性和 run 中 Finish 的处理
+    react_prompt = REACT_PROMPT_TEMPLATE
+    parallel_actions_hint = PARALLEL_ACTIONS_HINT
+    function_calling_prompt = FUNCTION_CALLING_PROMPT_TEMPLATE
+
+    def __init__(self, llm_client: HelloAgentsLLM, tool_executor: ToolExecutor, max_steps: int = 10,
+                 parallel_actions: bool = False, max_parallel_actions: int = 4, prompt_mode: str = "text",
+                 early_stop: bool = False):
+        """
+        参数:
+        - parallel_actions (bool): 为 True 时允许模型在一步中输出多行 Action，这些工具调用会并行执行。
+        - max_parallel_actions (int): 并行模式下同时执行的工具调用数上限。
+        - prompt_mode (str): "text" 每步重新渲染完整提示词；"messages" 使用前缀稳定的多轮消息，每步只追加新内容；
+          "function_calling" 把工具以 JSON Schema 传给服务端，使用模型返回的结构化工具调用，不再用正则解析 Action。
+        - early_stop (bool): 为 True 时一旦流中出现完整的 Action 就停止生成，不再等待模型输出多余内容(function_calling 模式不适用)；
+          默认关闭，保持完整读取模型输出的原有行为。
+        """
+        if prompt_mode not in ("text", "messages", "function_calling"):
+            raise ValueError(f"未知的 prompt_mode: {prompt_mode}")
         self.llm_client = llm_client
         self.tool_executor = tool_executor
         self.max_steps = max_steps
+        self.parallel_actions = parallel_actions
+        self.max_parallel_actions = max_parallel_actions
+        self.prompt_mode = prompt_mode
+        self.early_stop = early_stop
         self.history = []
+        self.prompt_stats = []  # 每步提示词的字节数及新增字节数
+        self.run_stats = {}  # 本次运行的步数、工具调用数与解析失败次数
 
     def run(self, question: str):
         self.history = []
+        self.prompt_stats = []
+        self.run_stats = {"mode": self.prompt_mode, "steps": 0, "tool_calls": 0, "parse_failures": 0}
+        if self.prompt_mode == "function_calling":
+            return self._run_function_calling(question)
         current_step = 0
+        tools_desc = self.tool_executor.getAvailableTools()
+        if self.parallel_actions:
+            tools_desc += "\n" + self.parallel_actions_hint
+        conversation = []
+        response_text = None
+        history_mark = 0
 
         while current_step < self.max_steps:
             current_step += 1
+            self.run_stats["steps"] = current_step
             print(f"\n--- 第 {current_step} 步 ---")
 
-            tools_desc = self.tool_executor.getAvailableTools()
-            history_str = "\n".join(self.history)
-            prompt = REACT_PROMPT_TEMPLATE.format(tools=tools_desc, question=question, history=history_str)
+            messages = self._build_messages(question, tools_desc, conversation, response_text, self.history[history_mark:])
+            history_mark = len(self.history)
+            self._record_prompt_size(current_step, messages)
 
-            messages = [{"role": "user", "content": prompt}]
-            response_text = self.llm_client.think(messages=messages)
+            response_text = self._think(messages)
             if not response_text:
                 print("错误：LLM未能返回有效响应。")
                 break
 
             thought, action = self._parse_output(response_text)
             if thought: print(f"🤔 思考: {thought}")
-            if not action: print("警告：未能解析出有效的Action，流程终止。"); break
+            if not action:
+                self.run_stats["parse_failures"] += 1
+                print("警告：未能解析出有效的Action，流程终止。"); break
 
             if action.startswith("Finish"):
 
@@ -68,8 +128,8 @@ class ReActAgent:
                     if any(keyword in thought for keyword in planning_keywords):
                         is_plan = True
 
-                # 尝试从 Finish[] 括号中获取答案
-                match = re.match(r"Finish\[(.*)\]", action, re.DOTALL)
+                # 尝试从 Finish[] 括号中获取答案；右括号缺失(例如输出被截断)时取左括号之后的全部内容
+                match = re.match(r"Finish\[(.*?)\]?\s*$", action, re.DOTALL)
                 answer_in_bracket = match.group(1).strip() if match else ""
 
                 # 逻辑判断：
@@ -95,22 +155,147 @@ class ReActAgent:
                     self.history.append(f"Observation: {observation}")
                     continue  # 继续下一次循环，而不是 break
 
-            tool_name, tool_input = self._parse_action(action)
-            if not tool_name or not tool_input:
-                self.history.append("Observation: 无效的Action格式，请检查。")
+            # 并行模式下收集本轮所有工具调用，一起执行后再把观察结果按顺序写入历史
+            actions = self._parse_actions(response_text) if self.parallel_actions else [action]
+            calls = []
+            for act in actions:
+                if act.startswith("Finish"):
+                    continue  # 与工具调用同时出现的 Finish 留到拿到观察结果之后的下一轮
+                tool_name, tool_input = self._parse_action(act)
+                if not tool_name or not tool_input:
+                    self.run_stats["parse_failures"] += 1
+                    self.history.append("Observation: 无效的Action格式，请检查。")
+                    continue
+                print(f"🎬 行动: {tool_name}[{tool_input}]")
+                calls.append((act, tool_name, tool_input))
+
+            self.run_stats["tool_calls"] += len(calls)
+            observations = self.tool_executor.execute_parallel(
+                [(tool_name, tool_input) for _, tool_name, tool_input in calls],
+                max_workers=self.max_parallel_actions,
+            )
+            for (act, _, _), observation in zip(calls, observations):
+                print(f"👀 观察: {observation}")
+                self.history.append(f"Action: {act}")
+                self.history.append(f"Observation: {observation}")
+
+        print("已达到最大步数，流程终止。")
+        return None
+
+    def _run_function_calling(self, question: str):
+        """
+        原生函数调用模式: 工具以 JSON Schema 提供，模型返回结构化的 tool_calls，
+        同一轮的多个调用并行执行，结果作为 tool 消息追加；模型不再调用函数时，其文本回复即为最终答案。
+        """
+        schemas = self.tool_executor.get_tool_schemas()
+        schema_bytes = len(json.dumps(schemas, ensure_ascii=False).encode("utf-8"))
+        messages = [
+            {"role": "system", "content": self.function_calling_prompt},
+            {"role": "user", "content": question},
+        ]
+        for current_step in range(1, self.max_steps + 1):
+            self.run_stats["steps"] = current_step
+            print(f"\n--- 第 {current_step} 步 ---")
+            self._record_prompt_size(current_step, messages, extra_bytes=schema_bytes)
+
+            result = self.llm_client.think_with_tools(list(messages), schemas)
+            if result is None:
+                print("错误：LLM未能返回有效响应。")
+                break
+            if not result["tool_calls"]:
+                answer = result["content"].strip()
+                if answer:
+                    print(f"✅ 最终答案: {answer}")
+                    return answer
+                self.run_stats["parse_failures"] += 1
+                messages.append({"role": "user", "content": NO_TOOL_CALL_NOTE})
                 continue
 
-            print(f"🎬 行动: {tool_name}[{tool_input}]")
-            tool_function = self.tool_executor.get_tool(tool_name)
-            observation = tool_function(tool_input) if tool_function else f"错误：未找到名为 '{tool_name}' 的工具。"
+            # 部分服务端不返回调用 id，此时按步数与序号补一个，保证 tool 消息能与调用一一对应
+            for index, tool_call in enumerate(result["tool_calls"]):
+                tool_call["id"] = tool_call["id"] or f"call_{current_step}_{index}"
+            messages.append({
+                "role": "assistant",
+                "content": result["content"] or None,
+                "tool_calls": [{"id": tool_call["id"], "type": "function",
+                                "function": {"name": tool_call["name"], "arguments": tool_call["arguments"]}}
+                               for tool_call in result["tool_calls"]],
+            })
+            # 观察结果按调用的序号保存，即使 id 重复也不会相互覆盖
+            observations = [None] * len(result["tool_calls"])
+            calls = []
+            for index, tool_call in enumerate(result["tool_calls"]):
+                tool_input = self._parse_tool_arguments(tool_call["arguments"])
+                if tool_input is None:
+                    self.run_stats["parse_failures"] += 1
+                    observations[index] = f"错误: 无法解析函数参数 {tool_call['arguments']}，请以 {{\"input\": \"...\"}} 的形式调用。"
+                    continue
+                print(f"🎬 行动: {tool_call['name']}[{tool_input}]")
+                calls.append((index, tool_call, tool_input))
 
-            print(f"👀 观察: {observation}")
-            self.history.append(f"Action: {action}")
-            self.history.append(f"Observation: {observation}")
+            self.run_stats["tool_calls"] += len(calls)
+            results = self.tool_executor.execute_parallel(
+                [(tool_call["name"], tool_input) for _, tool_call, tool_input in calls],
+                max_workers=self.max_parallel_actions,
+            )
+            for (index, tool_call, tool_input), observation in zip(calls, results):
+                observations[index] = observation
+                self.history.append(f"Action: {tool_call['name']}[{tool_input}]")
+                self.history.append(f"Observation: {observation}")
+            for tool_call, observation in zip(result["tool_calls"], observations):
+                print(f"👀 观察: {observation}")
+                messages.append({"role": "tool", "tool_call_id": tool_call["id"], "content": observation})
 
         print("已达到最大步数，流程终止。")
         return None
 
+    @staticmethod
+    def _parse_tool_arguments(arguments: str):
+        """从函数调用的 JSON 参数中取出工具输入；只有一个参数时不要求参数名必须是 input，无法解析时返回 None。"""
+        try:
+            parsed = json.loads(arguments or "{}")
+        except json.JSONDecodeError:
+            return None
+        if isinstance(parsed, dict):
+            value = parsed.get("input", next(iter(parsed.values())) if len(parsed) == 1 else None)
+        else:
+            value = parsed
+        return str(value) if value not in (None, "") else None
+
+    def _build_messages(self, question: str, tools_desc: str, conversation: list, last_response: str, new_entries: list):
+        """
+        text 模式每步重新渲染完整模板；messages 模式保持首条消息逐字节不变，只追加上一轮的 assistant 输出与 Observation。
+        """
+        if self.prompt_mode != "messages":
+            prompt = self.react_prompt.format(tools=tools_desc, question=question, history="\n".join(self.history))
+            return [{"role": "user", "content": prompt}]
+        if not conversation:
+            # 问题已经包含在首条消息的模板中，不再单独发送一条 Question 消息
+            first_prompt = self.react_prompt.format(tools=tools_desc, question=question, history=MESSAGES_HISTORY_NOTE)
+            conversation.append({"role": "user", "content": first_prompt})
+        else:
+            observations = [entry for entry in new_entries if entry.startswith("Observation")]
+            conversation.append({"role": "assistant", "content": last_response})
+            conversation.append({"role": "user", "content": "\n".join(observations) or NO_OBSERVATION_NOTE})
+        return list(conversation)
+
+    def _think(self, messages: list):
+        """调用LLM；开启 early_stop 时传入新的 ActionStopParser，拿到完整的 Action 后即关闭流。"""
+        if self.early_stop:
+            return self.llm_client.think(messages=messages, stop=ActionStopParser(multi_action=self.parallel_actions))
+        return self.llm_client.think(messages=messages)
+
+    def _record_prompt_size(self, step: int, messages: list, extra_bytes: int = 0):
+        prompt_bytes = extra_bytes + sum(
+            len((message.get("content") or "").encode("utf-8"))
+            + (len(json.dumps(message["tool_calls"], ensure_ascii=False).encode("utf-8")) if message.get("tool_calls") else 0)
+            for message in messages
+        )
+        previous = self.prompt_stats[-1]["prompt_bytes"] if self.prompt_stats else 0
+        self.prompt_stats.append({"step": step, "prompt_bytes": prompt_bytes, "added_bytes": prompt_bytes - previous})
+        print(f"📏 提示词 {prompt_bytes} 字节，本步新增 {prompt_bytes - previous} 字节")
+
+    #LLM 返回的是纯文本，我们需要从中精确地提取出Thought和Action。这是通过几个辅助解析函数完成的，它们通常使用正则表达式来实现。
     def _parse_output(self, text: str):
         thought_match = re.search(r"Thought: (.*)", text)
         action_match = re.search(r"Action: (.*)", text)
@@ -118,6 +303,9 @@ class ReActAgent:
         action = action_match.group(1).strip() if action_match else None
         return thought, action
 
+    def _parse_actions(self, text: str):
+        return [action.strip() for action in re.findall(r"Action: (.*)", text) if action.strip()]
+
     def _parse_action(self, action_text: str):
         match = re.match(r"(\w+)\[(.*)\]", action_text)
         return (match.group(1), match.group(2)) if match else (None, None)
@@ -131,9 +319,9 @@ if __name__ == '__main__':
     llm = HelloAgentsLLM()
     tool_executor = ToolExecutor()
     search_desc = "一个网页搜索引擎。当你需要回答关于时事、事实以及在你的知识库中找不到的信息时，应使用此工具。"
-    tool_executor.register_tool("Search", search_desc, search)
+    tool_executor.register_tool("Search", search_desc, search, CachePolicy(ttl=600, cache_if=lambda r: "错误" not in r))
     cal_desc = "当遇到任何需要精确计算的数学问题时必须调用此工具，尤其是大整数、分数、高精度、符号化简、方程求解、级数求和、矩阵特征值等。大模型自己计算会出错或丢失精度。输入任意数学表达式或自然语言数学题都可以。"
-    tool_executor.register_tool("Calculator", cal_desc, calculator)
+    tool_executor.register_tool("Calculator", cal_desc, calculator, CachePolicy(ttl=None))
     agent = ReActAgent(llm_client=llm, tool_executor=tool_executor)
     question = "(2^1024 + 2^1000 - 2^995) × (2^2048 - 1) ÷ 2^500 的精确整数结果是多少？"
     agent.run(question)
\ No newline at end of file
@@ -1,5 +1,8 @@
-from LLM_client import HelloAgentsLLM
-from Memory import Memory
+from concurrent.futures import ThreadPoolExecutor
+
+from chapter4.LLM_client import HelloAgentsLLM
+from chapter4.Memory import Memory
+from chapter4.code_runner import CodeRunner, extract_code
 INITIAL_PROMPT_TEMPLATE = """
 你是一位资深的Python程序员。请根据以下要求，编写一个Python函数。
 你的代码必须包含完整的函数签名、文档字符串，并遵循PEP 8编码规范。
@@ -14,7 +17,7 @@ REFLECT_PROMPT_TEMPLATE = """
 
 # 原始任务:
 {task}
-
+{history}
 # 待审查的代码:
 ```python
 {code}
@@ -42,25 +45,114 @@ REFINE_PROMPT_TEMPLATE = """
 你的代码必须包含完整的函数签名、文档字符串，并遵循PEP 8编码规范。
 请直接输出优化后的代码，不要包含任何额外的解释。
 """
+
+BENCHMARK_PROMPT_TEMPLATE = """
+# 实测结果:
+以下是在测试输入上实际运行代码得到的耗时(每个输入取 {repeat} 次中的最短时间，再求和)，请以此为准评估性能：
+{timings}
+"""
+
+# 反思提示词中的历史部分，只在设置了记忆字节预算时加入
+REFLECT_HISTORY_TEMPLATE = """
+# 之前的尝试与评审记录(较早的记录可能已被压缩):
+{trajectory}
+"""
+
+SUMMARIZE_PROMPT_TEMPLATE = """
+请把下面这段{kind}压缩成不超过三句话的要点，保留关键结论和改进方向，直接输出要点：
+
+{content}
+"""
 class ReflectionAgent:
-    def __init__(self,llm_client,max_iterations=3):
+    def __init__(self,llm_client,max_iterations=3,memory_max_bytes=4096,llm_summaries=False,
+                 num_candidates=1,code_runner:CodeRunner=None,candidate_temperature=0.7):
+        """
+        参数:
+        - memory_max_bytes (int): 记忆轨迹的字节预算(默认 4096)，超出后压缩较早的代码与反馈。
+          除最新代码外的轨迹会写入每一轮的反思提示词，预算保证提示词不随迭代次数增长；
+          None 表示不限制轨迹大小，此时反思提示词不包含历史，只审查最新的代码。
+        - llm_summaries (bool): 压缩时是否调用 LLM 生成摘要；默认代码保留差异、反馈直接截断，摘要为空时保留原文。
+        - num_candidates (int): 启用实测模式时，每轮优化并行生成的候选代码数。
+        - code_runner (CodeRunner): 提供后启用实测模式: 每个候选都在单独的子进程中用测试输入运行并计时，
+          只把最快且正确的候选记入记忆，实测耗时会写入下一轮的反思提示词。
+        - candidate_temperature (float): 生成多个候选时使用的采样温度。
+        """
         self.llm_client = llm_client
         self.max_iterations = max_iterations
-        self.memory = Memory()
-
-    def _get_llm_response(self, prompt: str) -> str:
+        self.num_candidates = num_candidates
+        self.code_runner = code_runner
+        self.candidate_temperature = candidate_temperature
+        self.timings = []
+        self.memory = Memory(max_bytes=memory_max_bytes,
+                             summarizer=self._summarize if llm_summaries else None)
+
+    def _summarize(self, record_type: str, content: str) -> str:
+        kind = "代码" if record_type == "execution" else "评审反馈"
+        return self._get_llm_response(SUMMARIZE_PROMPT_TEMPLATE.format(kind=kind, content=content))
+
+    def _get_llm_response(self, prompt: str, temperature: float = 0) -> str:
         """一个辅助方法，用于调用LLM并获取完整的流式响应。"""
         messages = [{"role": "user", "content": prompt}]
-        response_text = self.llm_client.think(messages=messages) or ""
+        response_text = self.llm_client.think(messages=messages, temperature=temperature) or ""
         return response_text
 
+    def _generate_candidates(self, prompt: str) -> list:
+        """并行生成 num_candidates 份候选代码。"""
+        if self.num_candidates <= 1 or self.code_runner is None:
+            return [self._get_llm_response(prompt)]
+        with ThreadPoolExecutor(max_workers=self.num_candidates) as pool:
+            return list(pool.map(lambda _: self._get_llm_response(prompt, self.candidate_temperature),
+                                 range(self.num_candidates)))
+
+    def _benchmark_prompt(self) -> str:
+        """把迄今为止保留下来的各版本实测耗时整理成提示词片段。"""
+        if not self.timings:
+            return ""
+        lines = [f"- {label}: {seconds * 1000:.3f} ms" for label, seconds in self.timings]
+        return BENCHMARK_PROMPT_TEMPLATE.format(repeat=self.code_runner.repeat, timings="\n".join(lines))
+
+    def _select_candidate(self, candidates: list, current: dict):
+        """
+        实测所有候选，返回 (最快的正确候选代码, 它的实测结果)。
+        正确性以 CodeRunner 的期望输出为准，没有期望输出时以当前版本的输出为参考。
+        没有正确候选或最快的候选不比当前版本快时返回 (None, None)；
+        既没有期望输出、当前版本也没能跑通时无法判断正确性，不做选择，同样返回 (None, None)。
+        """
+        if self.code_runner.expected_outputs is None and not (current and current["ok"]):
+            print("⚠️ 没有期望输出，当前版本也未能跑通，无法验证候选的正确性，保留当前版本。")
+            return None, None
+        results = self.code_runner.evaluate(candidates, reference_outputs=current["outputs"] if current else None)
+        for i, result in enumerate(results):
+            status = f"{result['seconds'] * 1000:.3f} ms" if result["correct"] else f"❌ {result['error']}"
+            print(f"   候选 {i + 1}: {status}")
+        best = CodeRunner.fastest(results)
+        if best is None:
+            print("⚠️ 没有通过测试的候选，保留当前版本。")
+            return None, None
+        if current and current["correct"] and results[best]["seconds"] >= current["seconds"]:
+            print(f"⚠️ 最快的候选({results[best]['seconds'] * 1000:.3f} ms)没有比当前版本"
+                  f"({current['seconds'] * 1000:.3f} ms)更快，保留当前版本。")
+            return None, None
+        print(f"🏁 选中候选 {best + 1}。")
+        return extract_code(candidates[best]), results[best]
+
     def run(self,task:str):
         print(f"\n--- 开始处理任务 ---\n任务: {task}")
+        self.timings = []
 
         # --- 1. 初始执行 ---
         print("\n--- 正在进行初始尝试 ---")
         initial_prompt = INITIAL_PROMPT_TEMPLATE.format(task=task)
         initial_code = self._get_llm_response(initial_prompt)
+        current = None
+        if self.code_runner is not None:
+            initial_code = extract_code(initial_code)
+            current = self.code_runner.evaluate([initial_code])[0]
+            if current["correct"]:
+                self.timings.append(("初始版本", current["seconds"]))
+                print(f"⏱️ 初始版本实测耗时: {current['seconds'] * 1000:.3f} ms")
+            else:
+                print(f"⚠️ 初始版本未通过测试: {current['error']}")
         self.memory.add_record("execution",initial_code)
 
         #2.循环迭代
@@ -70,7 +162,11 @@ class ReflectionAgent:
             # a. 反思
             print("\n-> 正在进行反思...")
             last_code = self.memory.get_last_execution()
-            reflect_prompt = REFLECT_PROMPT_TEMPLATE.format(task=task,code=last_code)
+            trajectory = self.memory.get_trajectory(include_last=False) if self.memory.max_bytes is not None else ""
+            history = REFLECT_HISTORY_TEMPLATE.format(trajectory=trajectory) if trajectory else ""
+            reflect_prompt = REFLECT_PROMPT_TEMPLATE.format(task=task,history=history,code=last_code)
+            if self.code_runner is not None:
+                reflect_prompt += self._benchmark_prompt()
             feedback = self._get_llm_response(reflect_prompt)
             self.memory.add_record("reflection",feedback)
 
@@ -81,7 +177,16 @@ class ReflectionAgent:
 
             #c.优化
             refine_prompt = REFINE_PROMPT_TEMPLATE.format(task=task,last_code_attempt=last_code,feedback=feedback)
-            refined_code = self._get_llm_response(refine_prompt)
+            candidates = self._generate_candidates(refine_prompt)
+            if self.code_runner is None:
+                refined_code = candidates[0]
+            else:
+                print(f"\n-> 正在实测 {len(candidates)} 个候选...")
+                refined_code, result = self._select_candidate(candidates, current)
+                if refined_code is None:
+                    break
+                current = result
+                self.timings.append((f"第 {i + 1} 轮优化", result["seconds"]))
             self.memory.add_record("execution",refined_code)
 
         final_code = self.memory.get_last_execution()
@@ -91,6 +196,9 @@ class ReflectionAgent:
 if __name__ == "__main__":
     llm = HelloAgentsLLM()
     reflection_agent = ReflectionAgent(llm)
+    # 实测模式: 每轮并行生成 4 个候选，在单独的子进程中用测试输入验证并计时，只保留最快的正确版本
+    # runner = CodeRunner(test_inputs=[(10,), (10000,)], func_name="find_primes")  # 未给期望输出时以初始版本的输出为准
+    # reflection_agent = ReflectionAgent(llm, num_candidates=4, code_runner=runner)
     code = reflection_agent.run("编写一个Python函数，找出1到n之间所有的素数 (prime numbers)。")
     print(f"最终代码")
     print(code)
@@ -1,47 +1,171 @@
+import importlib
 import os
-from typing import Dict, Any, Callable
-import requests
-from dotenv import load_dotenv
-from serpapi import SerpApiClient
-load_dotenv()
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Dict, Any, Callable, List, Tuple, Union
+
+from chapter4.http_transport import get_transport
+from chapter4.query_cache import get_search_cache
+from chapter4.tool_cache import CachePolicy, ToolCache
+
+SERPAPI_URL = "https://serpapi.com/search"
+WOLFRAM_URL = "http://api.wolframalpha.com/v2/query"
+
+
+@lru_cache(maxsize=None)
+def _load_env():
+    """首次用到 .env 中的配置时再加载，导入本模块时不读取文件也不导入 dotenv。"""
+    from dotenv import load_dotenv
+    load_dotenv()
+
+
+class LazyTool:
+    """
+    按导入路径声明的工具: 形如 "package.module:function"(或 "package.module.function")，
+    第一次被调用时才导入对应模块，之后直接调用已解析的函数。
+    """
+    def __init__(self, import_path: str):
+        self.import_path = import_path
+        self._func = None
+        self._lock = threading.Lock()
+
+    def resolve(self) -> Callable:
+        if self._func is None:
+            with self._lock:
+                if self._func is None:
+                    module_name, sep, attr = self.import_path.partition(":")
+                    if not sep:
+                        module_name, _, attr = self.import_path.rpartition(".")
+                    self._func = getattr(importlib.import_module(module_name), attr)
+        return self._func
+
+    @property
+    def loaded(self) -> bool:
+        return self._func is not None
+
+    def __call__(self, *args, **kwargs):
+        return self.resolve()(*args, **kwargs)
+
+    def __repr__(self):
+        return f"LazyTool({self.import_path!r}, loaded={self.loaded})"
 
 class ToolExecutor:
     """
     一个工具执行器，负责管理和执行工具。
+    注册时可以为每个工具指定缓存策略，重复或并发的相同调用会复用结果。
     """
     def __init__(self):
         self.tools: Dict[str, Dict[str,Any]] = {}
 
-    def register_tool(self, name:str, description:str, func:Callable):
+    def register_tool(self, name:str, description:str, func:Union[Callable, str], cache_policy:CachePolicy = None):
         """
         注册一个新工具
+
+        参数:
+        - func (Callable | str): 工具函数，或形如 "package.module:function" 的导入路径；
+          传入导入路径时，工具所在模块(以及它依赖的 SDK)要到第一次调用时才会被导入。
+        - cache_policy (CachePolicy): 可选的缓存策略，不传则每次都直接调用 func。
         """
         if name in self.tools:
             print(f"警告:工具 '{name}' 已存在，将被覆盖。")
-        self.tools[name] = {"description": description, "func": func}
+        if isinstance(func, str):
+            func = LazyTool(func)
+        cache = ToolCache(cache_policy) if cache_policy else None
+        self.tools[name] = {
+            "description": description,
+            "func": cache.wrap(func) if cache else func,
+            "raw_func": func,
+            "cache": cache,
+        }
         print(f"工具{name}已注册")
 
     def get_tool(self, name:str) -> callable:
         """
-        根据名称获得执行函数
+        根据名称获得执行函数(若配置了缓存策略，返回的是带缓存的函数)
         """
         return self.tools.get(name,{}).get("func")
 
+    def execute(self, name:str, tool_input:str) -> str:
+        """
+        执行一次工具调用并返回观察结果；工具不存在或执行出错时返回错误描述。
+        """
+        tool_function = self.get_tool(name)
+        if not tool_function:
+            return f"错误:未找到名为 '{name}' 的工具。"
+        try:
+            return tool_function(tool_input)
+        except Exception as e:
+            return f"错误:工具 '{name}' 执行失败 - {e}"
+
+    def execute_parallel(self, calls:List[Tuple[str, str]], max_workers:int = 4) -> List[str]:
+        """
+        在线程池中并发执行多个 (工具名, 输入) 调用，按传入顺序返回观察结果。
+        """
+        if len(calls) <= 1:
+            return [self.execute(name, tool_input) for name, tool_input in calls]
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(calls))) as pool:
+            return list(pool.map(lambda call: self.execute(*call), calls))
+
     def getAvailableTools(self) -> str:
         """
         获取所有可用工具的格式化描述字符串。
         """
-        res = "\n"
-        for name, tool in self.tools.items():
-            res.join(tool["description"])
-        return res
+        return "\n".join([
+            f"-{name}:{info['description']}" for name, info in self.tools.items()
+        ])
+
+    def get_tool_schemas(self) -> List[Dict[str, Any]]:
+        """
+        生成 OpenAI 兼容的 tools JSON Schema 列表，用于原生函数调用。
+        这里的工具都只接受一个字符串输入，因此每个工具都只有一个必填参数 input。
+        """
+        return [
+            {
+                "type": "function",
+                "function": {
+                    "name": name,
+                    "description": info["description"],
+                    "parameters": {
+                        "type": "object",
+                        "properties": {"input": {"type": "string", "description": f"传给 {name} 的输入"}},
+                        "required": ["input"],
+                    },
+                },
+            }
+            for name, info in self.tools.items()
+        ]
+
+    def cache_stats(self) -> Dict[str, Dict[str, float]]:
+        """
+        返回每个启用了缓存的工具的命中统计，键为工具名。
+        """
+        return {name: info["cache"].stats() for name, info in self.tools.items() if info["cache"]}
 
 def search(query:str) -> str:
     """
         一个基于SerpApi的实战网页搜索引擎工具。
         它会智能地解析搜索结果，优先返回直接答案或知识图谱信息。
+        设置 SEARCH_CACHE_PATH(SQLite 文件路径)后，结果缓存在本地的查询缓存中，只是空白、两端的标点、
+        句首客套用语或句末语气词不同的改写会直接复用之前的结果；近似匹配默认关闭，可通过 SEARCH_CACHE_THRESHOLD(例如 0.85)开启。
     """
+    _load_env()  # 缓存的配置也可能写在 .env 中，必须在创建缓存之前加载
+    cache = get_search_cache()
+    match = cache.lookup(query) if cache else None
+    if match:
+        result, cached_query, similarity = match
+        if similarity < 1.0:
+            print(f"♻️ 复用相似查询 '{cached_query}' 的搜索结果 (相似度 {similarity:.2f})")
+        return result
+    result = _serpapi_search(query)
+    if cache and not result.startswith(("错误", "搜索时发生错误", "对不起")):
+        cache.put(query, result)
+    return result
+
+def _serpapi_search(query:str) -> str:
+    """调用 SerpApi 执行一次真实的搜索并解析结果。"""
     try:
+        _load_env()
         api_key = os.getenv("SERPAPI_API_KEY")
         if api_key is None:
             return "错误:SERPAPI_API_KEY 未在 .env copy 文件中配置。"
@@ -50,11 +174,12 @@ def search(query:str) -> str:
             "q": query,  # <--- 使用 'query'
             "gl": "cn",  # 国家代码
             "hl": "zh-cn",  # 语言代码
-            "api_key": api_key  # <--- api_key 放在这里
+            "api_key": api_key,  # <--- api_key 放在这里
+            "output": "json",
         }
 
-        client = SerpApiClient(params_dict=params)
-        results = client.get_dict()
+        # 直接请求 SerpApi 的 REST 接口(与 SerpApiClient.get_dict 相同)，复用共享传输层的长连接、超时与重试
+        results = get_transport().get(SERPAPI_URL, tool="search", params=params).json()
 
         # 智能解析:优先寻找最直接的答案
         if "answer_box_list" in results:
@@ -81,7 +206,6 @@ def calculator(task:str)->str:
     一个基于Wolfram Alpha实现的计算工具
     输出想要计算的文本即可
     """
-    url = "http://api.wolframalpha.com/v2/query"
     params = {
         "input": task,
         "appid": "QPL79REY3K",
@@ -89,7 +213,7 @@ def calculator(task:str)->str:
         "output": "json",
         "podstate": "Result__Step-by-step solution",  # 可获取步骤
     }
-    resp = requests.get(url, params=params).json()
+    resp = get_transport().get(WOLFRAM_URL, tool="calculator", params=params).json()
     if not resp["queryresult"]["success"]:
         return "计算失败或无结果"
     result_text=""
@@ -0,0 +1,254 @@
+"""
+批量运行智能体: 从 JSONL 读取问题，并发运行 ReActAgent / PlanAndSolveAgent / ReflectionAgent，
+结果逐条追加写入 JSONL，中断后重新运行会跳过已经成功完成的问题。
+智能体的 run 是同步接口，因此只用线程池调度，每个线程运行一个问题。
+
+输入文件每行一个 JSON 对象，需要包含 "question"(或 "task")字段，可选的 "id" 字段用于断点续跑，缺省时使用行号。
+
+运行方式(在仓库根目录):
+    python -m chapter4.batch_runner questions.jsonl --agent react --output results.jsonl --concurrency 8 --rps 5
+    python -m chapter4.batch_runner questions.jsonl --agent plan_and_solve --concurrency 16
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from chapter4.LLM_client import HelloAgentsLLM
+from chapter4.llm_metrics import _percentile
+
+AGENT_KINDS = ("react", "plan_and_solve", "reflection")
+
+
+class RateLimiter:
+    """
+    线程安全的令牌桶限速器: 平均每秒最多放行 rate 次，允许最多 burst 次的突发。
+    所有并发任务共享同一个实例，从而实现全局的请求速率上限。
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class RateLimitedLLM:
+    """
+    包装 HelloAgentsLLM，每次请求(think / think_with_tools / athink / astream)之前先向限速器申请令牌，其余属性透传。
+    异步接口在线程中等待令牌，不阻塞事件循环。
+    """
+
+    def __init__(self, llm, limiter: RateLimiter):
+        self._llm = llm
+        self._limiter = limiter
+
+    def think(self, messages, *args, **kwargs):
+        self._limiter.acquire()
+        return self._llm.think(messages, *args, **kwargs)
+
+    def think_with_tools(self, messages, *args, **kwargs):
+        self._limiter.acquire()
+        return self._llm.think_with_tools(messages, *args, **kwargs)
+
+    async def athink(self, messages, *args, **kwargs):
+        await asyncio.to_thread(self._limiter.acquire)
+        return await self._llm.athink(messages, *args, **kwargs)
+
+    async def astream(self, messages, *args, **kwargs):
+        await asyncio.to_thread(self._limiter.acquire)
+        async for content in self._llm.astream(messages, *args, **kwargs):
+            yield content
+
+    def __getattr__(self, name):
+        return getattr(self._llm, name)
+
+
+def build_tool_executor():
+    """
+    创建 ReActAgent 使用的工具执行器。ToolExecutor 除了工具缓存之外没有单次运行的状态，
+    批量运行时只创建一次并让所有智能体共享，缓存与单飞去重才能在并发的问题之间生效。
+    """
+    from chapter4.ToolExecutor import ToolExecutor, calculator, search
+    from chapter4.tool_cache import CachePolicy
+    tool_executor = ToolExecutor()
+    tool_executor.register_tool("Search", "一个网页搜索引擎。当你需要回答关于时事、事实以及在你的知识库中找不到的信息时，应使用此工具。",
+                                search, CachePolicy(ttl=600, cache_if=lambda r: "错误" not in r))
+    tool_executor.register_tool("Calculator", "当遇到任何需要精确计算的数学问题时必须调用此工具。输入任意数学表达式或自然语言数学题都可以。",
+                                calculator, CachePolicy(ttl=None))
+    return tool_executor
+
+
+def build_agent(kind: str, llm, tool_executor=None):
+    """
+    为每个问题创建一个新的智能体实例(智能体的 history / memory 是单次运行的状态，不能共享)。
+    tool_executor 是 react 智能体共享的工具执行器，不传时新建一个。
+    """
+    if kind == "react":
+        from chapter4.React import ReActAgent
+        return ReActAgent(llm_client=llm, tool_executor=tool_executor or build_tool_executor())
+    if kind == "plan_and_solve":
+        from chapter4.plan_and_solve import PlanAndSolveAgent
+        return PlanAndSolveAgent(llm)
+    if kind == "reflection":
+        from chapter4.Reflection import ReflectionAgent
+        return ReflectionAgent(llm)
+    raise ValueError(f"未知的智能体类型: {kind}")
+
+
+def load_questions(path: str) -> List[Dict[str, Any]]:
+    items = []
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            question = item.get("question") or item.get("task")
+            if not question:
+                raise ValueError(f"{path} 第 {line_no} 行缺少 question 字段")
+            items.append({"id": str(item.get("id", line_no)), "question": question})
+    return items
+
+
+def load_finished(path: str) -> Set[str]:
+    """读取已有的结果文件，返回已经成功完成的问题 id；最后一行可能因中断而不完整，直接忽略。"""
+    finished = set()
+    if not os.path.exists(path):
+        return finished
+    with open(path, encoding="utf-8") as f:
+        content = f.read()
+    for line in content.splitlines():
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        if record.get("status") == "ok":
+            finished.add(str(record["id"]))
+    if content and not content.endswith("\n"):
+        # 补上换行，避免新结果接在不完整的最后一行后面
+        with open(path, "a", encoding="utf-8") as f:
+            f.write("\n")
+    return finished
+
+
+class BatchRunner:
+    """
+    在线程池中并发地对一批问题运行智能体，每完成一个问题就把结果追加写入 output_path。
+
+    参数:
+    - agent_factory (Callable): 给定 llm 返回一个新智能体的函数。
+    - llm: 所有智能体共享的 LLM 客户端(HelloAgentsLLM 内部的连接池可以被多线程共享)。
+    - concurrency (int): 同时运行的问题数。
+    - rps (float): 全局每秒 LLM 请求数上限，None 表示不限速。
+    """
+
+    def __init__(self, agent_factory: Callable[[Any], Any], llm, output_path: str, concurrency: int = 4,
+                 rps: Optional[float] = None):
+        self.agent_factory = agent_factory
+        self.llm = RateLimitedLLM(llm, RateLimiter(rps, burst=concurrency)) if rps else llm
+        self.output_path = output_path
+        self.concurrency = concurrency
+        self._lock = threading.Lock()
+
+    def _run_one(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        start = time.perf_counter()
+        answer, error = None, None
+        try:
+            answer = self.agent_factory(self.llm).run(item["question"])
+            if answer is None:
+                error = "智能体没有给出答案"
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        record = {
+            "id": item["id"],
+            "question": item["question"],
+            "status": "ok" if error is None else "error",
+            "answer": answer,
+            "error": error,
+            "latency_s": time.perf_counter() - start,
+            "finished_at": time.time(),
+        }
+        with self._lock, open(self.output_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        return record
+
+    def _run_threads(self, items):
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            return list(pool.map(self._run_one, items))
+
+    def run(self, items: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """运行所有未完成的问题，返回运行摘要。"""
+        finished = load_finished(self.output_path)
+        todo = [item for item in items if item["id"] not in finished]
+        start = time.perf_counter()
+        records = self._run_threads(todo)
+        return summarize(records, skipped=len(items) - len(todo), wall_s=time.perf_counter() - start)
+
+
+def summarize(records: List[Dict[str, Any]], skipped: int, wall_s: float) -> Dict[str, Any]:
+    latencies = sorted(record["latency_s"] for record in records)
+    summary = {
+        "total": len(records) + skipped,
+        "skipped": skipped,
+        "ran": len(records),
+        "ok": sum(record["status"] == "ok" for record in records),
+        "failed": sum(record["status"] != "ok" for record in records),
+        "wall_s": wall_s,
+        "throughput_qps": len(records) / wall_s if wall_s > 0 else None,
+    }
+    for q in (0.5, 0.9, 0.99):
+        summary[f"latency_p{int(q * 100)}_s"] = _percentile(latencies, q) if latencies else None
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批量运行智能体")
+    parser.add_argument("input", help="问题 JSONL 文件")
+    parser.add_argument("--agent", choices=AGENT_KINDS, default="react")
+    parser.add_argument("--output", default="batch_results.jsonl", help="结果 JSONL 文件，已完成的问题会被跳过")
+    parser.add_argument("--concurrency", type=int, default=4, help="同时运行的问题数")
+    parser.add_argument("--rps", type=float, help="全局每秒 LLM 请求数上限")
+    parser.add_argument("--model", help="覆盖 LLM_MODEL_ID")
+    parser.add_argument("--base-url", help="覆盖 LLM_BASE_URL")
+    parser.add_argument("--api-key", help="覆盖 LLM_API_KEY")
+    parser.add_argument("--verbose", action="store_true", help="显示智能体的运行过程(并发时输出会交错)")
+    args = parser.parse_args()
+
+    llm = HelloAgentsLLM(model=args.model, apiKey=args.api_key, baseUrl=args.base_url)
+    tool_executor = build_tool_executor() if args.agent == "react" else None
+    runner = BatchRunner(lambda client: build_agent(args.agent, client, tool_executor), llm, args.output,
+                         concurrency=args.concurrency, rps=args.rps)
+    items = load_questions(args.input)
+    print(f"🚀 共 {len(items)} 个问题，智能体: {args.agent}，并发: {args.concurrency}")
+    with contextlib.ExitStack() as stack:
+        if not args.verbose:
+            stack.enter_context(contextlib.redirect_stdout(stack.enter_context(open(os.devnull, "w"))))
+        summary = runner.run(items)
+
+    print(f"✅ 完成 {summary['ran']} 个(成功 {summary['ok']}，失败 {summary['failed']})，跳过已完成的 {summary['skipped']} 个")
+    if summary["ran"]:
+        print(f"⏱️ 总耗时 {summary['wall_s']:.2f}s，吞吐 {summary['throughput_qps']:.2f} 个/秒，"
+              f"延迟 p50 {summary['latency_p50_s']:.2f}s / p90 {summary['latency_p90_s']:.2f}s / p99 {summary['latency_p99_s']:.2f}s")
+    print(f"📄 结果已写入 {args.output}")
+
+
+if __name__ == '__main__':
+    main()
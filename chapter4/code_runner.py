@@ -0,0 +1,143 @@
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence
+
+try:
+    import resource
+except ImportError:  # Windows 没有 resource 模块，此时只依赖超时
+    resource = None
+
+# 在子进程中运行的脚本: 从 stdin 读取代码与测试输入，先按 job["limits"] 限制自身的 CPU 时间与内存，
+# 再执行并计时。结果通过复制出来的原 stdout 描述符以 JSON 写回，候选代码自己的 stdout 输出被重定向到 stderr，
+# 不会和结果混在一起
+_CHILD_SCRIPT = r"""
+import json, os, sys, time
+job = json.loads(sys.stdin.read())
+result_fd = os.dup(1)
+os.dup2(2, 1)
+if job["limits"]:
+    import resource
+    cpu_seconds, memory = job["limits"]
+    resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds))
+    resource.setrlimit(resource.RLIMIT_AS, (memory, memory))
+namespace = {"__name__": "__candidate__"}
+exec(compile(job["code"], "<candidate>", "exec"), namespace)
+func = namespace.get(job["func_name"]) if job["func_name"] else None
+if func is None:
+    funcs = [v for v in namespace.values() if callable(v) and getattr(v, "__module__", None) == "__candidate__"]
+    func = funcs[0] if funcs else None
+if func is None:
+    raise SystemExit("代码中没有找到可调用的函数")
+outputs, seconds = [], 0.0
+for args in job["inputs"]:
+    best = None
+    for _ in range(job["repeat"]):
+        start = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    seconds += best
+    outputs.append(json.loads(json.dumps(result, default=repr)))
+sys.stdout.flush()
+with os.fdopen(result_fd, "w") as result_file:
+    result_file.write(json.dumps({"outputs": outputs, "seconds": seconds}))
+"""
+
+
+def extract_code(text: str) -> str:
+    """从 LLM 的回复中取出代码: 有 ```python 代码块时取第一个代码块，否则原样返回。"""
+    match = re.search(r"```(?:python|py)?\s*\n(.*?)```", text or "", re.DOTALL)
+    return match.group(1) if match else (text or "")
+
+
+class CodeRunner:
+    """
+    在子进程中运行候选代码，用给定的测试输入检查正确性并做微基准计时。
+
+    每个候选在单独的 `python -I` 子进程中执行: 临时目录作为工作目录，只传入 PATH 环境变量，
+    POSIX 下限制 CPU 时间与内存；超时、异常或没有返回结果都视为不正确。多个候选并发运行。
+    注意这不是安全沙箱: 子进程仍能访问文件系统与网络，只应运行可信来源的代码。
+    """
+
+    def __init__(self, test_inputs: Sequence[Any], expected_outputs: Optional[Sequence[Any]] = None,
+                 func_name: str = None, timeout: float = 10.0, repeat: int = 3,
+                 memory_mb: int = 512, max_workers: int = 4):
+        """
+        参数:
+        - test_inputs (Sequence): 测试输入列表，每一项是参数元组/列表；不是元组或列表时视为单个参数。
+        - expected_outputs (Sequence): 可选，与 test_inputs 一一对应的期望输出；不提供时调用方需传入参考输出。
+        - func_name (str): 被测函数名，默认取代码中定义的第一个函数。
+        - timeout (float): 每个候选的总超时时间(秒)。
+        - repeat (int): 每个输入重复运行的次数，取最短耗时。
+        - memory_mb (int): 子进程的地址空间上限(MB)，仅 POSIX 生效。
+        - max_workers (int): 同时运行的子进程数。
+        """
+        self.test_inputs = [list(args) if isinstance(args, (list, tuple)) else [args] for args in test_inputs]
+        self.expected_outputs = self._normalize(expected_outputs) if expected_outputs is not None else None
+        self.func_name = func_name
+        self.timeout = timeout
+        self.repeat = repeat
+        self.memory_mb = memory_mb
+        self.max_workers = max_workers
+
+    @staticmethod
+    def _normalize(values):
+        # 与子进程的输出经过同样的 JSON 往返，元组/列表等才能正确比较
+        return json.loads(json.dumps(list(values), default=repr))
+
+    def _limits(self) -> Optional[List[int]]:
+        # 资源限制由子进程在执行候选代码前自己设置；run 会在线程池中并发调用，不能使用 preexec_fn
+        if resource is None or os.name != "posix":
+            return None
+        return [int(self.timeout) + 1, self.memory_mb * 1024 * 1024]
+
+    def run(self, code: str) -> Dict[str, Any]:
+        """
+        运行一份候选代码，返回 {"ok", "outputs", "seconds", "error"}。
+        ok 只表示代码顺利跑完，是否正确由 evaluate 判断。
+        """
+        job = json.dumps({"code": extract_code(code), "func_name": self.func_name,
+                          "inputs": self.test_inputs, "repeat": self.repeat, "limits": self._limits()})
+        with tempfile.TemporaryDirectory() as workdir:
+            try:
+                completed = subprocess.run(
+                    [sys.executable, "-I", "-c", _CHILD_SCRIPT], input=job, capture_output=True, text=True,
+                    timeout=self.timeout, cwd=workdir, env={"PATH": os.environ.get("PATH", "")},
+                )
+            except subprocess.TimeoutExpired:
+                return {"ok": False, "outputs": None, "seconds": None, "error": f"超时(>{self.timeout}s)"}
+        if completed.returncode != 0:
+            error = (completed.stderr.strip().splitlines() or [f"退出码 {completed.returncode}"])[-1]
+            return {"ok": False, "outputs": None, "seconds": None, "error": error}
+        try:
+            result = json.loads(completed.stdout)
+        except ValueError:
+            # 候选代码提前退出(例如 os._exit / sys.exit(0))时没有写回结果
+            return {"ok": False, "outputs": None, "seconds": None, "error": "子进程没有返回有效的结果"}
+        return {"ok": True, "outputs": result["outputs"], "seconds": result["seconds"], "error": None}
+
+    def evaluate(self, candidates: List[str], reference_outputs: Optional[List[Any]] = None) -> List[Dict[str, Any]]:
+        """
+        并发运行所有候选，返回与 candidates 顺序一致的结果列表，每项增加 "correct" 字段。
+        有 expected_outputs 时与之比较，否则与 reference_outputs(通常是当前版本代码的输出)比较；
+        两者都没有时只要能顺利跑完就算正确，调用方需要自行确认确实存在可信的参考。
+        """
+        expected = self.expected_outputs if self.expected_outputs is not None else reference_outputs
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            results = list(pool.map(self.run, candidates))
+        for result in results:
+            result["correct"] = result["ok"] and (expected is None or result["outputs"] == expected)
+            if result["ok"] and not result["correct"]:
+                result["error"] = "输出与期望结果不一致"
+        return results
+
+    @staticmethod
+    def fastest(results: List[Dict[str, Any]]) -> Optional[int]:
+        """返回最快的正确候选的下标，没有正确候选时返回 None。"""
+        correct = [i for i, result in enumerate(results) if result["correct"]]
+        return min(correct, key=lambda i: results[i]["seconds"]) if correct else None
@@ -0,0 +1,130 @@
+import contextlib
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+
+from chapter4.llm_metrics import _percentile
+
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+
+class HttpTransport:
+    """
+    网络工具共享的 HTTP 传输层。
+
+    - 每个会话内按主机维护 keep-alive 连接池，重复调用同一个服务不必重新建立 TCP/TLS 连接；
+    - 所有请求都带连接超时与读取超时，不会无限期挂起；
+    - 连接失败以及 429/5xx 响应按指数退避有限次重试(遵循 Retry-After)；
+    - 按工具名统计调用次数、错误数与耗时分位数。
+
+    requests 在第一次创建会话时才导入。一般通过 get_transport() 获取进程内共享的实例。
+    """
+
+    def __init__(self, pool_maxsize: int = 10, connect_timeout: float = 5.0, read_timeout: float = 30.0,
+                 max_retries: int = 3, backoff_factor: float = 0.5, max_samples: int = 1000):
+        """
+        参数:
+        - pool_maxsize (int): 每个主机保留的最大连接数，应不小于并发调用同一服务的线程数。
+        - connect_timeout / read_timeout (float): 默认的连接与读取超时(秒)，单次请求可以用 timeout 覆盖。
+        - max_retries (int): 连接错误与 429/5xx 的最大重试次数。
+        - backoff_factor (float): 退避系数，第 n 次重试前等待 backoff_factor * 2^(n-1) 秒。
+        - max_samples (int): 每个工具保留的最近耗时样本数，用于计算分位数。
+        """
+        self.pool_maxsize = pool_maxsize
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_samples = max_samples
+        self._sessions: Dict[str, Any] = {}
+        self._stats: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def session(self, name: str = "default"):
+        """
+        返回名为 name 的共享 requests.Session，不存在则创建。
+        需要在会话上设置私有请求头(例如鉴权信息)的客户端应使用单独的 name，避免泄露给其他服务。
+        """
+        with self._lock:
+            if name not in self._sessions:
+                self._sessions[name] = self._new_session()
+            return self._sessions[name]
+
+    def _new_session(self):
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        retry = Retry(total=self.max_retries, connect=self.max_retries, read=self.max_retries,
+                      status=self.max_retries, backoff_factor=self.backoff_factor,
+                      status_forcelist=RETRY_STATUS, allowed_methods=None,
+                      respect_retry_after_header=True, raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=self.pool_maxsize, pool_maxsize=self.pool_maxsize, max_retries=retry)
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def request(self, method: str, url: str, tool: str = "http", timeout=None, session: str = "default", **kwargs):
+        """发送请求并把耗时计入 tool 的统计；timeout 缺省时使用实例的连接/读取超时。"""
+        with self.track(tool):
+            return self.session(session).request(method, url, timeout=timeout or self.timeout, **kwargs)
+
+    def get(self, url: str, tool: str = "http", **kwargs):
+        return self.request("GET", url, tool=tool, **kwargs)
+
+    def post(self, url: str, tool: str = "http", **kwargs):
+        return self.request("POST", url, tool=tool, **kwargs)
+
+    @contextlib.contextmanager
+    def track(self, tool: str):
+        """记录一段调用的耗时与是否出错，也可以包住不经过 request 的 SDK 调用。"""
+        start = time.perf_counter()
+        error = False
+        try:
+            yield
+        except Exception:
+            error = True
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                stats = self._stats.setdefault(tool, {"calls": 0, "errors": 0, "total_s": 0.0,
+                                                      "samples": deque(maxlen=self.max_samples)})
+                stats["calls"] += 1
+                stats["errors"] += error
+                stats["total_s"] += elapsed
+                stats["samples"].append(elapsed)
+
+    def stats(self) -> Dict[str, Dict[str, Optional[float]]]:
+        """按工具名返回调用次数、错误数、平均耗时与 p50/p90/p99 耗时(秒)。"""
+        with self._lock:
+            snapshot = {tool: (dict(stats), sorted(stats["samples"])) for tool, stats in self._stats.items()}
+        result = {}
+        for tool, (stats, samples) in snapshot.items():
+            result[tool] = {
+                "calls": stats["calls"],
+                "errors": stats["errors"],
+                "mean_s": stats["total_s"] / stats["calls"],
+                **{f"p{int(q * 100)}_s": _percentile(samples, q) for q in (0.5, 0.9, 0.99)},
+            }
+        return result
+
+    def close(self):
+        with self._lock:
+            sessions, self._sessions = self._sessions, {}
+        for session in sessions.values():
+            session.close()
+
+
+_default_transport: Optional[HttpTransport] = None
+_default_lock = threading.Lock()
+
+
+def get_transport() -> HttpTransport:
+    """返回进程内共享的 HttpTransport，第一次调用时创建。"""
+    global _default_transport
+    with _default_lock:
+        if _default_transport is None:
+            _default_transport = HttpTransport()
+        return _default_transport
@@ -0,0 +1,129 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+
+class ResponseCache:
+    """
+    HelloAgentsLLM 的持久化响应缓存。
+
+    以 (模型, 消息列表, 采样参数) 的哈希作为键，把完整的模型响应保存在本地 SQLite 文件中，
+    进程重启后依然有效。超过 ttl 秒的条目视为过期；条目数或总字节数超过上限时按最近最少使用(LRU)淘汰。
+    默认只缓存 temperature=0 的确定性调用。
+    """
+
+    def __init__(self, path: str = None, ttl: float = 7 * 24 * 3600, max_entries: int = 10000,
+                 max_bytes: int = 256 * 1024 * 1024, deterministic_only: bool = True):
+        """
+        参数:
+        - path (str): SQLite 文件路径，默认读取 LLM_CACHE_PATH 或 .llm_cache.sqlite；传入 ":memory:" 则仅在进程内有效。
+        - ttl (float): 条目有效期(秒)，None 表示永不过期。
+        - max_entries (int): 最多保留的条目数。
+        - max_bytes (int): 所有响应内容的总字节上限。
+        - deterministic_only (bool): 为 True 时只缓存 temperature=0 的调用。
+        """
+        self.path = path or os.getenv("LLM_CACHE_PATH", ".llm_cache.sqlite")
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.deterministic_only = deterministic_only
+        self.hits = 0
+        self.misses = 0
+        self.bytes_served = 0
+        self.bytes_stored = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, content TEXT NOT NULL, size INTEGER NOT NULL, "
+            "created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses (accessed)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(model: str, messages: List[Dict[str, str]], **sampling) -> str:
+        """根据模型、消息和采样参数生成稳定的缓存键。"""
+        payload = json.dumps({"model": model, "messages": messages, "sampling": sampling},
+                             sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def accepts(self, temperature: float) -> bool:
+        """判断给定采样参数的调用是否应该走缓存。"""
+        return not self.deterministic_only or temperature == 0
+
+    def get(self, key: str) -> Optional[str]:
+        """读取缓存，未命中或已过期时返回 None。"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT content, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and self.ttl is not None and now - row[1] > self.ttl:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            self.bytes_served += len(row[0].encode("utf-8"))
+            return row[0]
+
+    def put(self, key: str, content: str):
+        """写入一条响应，并在超出上限时淘汰过期及最久未使用的条目。"""
+        now = time.time()
+        size = len(content.encode("utf-8"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, content, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, content, size, now, now),
+            )
+            self.bytes_stored += size
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now: float):
+        if self.ttl is not None:
+            self._conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+        count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+        # 按最近访问时间从旧到新删除，直到同时满足条目数和字节数上限
+        doomed = []
+        for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY accessed ASC"):
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            doomed.append((key,))
+            count -= 1
+            total -= size
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", doomed)
+
+    def clear(self):
+        """清空缓存内容(统计计数不变)。"""
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, float]:
+        """返回命中/未命中次数、命中率、字节数等统计信息。"""
+        with self._lock:
+            entries, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "bytes_served": self.bytes_served,
+            "bytes_stored": self.bytes_stored,
+            "entries": entries,
+            "bytes_on_disk": total,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,199 @@
+import json
+import math
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    """最近秩法求百分位数，sorted_values 必须已排序且非空。"""
+    index = max(0, min(len(sorted_values) - 1, math.ceil(q * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class CallTimer:
+    """
+    记录单次 LLM 调用的计时器，由 LLMMetrics.start 创建。
+    调用方在收到每个流式分片时调用 chunk，收到 usage 时调用 usage，结束时调用 finish。
+    """
+
+    def __init__(self, metrics: "LLMMetrics", model: str, endpoint: str, prompt_bytes: int):
+        self.metrics = metrics
+        self.record: Dict[str, Any] = {
+            "timestamp": time.time(),
+            "model": model,
+            "endpoint": endpoint,
+            "prompt_bytes": prompt_bytes,
+            "prompt_tokens": None,
+            "ttft_s": None,
+            "latency_s": None,
+            "chunks": 0,
+            "completion_tokens": None,
+            "cached": False,
+            "stopped_early": False,
+            "error": None,
+        }
+        self._start = time.perf_counter()
+
+    def chunk(self, content: str):
+        if not content:
+            return
+        if self.record["ttft_s"] is None:
+            self.record["ttft_s"] = time.perf_counter() - self._start
+        self.record["chunks"] += 1
+
+    def usage(self, usage):
+        """记录服务端在流末尾返回的 usage(需要服务端支持 stream_options.include_usage)。"""
+        self.record["prompt_tokens"] = getattr(usage, "prompt_tokens", None)
+        self.record["completion_tokens"] = getattr(usage, "completion_tokens", None)
+
+    def stopped_early(self):
+        """标记本次调用因 stop 判定而提前关闭了流。"""
+        self.record["stopped_early"] = True
+
+    def finish(self, error: Exception = None, cached: bool = False) -> Dict[str, Any]:
+        self.record["latency_s"] = time.perf_counter() - self._start
+        self.record["cached"] = cached
+        if error is not None:
+            self.record["error"] = f"{type(error).__name__}: {error}"
+        self.metrics.add(self.record)
+        return self.record
+
+
+class LLMMetrics:
+    """
+    HelloAgentsLLM 的进程内调用指标聚合器。
+
+    每次调用记录首 token 延迟(TTFT)、总耗时、流式分片数、completion token 数、提示词大小和错误，
+    按模型(或服务地址)汇总百分位数，并可导出为 JSONL 或 Prometheus 文本格式。
+    多个 HelloAgentsLLM 实例可以共享同一个聚合器。
+    """
+
+    def __init__(self, max_records: int = 10000, jsonl_path: str = None):
+        """
+        参数:
+        - max_records (int): 内存中保留的最近调用记录数。
+        - jsonl_path (str): 可选，设置后每次调用结束都会把记录追加写入该 JSONL 文件。
+        """
+        self.records = deque(maxlen=max_records)
+        self.jsonl_path = jsonl_path
+        # (模型, 服务地址) -> 自进程启动以来的累计值；records 有长度上限，Prometheus 计数器必须单调递增，不能从中重新统计
+        self.totals: Dict[tuple, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def start(self, model: str, endpoint: str, messages: List[Dict[str, str]]) -> CallTimer:
+        prompt_bytes = sum(len((message.get("content") or "").encode("utf-8")) for message in messages)
+        return CallTimer(self, model, endpoint, prompt_bytes)
+
+    def add(self, record: Dict[str, Any]):
+        with self._lock:
+            self.records.append(record)
+            self._accumulate(record)
+            if self.jsonl_path:
+                with open(self.jsonl_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def _accumulate(self, record: Dict[str, Any]):
+        totals = self.totals.setdefault((record["model"], record["endpoint"]), {
+            "requests": 0, "errors": 0, "completion_tokens": 0,
+            "ttft_s_sum": 0.0, "ttft_s_count": 0, "latency_s_sum": 0.0, "latency_s_count": 0,
+        })
+        totals["requests"] += 1
+        totals["errors"] += record["error"] is not None
+        if record["cached"]:
+            return
+        totals["completion_tokens"] += self._tokens(record)
+        if record["error"] is None:
+            for field in ("ttft_s", "latency_s"):
+                if record[field] is not None:
+                    totals[f"{field}_sum"] += record[field]
+                    totals[f"{field}_count"] += 1
+
+    def summary(self, group_by: str = "model") -> Dict[str, Dict[str, Any]]:
+        """
+        按 group_by("model" 或 "endpoint")汇总: 调用数、错误数、缓存命中数、
+        TTFT 与总耗时的 p50/p90/p99、completion token 总数以及平均生成速率(token/秒)。
+        服务端未返回 usage 时以流式分片数近似 token 数。
+        """
+        with self._lock:
+            records = list(self.records)
+        groups: Dict[str, List[Dict[str, Any]]] = {}
+        for record in records:
+            groups.setdefault(record[group_by], []).append(record)
+
+        result = {}
+        for key, items in groups.items():
+            ok = [r for r in items if r["error"] is None and not r["cached"]]
+            stats: Dict[str, Any] = {
+                "calls": len(items),
+                "errors": sum(r["error"] is not None for r in items),
+                "cached": sum(r["cached"] for r in items),
+                "stopped_early": sum(r["stopped_early"] for r in items),
+                "prompt_bytes": sum(r["prompt_bytes"] for r in items),
+                "completion_tokens": sum(self._tokens(r) for r in ok),
+            }
+            for field in ("ttft_s", "latency_s"):
+                values = sorted(r[field] for r in ok if r[field] is not None)
+                for q in (0.5, 0.9, 0.99):
+                    stats[f"{field[:-2]}_p{int(q * 100)}_s"] = _percentile(values, q) if values else None
+            generation_time = sum(r["latency_s"] - (r["ttft_s"] or 0) for r in ok)
+            stats["tokens_per_s"] = stats["completion_tokens"] / generation_time if generation_time > 0 else None
+            result[key] = stats
+        return result
+
+    @staticmethod
+    def _tokens(record: Dict[str, Any]) -> int:
+        return record["completion_tokens"] if record["completion_tokens"] is not None else record["chunks"]
+
+    def export_jsonl(self, path: str):
+        """把内存中的全部调用记录写入 JSONL 文件(覆盖)。"""
+        with self._lock:
+            records = list(self.records)
+        with open(path, "w", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def to_prometheus(self) -> str:
+        """
+        以 Prometheus 文本格式导出按模型与服务地址汇总的计数器和耗时分位数(缓存命中不计入耗时与 token)。
+        计数器以及 summary 的 _sum/_count 取自进程启动以来的累计值，保证单调递增；
+        分位数只基于内存中保留的最近 max_records 条记录。
+        """
+        with self._lock:
+            records = list(self.records)
+            totals = {key: dict(values) for key, values in self.totals.items()}
+        groups: Dict[tuple, List[Dict[str, Any]]] = {}
+        for record in records:
+            groups.setdefault((record["model"], record["endpoint"]), []).append(record)
+
+        lines = [
+            "# HELP hello_agents_llm_requests_total LLM 调用次数",
+            "# TYPE hello_agents_llm_requests_total counter",
+        ]
+        lines += [f"hello_agents_llm_requests_total{self._labels(key)} {values['requests']}" for key, values in totals.items()]
+        lines += ["# HELP hello_agents_llm_errors_total 失败的 LLM 调用次数", "# TYPE hello_agents_llm_errors_total counter"]
+        lines += [f"hello_agents_llm_errors_total{self._labels(key)} {values['errors']}" for key, values in totals.items()]
+        lines += ["# HELP hello_agents_llm_completion_tokens_total 生成的 token 数", "# TYPE hello_agents_llm_completion_tokens_total counter"]
+        lines += [f"hello_agents_llm_completion_tokens_total{self._labels(key)} {values['completion_tokens']}"
+                  for key, values in totals.items()]
+        for field, name in (("ttft_s", "ttft_seconds"), ("latency_s", "latency_seconds")):
+            lines += [f"# HELP hello_agents_llm_{name} LLM 调用的{'首 token 延迟' if field == 'ttft_s' else '总耗时'}",
+                      f"# TYPE hello_agents_llm_{name} summary"]
+            for key, values in totals.items():
+                if not values[f"{field}_count"]:
+                    continue
+                recent = sorted(r[field] for r in groups.get(key, [])
+                                if r[field] is not None and r["error"] is None and not r["cached"])
+                for q in (0.5, 0.9, 0.99):
+                    if recent:
+                        lines.append(f"hello_agents_llm_{name}{self._labels(key, quantile=q)} {_percentile(recent, q):.6f}")
+                lines.append(f"hello_agents_llm_{name}_sum{self._labels(key)} {values[f'{field}_sum']:.6f}")
+                lines.append(f"hello_agents_llm_{name}_count{self._labels(key)} {values[f'{field}_count']}")
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _labels(key: tuple, quantile: Optional[float] = None) -> str:
+        model, endpoint = (str(part).replace("\\", "\\\\").replace('"', '\\"') for part in key)
+        extra = f',quantile="{quantile}"' if quantile is not None else ""
+        return f'{{model="{model}",endpoint="{endpoint}"{extra}}}'
@@ -1,5 +1,6 @@
 import ast
-from typing import List
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import List, Dict, Any, Union
 
 from pyexpat.errors import messages
 
@@ -18,15 +19,64 @@ PLANNER_PROMPT_TEMPLATE = """
 ```
 """
 
+DAG_PLANNER_PROMPT_TEMPLATE = """
+你是一个顶级的AI规划专家。你的任务是将用户提出的复杂问题分解成一个由多个简单步骤组成的行动计划。
+请确保计划中的每个步骤都是一个独立的、可执行的子任务，并明确写出它依赖哪些前序步骤的结果。
+互不依赖的步骤会被同时执行，所以只在确实需要某个步骤的结果时才把它列为依赖，最后一个步骤必须给出问题的最终答案。
+你的输出必须是一个Python列表，其中每个元素都是一个字典，包含 "id"(从1开始的整数)、"task"(子任务描述)、"depends_on"(所依赖步骤id的列表)。
+
+问题: {question}
+
+请严格按照以下格式输出你的计划,```python与```作为前后缀是必要的:
+```python
+[{{"id": 1, "task": "步骤1", "depends_on": []}}, {{"id": 2, "task": "步骤2", "depends_on": []}}, {{"id": 3, "task": "步骤3", "depends_on": [1, 2]}}, ...]
+```
+"""
+
+def normalize_plan(plan: List[Union[str, Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """
+    将计划统一为 {"id", "task", "depends_on"} 字典列表。
+    纯字符串步骤按顺序依次依赖前一步，与原来的逐步执行语义一致。
+    依赖了不存在的步骤或存在环时抛出 ValueError。
+    """
+    steps = []
+    for i, step in enumerate(plan):
+        if isinstance(step, str):
+            steps.append({"id": i + 1, "task": step, "depends_on": [i] if i else []})
+        else:
+            steps.append({"id": step["id"], "task": step["task"], "depends_on": list(step.get("depends_on", []))})
+
+    ids = {step["id"] for step in steps}
+    if len(ids) != len(steps):
+        raise ValueError("计划中存在重复的步骤id")
+    for step in steps:
+        unknown = [dep for dep in step["depends_on"] if dep not in ids]
+        if unknown:
+            raise ValueError(f"步骤 {step['id']} 依赖了不存在的步骤 {unknown}")
+
+    # 拓扑排序检查是否有环
+    remaining = {step["id"]: set(step["depends_on"]) for step in steps}
+    while remaining:
+        ready = [step_id for step_id, deps in remaining.items() if not deps]
+        if not ready:
+            raise ValueError(f"计划中的步骤存在循环依赖: {sorted(remaining)}")
+        for step_id in ready:
+            del remaining[step_id]
+        for deps in remaining.values():
+            deps.difference_update(ready)
+    return steps
+
 class Planner:
     def __init__(self, llm_client):
         self.llm_client = llm_client
 
-    def plan(self, question: str) -> List[str]:
+    def plan(self, question: str, with_dependencies: bool = False) -> List[Union[str, Dict[str, Any]]]:
         """
         根据用户问题生成一个行动计划
+        with_dependencies=True 时要求模型为每个步骤给出依赖关系，返回 {"id", "task", "depends_on"} 字典列表
         """
-        prompt = PLANNER_PROMPT_TEMPLATE.format(question=question)
+        template = DAG_PLANNER_PROMPT_TEMPLATE if with_dependencies else PLANNER_PROMPT_TEMPLATE
+        prompt = template.format(question=question)
 
         #为了生成计划，构建一个简单的消息列表
         messages = [{"role": "user", "content": prompt}]
@@ -39,8 +89,10 @@ class Planner:
             plan_str = response_text.split("```python")[1].split("```")[0].strip()
 
             plan = ast.literal_eval(plan_str)
-            return plan if isinstance(plan, list) else []
-        except (ValueError, SyntaxError, IndexError) as e:
+            if not isinstance(plan, list):
+                return []
+            return normalize_plan(plan) if with_dependencies else plan
+        except (ValueError, SyntaxError, IndexError, KeyError, TypeError) as e:
             print(f"❌ 解析计划时出错: {e}")
             print(f"原始响应: {response_text}")
             return []
@@ -69,9 +121,34 @@ EXECUTOR_PROMPT_TEMPLATE = """
 请仅输出针对“当前步骤”的回答:
 """
 
+DAG_EXECUTOR_PROMPT_TEMPLATE = """
+你是一位顶级的AI执行专家。你的任务是严格按照给定的计划，解决其中的一个步骤。
+你将收到原始问题、完整的计划、以及当前步骤所依赖的前序步骤的结果。
+请你专注于解决“当前步骤”，并仅输出该步骤的最终答案，不要输出任何额外的解释或对话。
+
+# 原始问题:
+{question}
+
+# 完整计划:
+{plan}
+
+# 依赖步骤与结果:
+{history}
+
+# 当前步骤:
+{current_step}
+
+请仅输出针对“当前步骤”的回答:
+"""
+
 class Executor:
-    def __init__(self, llm_client):
+    def __init__(self, llm_client, max_workers: int = 4):
+        """
+        参数:
+        - max_workers (int): 按依赖图执行时同时进行的步骤数上限。
+        """
         self.llm_client = llm_client
+        self.max_workers = max_workers
 
     def execute(self, question: str, plan:List[str]) -> str:
         """
@@ -100,29 +177,78 @@ class Executor:
         final_answer = response_text
         return final_answer
 
+    def execute_dag(self, question: str, plan: List[Dict[str, Any]]) -> str:
+        """
+        按依赖图执行计划:所有依赖都已完成的步骤会被同时提交到线程池，
+        每个步骤只看到它所依赖步骤的结果。返回计划中最后一个步骤的结果作为最终答案。
+        并行的步骤不逐片打印模型输出(否则会相互交错)，每个步骤完成时再整体打印它的结果。
+        """
+        steps = {step["id"]: step for step in plan}
+        plan_text = [step["task"] for step in plan]
+        pending = {step["id"]: set(step["depends_on"]) for step in plan}
+        results: Dict[Any, str] = {}
+
+        print(f"——————正在按依赖图执行计划(最多 {self.max_workers} 个步骤并行)——————")
+
+        def run_step(step_id) -> str:
+            step = steps[step_id]
+            history = "".join(
+                f"步骤 {dep}: {steps[dep]['task']}\n结果: {results[dep]}\n\n" for dep in step["depends_on"]
+            )
+            prompt = DAG_EXECUTOR_PROMPT_TEMPLATE.format(
+                question=question,
+                plan=plan_text,
+                history=history if history else "无",
+                current_step=step["task"]
+            )
+            return self.llm_client.think([{"role": "user", "content": prompt}], echo=False)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            running = {}
+            while pending or running:
+                for step_id in [step_id for step_id, deps in pending.items() if not deps]:
+                    del pending[step_id]
+                    print(f"\n-> 开始执行步骤 {step_id}/{len(plan)}: {steps[step_id]['task']}")
+                    running[pool.submit(run_step, step_id)] = step_id
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    step_id = running.pop(future)
+                    results[step_id] = future.result()
+                    print(f"✅ 步骤 {step_id} 已完成，结果: {results[step_id]}")
+                    for deps in pending.values():
+                        deps.discard(step_id)
+
+        return results[plan[-1]["id"]]
+
 class PlanAndSolveAgent:
-    def __init__(self, llm_client):
+    def __init__(self, llm_client, parallel: bool = False, max_workers: int = 4):
         """
         初始化智能体，同时创建规划器和执行器实例。
+        parallel=True 时规划器输出带依赖关系的计划，执行器按依赖图并发执行互不依赖的步骤。
         """
         self.llm_client = llm_client
+        self.parallel = parallel
         self.planner = Planner(llm_client)
-        self.executor = Executor(llm_client)
+        self.executor = Executor(llm_client, max_workers=max_workers)
 
     def run(self, question: str):
         """
         运行智能体的完整流程:先规划，后执行。
         """
-        plan = self.planner.plan(question)
+        plan = self.planner.plan(question, with_dependencies=self.parallel)
         # 检查计划是否成功生成
         if not plan:
             print("\n--- 任务终止 --- \n无法生成有效的行动计划。")
             return
 
         # 2. 调用执行器执行计划
-        final_answer = self.executor.execute(question, plan)
+        if self.parallel:
+            final_answer = self.executor.execute_dag(question, plan)
+        else:
+            final_answer = self.executor.execute(question, plan)
 
         print(f"\n--- 任务完成 ---\n最终答案: {final_answer}")
+        return final_answer
 
 if __name__ == "__main__":
     llm = HelloAgentsLLM()
@@ -0,0 +1,275 @@
+import hashlib
+import os
+import random
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+# 对检索意图几乎没有影响的句首客套用语与句末语气词，归一化时只在查询的开头/结尾整体去掉(用语按长度从长到短匹配)
+LEADING_FILLERS = ("搜索一下", "查询一下", "告诉我", "查一下", "搜一下", "请问", "帮我", "帮忙", "麻烦")
+TRAILING_PARTICLES = ("吗", "呢", "啊", "吧", "呀")
+# 只在查询两端去掉的句读与括号；"#"、"+"、"$" 等符号可能是查询的一部分(C#、C++、$100)，一律保留
+EDGE_PUNCTUATION = " \t\r\n.,;:!?\"'`~()[]{}<>。，、；：？！…“”‘’「」『』《》【】（）～"
+_MERSENNE_PRIME = (1 << 61) - 1
+
+
+def _is_ascii_word(ch: str) -> bool:
+    return ch.isascii() and ch.isalnum()
+
+
+def normalize_query(query: str) -> str:
+    """
+    归一化查询: NFKC、转小写，去掉两端的空白与句读、开头的"请问""帮我查一下"之类的客套用语和结尾的语气词。
+    中间的字符(包括符号)全部保留；连续空白合并，两侧不都是英文字母或数字时(例如中文之间)直接去掉。
+    """
+    text = unicodedata.normalize("NFKC", query).lower()
+    tokens = text.split()
+    text = tokens[0] if tokens else ""
+    for token in tokens[1:]:
+        text += (" " if _is_ascii_word(text[-1]) and _is_ascii_word(token[0]) else "") + token
+    while True:
+        stripped = text.strip(EDGE_PUNCTUATION)
+        for word in LEADING_FILLERS:
+            if stripped.startswith(word) and len(stripped) > len(word):
+                stripped = stripped[len(word):]
+                break
+        for word in TRAILING_PARTICLES:
+            if stripped.endswith(word) and len(stripped) > len(word):
+                stripped = stripped[:-len(word)]
+                break
+        if stripped == text:
+            return text
+        text = stripped
+
+
+def char_ngrams(text: str, n: int) -> FrozenSet[str]:
+    """字符 n-gram 集合；文本短于 n 时整个文本作为唯一的元素。"""
+    if len(text) <= n:
+        return frozenset([text]) if text else frozenset()
+    return frozenset(text[i:i + n] for i in range(len(text) - n + 1))
+
+
+def digits(text: str) -> str:
+    """查询中的数字序列；数字不同(年份、型号、数量)的查询即使字面相近也不能视为同一个问题。"""
+    return " ".join("".join(ch if ch.isdigit() else " " for ch in text).split())
+
+
+def symbols(text: str) -> str:
+    """查询中除文字、数字、空白以外的字符；"C++"与"C#"、"$100"与"100"只差符号，也不是同一个问题。"""
+    return "".join(ch for ch in text if not ch.isalnum() and not ch.isspace())
+
+
+def same_literals(a: str, b: str) -> bool:
+    """两个归一化查询中的数字与符号是否完全一致，是判定为同一个问题的前提。"""
+    return digits(a) == digits(b) and symbols(a) == symbols(b)
+
+
+def jaccard(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class NearDuplicateCache:
+    """
+    搜索结果的近似重复查询缓存。
+
+    查询先做归一化(去掉两端的空白、句读、客套用语和语气词)，归一化后完全相同直接命中。
+    近似匹配需要显式开启(threshold < 1.0): 用字符 n-gram 的 MinHash 签名做局部敏感哈希(LSH)分桶，
+    只与同桶的候选计算 Jaccard 相似度，相似度不低于 threshold 的最相近条目视为同一个问题的改写。
+    无论精确还是近似命中，数字与符号都必须完全一致。
+    字面相近的查询可能是完全不同的问题(例如"华为最新手机"与"华为最新手表"的 2-gram 相似度为 0.67)，
+    因此默认只做精确匹配；开启时建议 threshold 不低于 0.85。
+    条目保存在本地 SQLite 文件中，超过 ttl 过期，条目数或总字节数超限时按最近最少使用(LRU)淘汰。
+    """
+
+    def __init__(self, path: str = None, threshold: float = None, ngram: int = 2, num_perm: int = 64,
+                 bands: int = 16, ttl: float = 24 * 3600, max_entries: int = 5000,
+                 max_bytes: int = 64 * 1024 * 1024):
+        """
+        参数:
+        - path (str): SQLite 文件路径，默认读取 SEARCH_CACHE_PATH 或 .search_cache.sqlite；":memory:" 仅在进程内有效。
+        - threshold (float): 判定为近似重复的最低 Jaccard 相似度，默认读取 SEARCH_CACHE_THRESHOLD 或 1.0，
+          即只做归一化后的精确匹配；小于 1.0 时开启近似匹配。
+        - ngram (int): 字符 n-gram 的长度，中文查询用 2 比较合适。
+        - num_perm (int): MinHash 签名长度，必须能被 bands 整除。
+        - bands (int): LSH 的分带数，越多召回越高、候选也越多。
+        - ttl (float): 条目有效期(秒)，搜索结果有时效性，默认一天；None 表示永不过期。
+        - max_entries / max_bytes (int): 条目数与结果总字节数上限。
+        """
+        if num_perm % bands:
+            raise ValueError("num_perm 必须能被 bands 整除")
+        self.path = path or os.getenv("SEARCH_CACHE_PATH", ".search_cache.sqlite")
+        self.threshold = threshold if threshold is not None else float(os.getenv("SEARCH_CACHE_THRESHOLD", 1.0))
+        self.ngram = ngram
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        rng = random.Random(1)  # 固定种子，保证签名在不同进程之间一致
+        self._perms = [(rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME)) for _ in range(num_perm)]
+        self.exact_hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, norm TEXT UNIQUE NOT NULL, query TEXT NOT NULL, "
+            "result TEXT NOT NULL, size INTEGER NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS buckets (bucket TEXT NOT NULL, entry_id INTEGER NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_buckets_bucket ON buckets (bucket)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_buckets_entry ON buckets (entry_id)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_accessed ON entries (accessed)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_created ON entries (created)")
+        self._conn.commit()
+
+    def _signature(self, grams: FrozenSet[str]) -> List[int]:
+        hashes = [int.from_bytes(hashlib.blake2b(gram.encode("utf-8"), digest_size=8).digest(), "big")
+                  for gram in grams] or [0]
+        return [min((a * h + b) % _MERSENNE_PRIME for h in hashes) for a, b in self._perms]
+
+    def _buckets(self, norm: str) -> List[str]:
+        signature = self._signature(char_ngrams(norm, self.ngram))
+        buckets = []
+        for band in range(self.bands):
+            rows = signature[band * self.rows:(band + 1) * self.rows]
+            digest = hashlib.blake2b(repr(rows).encode(), digest_size=8).hexdigest()
+            buckets.append(f"{band}:{digest}")
+        return buckets
+
+    def lookup(self, query: str) -> Optional[Tuple[str, str, float]]:
+        """
+        查找 query 或其近似改写的缓存结果，返回 (结果, 命中的原始查询, 相似度)，未命中返回 None。
+        """
+        norm = normalize_query(query)
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            row = self._conn.execute("SELECT id, query, result, norm FROM entries WHERE norm = ?", (norm,)).fetchone()
+            match = (row[:3], 1.0) if row and same_literals(row[3], norm) else None
+            if match is None and self.threshold < 1.0:
+                buckets = self._buckets(norm)
+                placeholders = ",".join("?" * len(buckets))
+                candidates = self._conn.execute(
+                    f"SELECT DISTINCT e.id, e.query, e.result, e.norm FROM buckets b JOIN entries e ON e.id = b.entry_id "
+                    f"WHERE b.bucket IN ({placeholders})", buckets,
+                ).fetchall()
+                grams = char_ngrams(norm, self.ngram)
+                scored = [(jaccard(grams, char_ngrams(candidate[3], self.ngram)), candidate[:3])
+                          for candidate in candidates if same_literals(candidate[3], norm)]
+                scored = [item for item in scored if item[0] >= self.threshold]
+                if scored:
+                    similarity, row = max(scored, key=lambda item: item[0])
+                    match = (row, similarity)
+            if match is None:
+                self.misses += 1
+                return None
+            (entry_id, cached_query, result), similarity = match
+            self._conn.execute("UPDATE entries SET accessed = ? WHERE id = ?", (now, entry_id))
+            self._conn.commit()
+            if similarity >= 1.0:
+                self.exact_hits += 1
+            else:
+                self.near_hits += 1
+            return result, cached_query, similarity
+
+    def get(self, query: str) -> Optional[str]:
+        """读取 query 或其近似改写的缓存结果，未命中返回 None。"""
+        match = self.lookup(query)
+        return match[0] if match else None
+
+    def put(self, query: str, result: str):
+        """写入一条搜索结果；归一化后相同的查询会覆盖旧条目。"""
+        norm = normalize_query(query)
+        buckets = self._buckets(norm)
+        now = time.time()
+        with self._lock:
+            old = self._conn.execute("SELECT id FROM entries WHERE norm = ?", (norm,)).fetchone()
+            if old:
+                self._delete([old[0]])
+            cursor = self._conn.execute(
+                "INSERT INTO entries (norm, query, result, size, created, accessed) VALUES (?, ?, ?, ?, ?, ?)",
+                (norm, query, result, len(result.encode("utf-8")), now, now),
+            )
+            self._conn.executemany("INSERT INTO buckets (bucket, entry_id) VALUES (?, ?)",
+                                   [(bucket, cursor.lastrowid) for bucket in buckets])
+            self._evict()
+            self._conn.commit()
+
+    def _delete(self, ids: List[int]):
+        self._conn.executemany("DELETE FROM buckets WHERE entry_id = ?", [(i,) for i in ids])
+        self._conn.executemany("DELETE FROM entries WHERE id = ?", [(i,) for i in ids])
+
+    def _expire(self, now: float):
+        if self.ttl is None:
+            return
+        expired = [row[0] for row in self._conn.execute("SELECT id FROM entries WHERE created < ?", (now - self.ttl,))]
+        if expired:
+            self._delete(expired)
+            self._conn.commit()
+
+    def _evict(self):
+        count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+        # 按最近访问时间从旧到新删除，直到同时满足条目数和字节数上限
+        doomed = []
+        for entry_id, size in self._conn.execute("SELECT id, size FROM entries ORDER BY accessed ASC"):
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            doomed.append(entry_id)
+            count -= 1
+            total -= size
+        self._delete(doomed)
+
+    def clear(self):
+        """清空缓存内容(统计计数不变)。"""
+        with self._lock:
+            self._conn.execute("DELETE FROM buckets")
+            self._conn.execute("DELETE FROM entries")
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, float]:
+        """返回精确命中、近似命中、未命中次数及各自占比，以及条目数和结果总字节数。"""
+        with self._lock:
+            entries, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        lookups = self.exact_hits + self.near_hits + self.misses
+        return {
+            "lookups": lookups,
+            "exact_hits": self.exact_hits,
+            "near_hits": self.near_hits,
+            "misses": self.misses,
+            "hit_rate": (self.exact_hits + self.near_hits) / lookups if lookups else 0.0,
+            "near_hit_rate": self.near_hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "bytes_on_disk": total,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_default_cache: Optional[NearDuplicateCache] = None
+_default_lock = threading.Lock()
+
+
+def get_search_cache() -> Optional[NearDuplicateCache]:
+    """
+    返回 search 工具使用的进程内共享缓存，第一次调用时创建。
+    缓存默认不启用: 只有设置了环境变量 SEARCH_CACHE_PATH(SQLite 文件路径，或 ":memory:")时才创建，
+    未设置或设为 "off" 时返回 None。调用方需要先加载 .env，其中的配置才会生效。
+    """
+    global _default_cache
+    path = os.getenv("SEARCH_CACHE_PATH")
+    if not path or path == "off":
+        return None
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = NearDuplicateCache(path)
+        return _default_cache
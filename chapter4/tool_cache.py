@@ -0,0 +1,117 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Optional
+
+
+class CachePolicy:
+    """
+    单个工具的缓存策略。
+
+    参数:
+    - ttl (float): 结果的有效期(秒)，None 表示永不过期。
+    - max_entries (int): 该工具最多缓存的结果条数，超出后按最近最少使用(LRU)淘汰。
+    - cacheable (bool): 为 False 时工具每次都真实执行(适用于有副作用或强时效的工具)。
+    - cache_if (Callable): 可选的判定函数，接收工具返回值，返回 False 时该结果不写入缓存(例如错误信息)。
+    """
+
+    def __init__(self, ttl: Optional[float] = 300, max_entries: int = 256, cacheable: bool = True,
+                 cache_if: Callable[[Any], bool] = None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.cacheable = cacheable
+        self.cache_if = cache_if
+
+
+class ToolCache:
+    """
+    按照 CachePolicy 为一个工具提供带 TTL 的记忆化与单飞(single-flight)去重:
+    相同参数的并发调用只会真正执行一次，其余调用等待并共享同一个结果。
+    """
+
+    def __init__(self, policy: CachePolicy):
+        self.policy = policy
+        self.hits = 0
+        self.misses = 0
+        self.deduped = 0
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()  # key -> (过期时间, 结果)
+        self._inflight: Dict[tuple, Future] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _make_key(args: tuple, kwargs: dict) -> tuple:
+        return args, tuple(sorted(kwargs.items()))
+
+    def call(self, func: Callable, *args, **kwargs):
+        """通过缓存调用 func，返回值与直接调用相同；func 抛出的异常会原样传给所有等待者。"""
+        if not self.policy.cacheable:
+            with self._lock:
+                self.misses += 1
+            return func(*args, **kwargs)
+
+        key = self._make_key(args, kwargs)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry[0] is None or entry[0] > now):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[key] = future
+                self.misses += 1
+            else:
+                self.deduped += 1
+
+        if not leader:
+            return future.result()
+
+        try:
+            result = func(*args, **kwargs)
+            # cache_if 也可能抛出异常，放在 try 中，保证等待者总能拿到结果或异常
+            should_cache = self.policy.cache_if is None or self.policy.cache_if(result)
+        except BaseException as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            if should_cache:
+                expires = None if self.policy.ttl is None else time.monotonic() + self.policy.ttl
+                self._entries[key] = (expires, result)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.policy.max_entries:
+                    self._entries.popitem(last=False)
+            self._inflight.pop(key, None)
+        future.set_result(result)
+        return result
+
+    def wrap(self, func: Callable) -> Callable:
+        """返回一个经过缓存的函数，调用方式与原函数一致。"""
+        def cached(*args, **kwargs):
+            return self.call(func, *args, **kwargs)
+        cached.__name__ = getattr(func, "__name__", "cached_tool")
+        cached.__doc__ = func.__doc__
+        return cached
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        """返回命中、未命中、单飞去重次数以及命中率(命中与去重都算作省下的真实调用)。"""
+        with self._lock:
+            calls = self.hits + self.misses + self.deduped
+            return {
+                "calls": calls,
+                "hits": self.hits,
+                "misses": self.misses,
+                "deduped": self.deduped,
+                "hit_rate": (self.hits + self.deduped) / calls if calls else 0.0,
+                "entries": len(self._entries),
+            }
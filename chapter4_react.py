@@ -1,49 +1,9 @@
-import os
-from typing import List, Dict
-
 from dotenv import load_dotenv
-from openai import OpenAI
-
-load_dotenv()
 
-#定义一个专属的LLM客户端类。这个类将封装所有与模型服务交互的细节，让我们的主逻辑可以更专注于智能体的构建。
-class HelloAgentsLLM:
-    def __init__(self, model:str = None,apiKey:str = None, baseUrl:str = None, timeout:int = None):
-        """
-        初始化客户端。优先使用传入参数，如果未提供，则从环境变量加载。
-        """
-        self.model = model or os.getenv("LLM_MODEL_ID")
-        self.apiKey = apiKey or os.getenv("LLM_API_KEY")
-        self.baseUrl = baseUrl or os.getenv("LLM_BASE_URL")
-        self.timeout = timeout or int(os.getenv("LLM_TIMEOUT")or 60)
+# HelloAgentsLLM 的实现统一放在 chapter4/LLM_client.py 中(含同步 think 与异步 athink/astream)，这里仅做导出
+from chapter4.LLM_client import HelloAgentsLLM
 
-        if not all([self.model, apiKey, baseUrl]):
-            raise ValueError("模型ID、API密钥和服务地址必须被提供或在.env文件中定义。")
-
-        self.client = OpenAI(api_key=apiKey, base_url=self.baseUrl, timeout=self.timeout)
-    def think(self, messages:List[Dict[str,str]], temperature: float = 0) -> str:
-        """
-        调用大语言模型进行思考，并返回其响应。
-        """
-        print(f"正在调用{self.model}模型...")
-        try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                temperature=temperature,
-                stream=True,
-            )
-            print("✅ 大语言模型响应成功:")
-            collected_content = []
-            for chunk in response:
-                content = chunk.choices[0].delta.content or ""
-                print(content, end="", flush=True)
-                collected_content.append(content)
-            print()  # 在流式输出结束后换行
-            return "".join(collected_content)
-        except Exception as e:
-            print(f"❌ 调用LLM API时发生错误: {e}")
-            return None
+load_dotenv()
 
 
 # --- 客户端使用示例 ---
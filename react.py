@@ -4,6 +4,7 @@ from dotenv import load_dotenv
 from pyexpat.errors import messages
 import tools
 from chapter4_react import HelloAgentsLLM
+from chapter4.React import ReActAgent as _Chapter4ReActAgent
 
 load_dotenv()
 # ReAct 提示词模板
@@ -26,12 +27,31 @@ Question: {question}
 History: {history}
 """
 
-class ReActAgent:
-    def __init__(self, llm_client: HelloAgentsLLM, tool_executor: tools.ToolExecutor,max_steps: int = 5):
-        self.llm_client = llm_client
-        self.tool_executor = tool_executor
-        self.max_steps = max_steps
-        self.history = []
+# 并行模式下追加在工具列表之后的说明
+PARALLEL_ACTIONS_HINT = """
+如果需要多个互不依赖的工具调用(例如同时搜索几个不同的问题)，可以在同一轮中输出多行 Action，每行一个 `{tool_name}[{tool_input}]`，它们会被并行执行:
+Action: tool_a[输入1]
+Action: tool_b[输入2]
+"""
+# function_calling 模式的系统提示: 工具通过 tools 参数以 JSON Schema 提供，不再需要文本格式约定
+FUNCTION_CALLING_PROMPT_TEMPLATE = """
+请注意，你是一个有能力调用外部工具的智能助手。
+需要工具时直接调用提供的函数；多个互不依赖的调用可以在同一轮中同时发出，它们会被并行执行。
+当你收集到足够的信息后，不要再调用函数，直接用文字给出最终答案。
+"""
+
+class ReActAgent(_Chapter4ReActAgent):
+    """
+    通用的 ReAct 智能体: 提示词与 Finish 的处理方式与 chapter4/React.py 中的数学助手不同，
+    提示词构造、函数调用模式、输出解析等其余部分都继承自它。
+    """
+    react_prompt = REACT_PROMPT_TEMPLATE
+    parallel_actions_hint = PARALLEL_ACTIONS_HINT
+    function_calling_prompt = FUNCTION_CALLING_PROMPT_TEMPLATE
+
+    def __init__(self, llm_client: HelloAgentsLLM, tool_executor: tools.ToolExecutor,max_steps: int = 5, **kwargs):
+        """参数与 chapter4.React.ReActAgent 相同(parallel_actions、prompt_mode、early_stop 等)，默认最多 5 步。"""
+        super().__init__(llm_client, tool_executor, max_steps=max_steps, **kwargs)
 
     def run(self, question: str):
         """
@@ -40,80 +60,87 @@ class ReActAgent:
         :return:
         """
         self.history = []#每次清空历史
+        self.prompt_stats = []
+        self.run_stats = {"mode": self.prompt_mode, "steps": 0, "tool_calls": 0, "parse_failures": 0}
+        if self.prompt_mode == "function_calling":
+            return self._run_function_calling(question)
         current_step = 0
+        tools_desc = self.tool_executor.getAvailableTools()
+        if self.parallel_actions:
+            tools_desc += "\n" + PARALLEL_ACTIONS_HINT
+        conversation = []
+        response_text = None
+        history_mark = 0
 
         while current_step < self.max_steps:
             current_step += 1
+            self.run_stats["steps"] = current_step
             print(f"---第{current_step}步---")
 
-            #1.格式化提示词
-            tools_desc = self.tool_executor.getAvailableTools()
-            history_str = "\n".join(self.history)
-            prompt = REACT_PROMPT_TEMPLATE.format(
-                tools=tools_desc,
-                tool_input=question,
-                history=history_str
-            )
+            #1.格式化提示词(messages 模式下只追加上一步新产生的内容)
+            messages = self._build_messages(question, tools_desc, conversation, response_text, self.history[history_mark:])
+            history_mark = len(self.history)
+            self._record_prompt_size(current_step, messages)
 
             # 2. 调用LLM进行思考
-            messages = [{"role": "user", "content": prompt}]
-            response_text = self.llm_client.think(messages=messages)
+            response_text = self._think(messages)
             if not response_text:
                 print("错误：LLM未能返回有效相应")
                 break
-            thought, action = self._parse_action(response_text)
+            thought, action = self._parse_output(response_text)
             if thought:
                 print(f"思考: {thought}")
             if not action:
+                self.run_stats["parse_failures"] += 1
                 print("警告:未能解析出有效的Action，流程终止。")
                 break
             #4.执行Action
             if action.startswith("Finish"):
-                final_answer = re.match(r"Finish\[(.*)\]", action).group(1)
+                # 右括号缺失(例如输出被截断)时仍取出括号后的内容；连左括号都没有时按格式错误处理，让模型重新给出
+                match = re.match(r"Finish\[(.*?)\]?\s*$", action, re.DOTALL)
+                if match is None:
+                    self.run_stats["parse_failures"] += 1
+                    print("警告:Finish 的格式无效，要求模型重新给出。")
+                    self.history.append(f"Action: {action}")
+                    self.history.append("Observation: Finish 的格式无效，请使用 Finish[最终答案]。")
+                    continue
+                final_answer = match.group(1)
                 print(f"最终答案：{final_answer}")
                 return final_answer
-            tool_name, tool_input = self._parse_action(action)
-            if not tool_name or not tool_input:
-                # ... 处理无效Action格式 ...
-                continue
-            print(f"🎬 行动: {tool_name}[{tool_input}]")
-
-            tool_function = self.tool_executor.get_tool(tool_name)
-            if not tool_function:
-                observation = f"错误:未找到名为 '{tool_name}' 的工具。"
-            else:
-                observation = tool_function(tool_input)  # 调用真实工具
-            print(f"👀 观察: {observation}")
-
-            # 将本轮的Action和Observation添加到历史记录中
-            self.history.append(f"Action: {action}")
-            self.history.append(f"Observation: {observation}")
+
+            # 并行模式下收集本轮所有工具调用；与工具调用同时出现的 Finish 留到拿到观察结果之后再决定
+            actions = self._parse_actions(response_text) if self.parallel_actions else [action]
+            calls = []
+            for act in actions:
+                if act.startswith("Finish"):
+                    continue
+                tool_name, tool_input = self._parse_action(act)
+                if not tool_name or not tool_input:
+                    # ... 处理无效Action格式 ...
+                    self.run_stats["parse_failures"] += 1
+                    continue
+                print(f"🎬 行动: {tool_name}[{tool_input}]")
+                calls.append((act, tool_name, tool_input))
+
+            self.run_stats["tool_calls"] += len(calls)
+            observations = self.tool_executor.execute_parallel(
+                [(tool_name, tool_input) for _, tool_name, tool_input in calls],
+                max_workers=self.max_parallel_actions,
+            )
+            # 将本轮所有的Action和Observation添加到历史记录中
+            for (act, _, _), observation in zip(calls, observations):
+                print(f"👀 观察: {observation}")
+                self.history.append(f"Action: {act}")
+                self.history.append(f"Observation: {observation}")
 
         print("已达到最大步数，流程终止。")
         return None
 
-
-    #LLM 返回的是纯文本，我们需要从中精确地提取出Thought和Action。这是通过几个辅助解析函数完成的，它们通常使用正则表达式来实现。
-    def _parse_output(self, text: str):
-        """解析LLM的输出，提取Thought和Action。"""
-        thought_match = re.search(r"Thought: (.*)", text)
-        action_match = re.search(r"Action: (.*)", text)
-        thought = thought_match.group(1).strip() if thought_match else None
-        action = action_match.group(1).strip() if action_match else None
-        return thought, action
-
-    def _parse_action(self, action_text: str):
-        """解析Action字符串，提取工具名称和输入。"""
-        match = re.match(r"(\w+)\[(.*)\]", action_text)
-        if match:
-            return match.group(1), match.group(2)
-        return None, None
-
 if __name__ == '__main__':
     llm = HelloAgentsLLM()
     tool_executor = tools.ToolExecutor()
     search_desc = "一个网页搜索引擎。当你需要回答关于时事、事实以及在你的知识库中找不到的信息时，应使用此工具。"
-    tool_executor.register_tool("Search", search_desc, tools.search)
+    tool_executor.register_tool("Search", search_desc, tools.search, tools.CachePolicy(ttl=600, cache_if=lambda r: "错误" not in r))
     agent = ReActAgent(llm_client=llm, tool_executor=tool_executor)
     question = "华为最新的手机是哪一款？它的主要卖点是什么？"
     agent.run(question)